@@ -1,5 +1,7 @@
 #!/bin/bash
 
+# Usage: import-crits-campaigns-DEV.sh campaigns.json [--resume] [--batch-size N]
+
 # Error if the campaigns.json path does not exist
 if [[ ! -f "$1" ]]
 then
@@ -19,7 +21,7 @@ fi
 cp "$1" "$import_dir/campaigns.json"
 
 docker-compose -f docker-compose-DEV.yml build
-docker-compose -f docker-compose-DEV.yml run web-dev pypy3 manage.py import-crits-campaigns
+docker-compose -f docker-compose-DEV.yml run web-dev pypy3 manage.py import-crits-campaigns "${@:2}"
 
 # Delete the campaigns.json file from the container.
 rm "$import_dir/campaigns.json"
\ No newline at end of file
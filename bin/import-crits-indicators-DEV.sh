@@ -1,5 +1,7 @@
 #!/bin/bash
 
+# Usage: import-crits-indicators-DEV.sh indicators.json [--resume] [--workers N] [--batch-size N]
+
 # Error if the indicators.json path does not exist
 if [[ ! -f "$1" ]]
 then
@@ -19,7 +21,7 @@ fi
 cp "$1" "$import_dir/indicators.json"
 
 docker-compose -f docker-compose-DEV.yml build
-docker-compose -f docker-compose-DEV.yml run web-dev pypy3 manage.py import-crits-indicators
+docker-compose -f docker-compose-DEV.yml run web-dev pypy3 manage.py import-crits-indicators "${@:2}"
 
 # Delete the indicators.json file from the container.
 rm "$import_dir/indicators.json"
\ No newline at end of file
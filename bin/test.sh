@@ -8,5 +8,5 @@ until $(curl --silent --head --insecure --request GET https://localhost:4444 | g
     sleep 1
 done
 
-docker-compose -f docker-compose-TEST.yml run web-test pytest
+docker-compose -f docker-compose-TEST.yml run -e ENFORCE_QUERY_BUDGETS web-test pytest
 docker-compose -f docker-compose-TEST.yml down
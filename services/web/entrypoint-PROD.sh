@@ -5,4 +5,9 @@ while ! mysqladmin ping -h"db" -P"3306" --silent; do
     sleep 1
 done
 
-exec gunicorn -b 0.0.0.0:5000 manage:app
+# Each gunicorn worker writes its metrics here so /metrics can aggregate them. Start with a clean directory.
+export prometheus_multiproc_dir=${prometheus_multiproc_dir:-/tmp/sip-metrics}
+rm -rf "$prometheus_multiproc_dir"
+mkdir -p "$prometheus_multiproc_dir"
+
+exec gunicorn -c gunicorn.conf.py manage:app
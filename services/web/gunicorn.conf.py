@@ -0,0 +1,60 @@
+import multiprocessing
+import os
+
+"""
+GUNICORN SETTINGS
+
+Every setting can be overridden with a GUNICORN_* environment variable (ex: in docker-PROD.env).
+
+The default gthread worker lets each process keep serving while one of its threads is busy with a
+slow bulk export. The gevent worker class is also supported (pip install gevent), since pymysql
+is pure Python and cooperates with gevent's monkey patching.
+"""
+
+
+def _env(name, default):
+    return os.environ.get('GUNICORN_{}'.format(name), default)
+
+
+bind = _env('BIND', '0.0.0.0:5000')
+
+# Workers
+workers = int(_env('WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = _env('WORKER_CLASS', 'gthread')
+threads = int(_env('THREADS', 4))
+worker_connections = int(_env('WORKER_CONNECTIONS', 100))
+
+# Load the app in the master so the workers share its memory copy-on-write.
+preload_app = _env('PRELOAD', 'true').lower() == 'true'
+
+# Restart the workers now and then to limit memory growth, staggered so they do not all restart at once.
+max_requests = int(_env('MAX_REQUESTS', 1000))
+max_requests_jitter = int(_env('MAX_REQUESTS_JITTER', 100))
+
+# Bulk exports can take minutes, so the worker timeout has to be generous.
+timeout = int(_env('TIMEOUT', 300))
+graceful_timeout = int(_env('GRACEFUL_TIMEOUT', 60))
+keepalive = int(_env('KEEPALIVE', 5))
+
+accesslog = _env('ACCESSLOG', None)
+errorlog = _env('ERRORLOG', '-')
+loglevel = _env('LOGLEVEL', 'info')
+
+
+def post_fork(server, worker):
+    """ Database connections opened in the master while preloading must not be shared by the workers. """
+
+    from manage import app
+    from project import db
+
+    with app.app_context():
+        for bind in [None] + list(app.config.get('SQLALCHEMY_BINDS') or ()):
+            db.get_engine(app, bind=bind).dispose()
+
+
+def child_exit(server, worker):
+    """ Clean up the exited worker's metrics files so its gauges are not reported forever. """
+
+    if 'prometheus_multiproc_dir' in os.environ:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,37 @@
+"""Add the import checkpoint table
+
+Revision ID: 3e9b7d2c5f18
+Revises: f5a1b9c3e7d2
+Create Date: 2026-10-19 18:41:27.318046
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e9b7d2c5f18'
+down_revision = 'f5a1b9c3e7d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('import_checkpoint',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_time', sa.DateTime(), nullable=True),
+    sa.Column('duplicates', sa.Integer(), nullable=False),
+    sa.Column('failed', sa.Integer(), nullable=False),
+    sa.Column('imported', sa.Integer(), nullable=False),
+    sa.Column('merged', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('position', sa.BigInteger(), nullable=False),
+    sa.Column('read', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_import_checkpoint_name_position', 'import_checkpoint', ['name', 'position'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_import_checkpoint_name_position', table_name='import_checkpoint')
+    op.drop_table('import_checkpoint')
@@ -0,0 +1,28 @@
+"""Add covering indexes for the tag and intel source indicator filters
+
+Revision ID: 5b2e9a7c14d3
+Revises: fc9854dd0bc0
+Create Date: 2026-10-19 09:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b2e9a7c14d3'
+down_revision = 'fc9854dd0bc0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_indicator_tag_mapping_tag_id_indicator_id', 'indicator_tag_mapping', ['tag_id', 'indicator_id'], unique=False)
+    op.create_index('ix_indicator_reference_mapping_intel_reference_id_indicator_id', 'indicator_reference_mapping', ['intel_reference_id', 'indicator_id'], unique=False)
+    op.create_index('ix_intel_reference_intel_source_id_id', 'intel_reference', ['intel_source_id', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_intel_reference_intel_source_id_id', table_name='intel_reference')
+    op.drop_index('ix_indicator_reference_mapping_intel_reference_id_indicator_id', table_name='indicator_reference_mapping')
+    op.drop_index('ix_indicator_tag_mapping_tag_id_indicator_id', table_name='indicator_tag_mapping')
@@ -0,0 +1,51 @@
+"""Add the indicator value hash
+
+Revision ID: 7c2e5a9d4b16
+Revises: 3e9b7d2c5f18
+Create Date: 2026-10-19 21:12:40.584213
+
+"""
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2e5a9d4b16'
+down_revision = '3e9b7d2c5f18'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 10000
+
+
+def value_hash(value):
+    # Same as project.models.indicator_value_hash.
+    return hashlib.sha1(value.lower().encode('utf-8')).hexdigest()
+
+
+def upgrade():
+    op.add_column('indicator', sa.Column('value_hash', sa.String(length=40), nullable=True))
+
+    # Fill in the hashes of the existing indicators one primary key range at a time.
+    indicator = sa.table('indicator', sa.column('id', sa.Integer), sa.column('value', sa.UnicodeText),
+                         sa.column('value_hash', sa.String))
+    update = indicator.update().where(indicator.c.id == sa.bindparam('_id')).values(value_hash=sa.bindparam('_hash'))
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        rows = connection.execute(sa.select([indicator.c.id, indicator.c.value]).where(indicator.c.id > last_id)
+                                  .order_by(indicator.c.id).limit(BATCH_SIZE)).fetchall()
+        if not rows:
+            break
+        connection.execute(update, [{'_id': _id, '_hash': value_hash(value)} for _id, value in rows])
+        last_id = rows[-1][0]
+
+    op.alter_column('indicator', 'value_hash', existing_type=sa.String(length=40), nullable=False)
+    op.create_index('ix_indicator_type_id_value_hash', 'indicator', ['type_id', 'value_hash'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_indicator_type_id_value_hash', table_name='indicator')
+    op.drop_column('indicator', 'value_hash')
@@ -0,0 +1,45 @@
+"""Add the indicator facet counts table
+
+Revision ID: 8d41f6b0e2a9
+Revises: 5b2e9a7c14d3
+Create Date: 2026-10-19 10:03:17.552910
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d41f6b0e2a9'
+down_revision = '5b2e9a7c14d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('indicator_facet_count',
+    sa.Column('facet', sa.String(length=32), nullable=False),
+    sa.Column('value_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('facet', 'value_id')
+    )
+
+    # Seed the counts from any existing indicators.
+    op.execute("""
+        INSERT INTO indicator_facet_count (facet, value_id, count)
+        SELECT 'status', status_id, COUNT(*) FROM indicator GROUP BY status_id
+        UNION ALL
+        SELECT 'type', type_id, COUNT(*) FROM indicator GROUP BY type_id
+        UNION ALL
+        SELECT 'campaign', campaign_id, COUNT(DISTINCT indicator_id) FROM indicator_campaign_mapping GROUP BY campaign_id
+        UNION ALL
+        SELECT 'tag', tag_id, COUNT(DISTINCT indicator_id) FROM indicator_tag_mapping GROUP BY tag_id
+        UNION ALL
+        SELECT 'source', r.intel_source_id, COUNT(DISTINCT m.indicator_id)
+        FROM indicator_reference_mapping m JOIN intel_reference r ON r.id = m.intel_reference_id
+        GROUP BY r.intel_source_id
+    """)
+
+
+def downgrade():
+    op.drop_table('indicator_facet_count')
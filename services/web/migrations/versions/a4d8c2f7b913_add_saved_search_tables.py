@@ -0,0 +1,40 @@
+"""Add the saved search and saved search result tables
+
+Revision ID: a4d8c2f7b913
+Revises: e1f08b6c3a57
+Create Date: 2026-10-19 13:05:41.218336
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d8c2f7b913'
+down_revision = 'e1f08b6c3a57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('saved_search',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_time', sa.DateTime(), nullable=True),
+    sa.Column('filters', sa.Text(), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('refreshed_time', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('saved_search_result_mapping',
+    sa.Column('saved_search_id', sa.Integer(), nullable=False),
+    sa.Column('indicator_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['indicator_id'], ['indicator.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['saved_search_id'], ['saved_search.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('saved_search_id', 'indicator_id')
+    )
+
+
+def downgrade():
+    op.drop_table('saved_search_result_mapping')
+    op.drop_table('saved_search')
@@ -0,0 +1,28 @@
+"""Add the table version table
+
+Revision ID: b6e3f1a8d024
+Revises: a4d8c2f7b913
+Create Date: 2026-10-19 14:22:09.604187
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e3f1a8d024'
+down_revision = 'a4d8c2f7b913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('table_version',
+    sa.Column('table_name', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+
+
+def downgrade():
+    op.drop_table('table_version')
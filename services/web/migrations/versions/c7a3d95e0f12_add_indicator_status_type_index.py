@@ -0,0 +1,24 @@
+"""Add a composite index for the indicator status and type filters
+
+Revision ID: c7a3d95e0f12
+Revises: 8d41f6b0e2a9
+Create Date: 2026-10-19 10:48:55.104736
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7a3d95e0f12'
+down_revision = '8d41f6b0e2a9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_indicator_status_id_type_id_id', 'indicator', ['status_id', 'type_id', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_indicator_status_id_type_id_id', table_name='indicator')
@@ -0,0 +1,24 @@
+"""Add a covering index for the campaign indicator listings and counts
+
+Revision ID: d2c7e4a91b35
+Revises: b6e3f1a8d024
+Create Date: 2026-10-19 15:37:22.481920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2c7e4a91b35'
+down_revision = 'b6e3f1a8d024'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_indicator_campaign_mapping_campaign_id_indicator_id', 'indicator_campaign_mapping', ['campaign_id', 'indicator_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_indicator_campaign_mapping_campaign_id_indicator_id', table_name='indicator_campaign_mapping')
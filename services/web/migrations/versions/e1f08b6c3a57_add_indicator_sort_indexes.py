@@ -0,0 +1,26 @@
+"""Add indexes for the indicator sort orders
+
+Revision ID: e1f08b6c3a57
+Revises: c7a3d95e0f12
+Create Date: 2026-10-19 11:37:02.660418
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1f08b6c3a57'
+down_revision = 'c7a3d95e0f12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_indicator_created_time_id', 'indicator', ['created_time', 'id'], unique=False)
+    op.create_index('ix_indicator_modified_time_id', 'indicator', ['modified_time', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_indicator_modified_time_id', table_name='indicator')
+    op.drop_index('ix_indicator_created_time_id', table_name='indicator')
@@ -0,0 +1,26 @@
+"""Add the intel reference created time and user index
+
+Revision ID: f5a1b9c3e7d2
+Revises: d2c7e4a91b35
+Create Date: 2026-10-19 16:04:53.712384
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f5a1b9c3e7d2'
+down_revision = 'd2c7e4a91b35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('intel_reference', sa.Column('created_time', sa.DateTime(), nullable=True))
+    op.create_index('ix_intel_reference_user_id_id', 'intel_reference', ['user_id', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_intel_reference_user_id_id', table_name='intel_reference')
+    op.drop_column('intel_reference', 'created_time')
@@ -3,15 +3,12 @@ from logging.handlers import TimedRotatingFileHandler
 import os
 
 from flask import Flask, url_for
-from flask_admin import Admin
-from flask_admin import helpers as admin_helpers
 from flask_migrate import Migrate
 from flask_security import Security, SQLAlchemyUserDatastore
-from flask_sqlalchemy import SQLAlchemy
+from werkzeug.middleware.proxy_fix import ProxyFix
 
-from project.forms import ExtendedLoginForm
+from project.database import SQLAlchemy
 
-admin = Admin(name='SIP', url='/SIP')
 db = SQLAlchemy()
 migrate = Migrate()
 security = Security()
@@ -64,6 +61,10 @@ def create_app():
     app_settings = os.getenv('APP_SETTINGS')
     app.config.from_object(app_settings)
 
+    # Use the client's address from X-Forwarded-For instead of nginx's (the rate limits key on it).
+    if app.config.get('PROXY_FIX_X_FOR'):
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+
     # Start logging
     if not os.path.exists('logs'):
         os.mkdir('logs')
@@ -80,39 +81,69 @@ def create_app():
     # Flask-Migrate
     migrate.init_app(app, db)
 
-    # Flask-Security
-    user_datastore = SQLAlchemyUserDatastore(db, models.User, models.Role)
-    security_ctx = security.init_app(app, datastore=user_datastore, login_form=ExtendedLoginForm)
-
-    # Flask-Admin
-    admin.init_app(app)
+    # APP_MODE selects which parts of SIP this process serves:
+    #     api: Only the API. The GUI, Flask-Admin views and docs are never imported.
+    #     gui: Only the GUI/Admin pages and the docs.
+    #     all: Everything (default).
+    app_mode = app.config.get('APP_MODE', 'all')
+    if app_mode not in ('api', 'gui', 'all'):
+        raise ValueError('Invalid APP_MODE: {}'.format(app_mode))
 
-    # GUI/Admin Blueprint
-    from project.gui import bp as gui_bp
-    app.register_blueprint(gui_bp)
-
-    # API Blueprint
-    from project.api import bp as api_bp
-    app.register_blueprint(api_bp)
-
-    # Docs Blueprint
-    from project.docs import bp as docs_bp
-    app.register_blueprint(docs_bp)
+    # Flask-Security (the API still needs it to hash passwords, but not its login views)
+    user_datastore = SQLAlchemyUserDatastore(db, models.User, models.Role)
+    if app_mode == 'api':
+        security.init_app(app, datastore=user_datastore, register_blueprint=False)
+    else:
+        from project.forms import ExtendedLoginForm
+        security_ctx = security.init_app(app, datastore=user_datastore, login_form=ExtendedLoginForm)
+
+    if app_mode in ('gui', 'all'):
+
+        # GUI/Admin Blueprint
+        from project.gui import admin, bp as gui_bp
+        admin.init_app(app)
+        app.register_blueprint(gui_bp)
+
+        # Docs Blueprint
+        from project.docs import bp as docs_bp
+        app.register_blueprint(docs_bp)
+
+        # Inject Flask-Security into Flask-Admin so things like current_user and roles
+        # work inside the custom view models.
+        from flask_admin import helpers as admin_helpers
+
+        @security_ctx.context_processor
+        def security_context_processor():
+            return dict(
+                admin_base_template=admin.base_template,
+                admin_view=admin.index_view,
+                h=admin_helpers,
+                get_url=url_for
+                )
+
+    if app_mode in ('api', 'all'):
+
+        # API Blueprint
+        from project.api import bp as api_bp
+        app.register_blueprint(api_bp)
+
+    # Metrics Blueprint
+    # The after_request functions run in the reverse order they were added, so registering the metrics before the
+    # compression makes them record the compressed response size.
+    from project.metrics import bp as metrics_bp
+    app.register_blueprint(metrics_bp)
+
+    # Response compression
+    from project.compression import init_compression
+    init_compression(app)
 
     # Errors Blueprint
     from project.errors import bp as errors_bp
     app.register_blueprint(errors_bp)
 
-    # Inject Flask-Security into Flask-Admin so things like current_user and roles
-    # work inside the custom view models.
-    @security_ctx.context_processor
-    def security_context_processor():
-        return dict(
-            admin_base_template=admin.base_template,
-            admin_view=admin.index_view,
-            h=admin_helpers,
-            get_url=url_for
-            )
+    # "flask import" commands
+    from project.importers.commands import init_import_commands
+    init_import_commands(app)
 
     @app.shell_context_processor
     def ctx():
@@ -18,6 +18,8 @@ from project.api.routes import intel_source
 
 from project.api.routes import role
 
+from project.api.routes import saved_search
+
 from project.api.routes import tag
 
 from project.api.routes import user
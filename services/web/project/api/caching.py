@@ -0,0 +1,93 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request
+
+from project.models import TableVersion, VERSIONED_TABLES
+
+"""
+TABLE CACHE
+
+The reference data listings (tags, campaigns, indicator types, etc.) rarely change but are read by
+every client at startup and before every create. Each of these routes declares the tables its body
+depends on. A request then only costs one query for those tables' versions:
+
+ - The ETag is derived from the versions and the full request path, so a client that sends a
+   matching If-None-Match gets a 304 without anything being serialized.
+
+ - Otherwise the body rendered for the same path and versions is served from this worker's cache.
+
+Because the versions are bumped in the same transaction as the writes, a cached body can never be
+served for data that has since changed.
+"""
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def clear_table_cache():
+    """ Clears this worker's cache of rendered responses. """
+
+    with _cache_lock:
+        _cache.clear()
+
+
+def _get(key):
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    return None
+
+
+def _put(key, value):
+    with _cache_lock:
+        _cache[key] = value
+        _cache.move_to_end(key)
+        while len(_cache) > current_app.config.get('TABLE_CACHE_SIZE', 256):
+            _cache.popitem(last=False)
+
+
+def table_cache(*tables):
+    """ Caches a GET route's response until one of the given tables is written to. """
+
+    # Writes only bump the versions of these tables, so caching anything else would serve stale responses.
+    unversioned = set(tables) - VERSIONED_TABLES
+    if unversioned:
+        raise ValueError('Tables missing from VERSIONED_TABLES: {}'.format(', '.join(sorted(unversioned))))
+
+    def decorator(function):
+
+        @wraps(function)
+        def decorated_function(*args, **kwargs):
+            versions = TableVersion.versions(tables)
+            key = (request.full_path, tuple(sorted(versions.items())))
+            etag = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+            cached = _get(key)
+
+            # The client already has this version.
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+
+            # Another request already rendered this version.
+            elif cached is not None:
+                response = current_app.response_class(cached, mimetype='application/json')
+
+            else:
+                response = current_app.make_response(function(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                _put(key, response.get_data())
+
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'private, max-age={}, must-revalidate'.format(
+                current_app.config.get('TABLE_CACHE_MAX_AGE', 0))
+            return response
+
+        return decorated_function
+
+    return decorator
@@ -1,39 +1,60 @@
-import gzip
+import math
 
-from flask import current_app, request, after_this_request
+from flask import current_app, request
 from functools import wraps
 from jsonschema import validate
 from jsonschema.exceptions import SchemaError, ValidationError
 from werkzeug.exceptions import BadRequest
 
-from project import db
-from project.api.errors import error_response
-from project.models import User
+from project.database import use_replica
+from project.api import ratelimit
+from project.apikeys import lookup_apikey
+from project.helpers import error_response, get_apikey
 
 
-def gzipped_response(function):
-    """ Returns a gzipped version of the response JSON. """
+def _authorization_error(required_role, apikey):
+    """ Returns an error response unless the API key belongs to an active user with the required role. """
 
-    @wraps(function)
-    def decorated_function(*args, **kwargs):
-        @after_this_request
-        def zipper(response):
-            response.direct_passthrough = False
+    # If there is an API key, look it up and get the user's roles.
+    if apikey:
+        user = lookup_apikey(apikey)
 
-            if response.status_code < 200 or response.status_code >= 300 or 'Content-Encoding' in response.headers:
-                return response
+        # If the user exists and they have the required role, there is no error.
+        if user:
+            active, roles = user
+            if active:
+                if required_role in roles:
+                    return None
+                else:
+                    return error_response(401, 'Insufficient privileges')
+            else:
+                return error_response(401, 'API user is not active')
+        else:
+            return error_response(401, 'API user does not exist')
+    else:
+        return error_response(401, 'Bad or missing API key')
 
-            compressed = gzip.compress(response.data)
 
-            response.data = compressed
-            response.headers['Content-Encoding'] = 'gzip'
-            response.headers['Content-Length'] = len(response.data)
+def _call_limited(apikey, function, *args, **kwargs):
+    """ Runs the function unless the caller is over their rate or concurrency limit for this endpoint. """
 
-            return response
+    retry_after, release = ratelimit.limit(apikey)
+    if retry_after:
+        response = error_response(429, 'Rate limit exceeded')
+        response.headers['Retry-After'] = str(int(math.ceil(retry_after)))
+        return response
 
+    if not release:
         return function(*args, **kwargs)
 
-    return decorated_function
+    # Hold the concurrency slot until the response is closed so that streamed responses count too.
+    try:
+        response = current_app.make_response(function(*args, **kwargs))
+    except Exception:
+        release()
+        raise
+    response.call_on_close(release)
+    return response
 
 
 def check_apikey(function):
@@ -50,36 +71,20 @@ def check_apikey(function):
         # Get the role of the function name in the config.
         required_role = current_app.config[request.method]
 
-        # If the role is None/False/etc, just return the function.
-        if not required_role:
-            return function(*args, **kwargs)
+        # Read-only requests can be served by the read replica.
+        if request.method == 'GET':
+            use_replica()
 
         # Get the API key if there is one.
-        # The header should look like:
-        #     Authorization: Apikey blah-blah-blah
-        # So strip off the first 7 characters to get the actual key.
-        authorization = request.headers.get('Authorization')
-        apikey = None
-        if authorization and 'apikey' in authorization.lower():
-            apikey = authorization[7:]
-
-        # If there is an API key, look it up and get the user's roles.
-        if apikey:
-            user = db.session.query(User).filter_by(apikey=apikey).first()
-
-            # If the user exists and they have the required role, return the function.
-            if user:
-                if user.active:
-                    if any(role.name.lower() == required_role for role in user.roles):
-                        return function(*args, **kwargs)
-                    else:
-                        return error_response(401, 'Insufficient privileges')
-                else:
-                    return error_response(401, 'API user is not active')
-            else:
-                return error_response(401, 'API user does not exist')
-        else:
-            return error_response(401, 'Bad or missing API key')
+        apikey = get_apikey(request)
+
+        # If the role is None/False/etc, there is nothing to authorize.
+        if required_role:
+            error = _authorization_error(required_role, apikey)
+            if error:
+                return error
+
+        return _call_limited(apikey, function, *args, **kwargs)
 
     return decorated_function
 
@@ -89,36 +94,13 @@ def verify_admin(function):
 
     @wraps(function)
     def decorated_function(*args, **kwargs):
+        apikey = get_apikey(request)
 
-        # Get the role of the function name in the config.
-        required_role = 'admin'
+        error = _authorization_error('admin', apikey)
+        if error:
+            return error
 
-        # Get the API key if there is one.
-        # The header should look like:
-        #     Authorization: Apikey blah-blah-blah
-        # So strip off the first 7 characters to get the actual key.
-        authorization = request.headers.get('Authorization')
-        apikey = None
-        if authorization and 'apikey' in authorization.lower():
-            apikey = authorization[7:]
-
-        # If there is an API key, look it up and get the user's roles.
-        if apikey:
-            user = db.session.query(User).filter_by(apikey=apikey).first()
-
-            # If the user exists and they have the required role, return the function.
-            if user:
-                if user.active:
-                    if any(role.name.lower() == required_role for role in user.roles):
-                        return function(*args, **kwargs)
-                    else:
-                        return error_response(401, 'Insufficient privileges')
-                else:
-                    return error_response(401, 'API user is not active')
-            else:
-                return error_response(401, 'API user does not exist')
-        else:
-            return error_response(401, 'Bad or missing API key')
+        return _call_limited(apikey, function, *args, **kwargs)
 
     return decorated_function
 
@@ -0,0 +1,199 @@
+import threading
+import time
+
+from flask import current_app, request
+
+from project.helpers import parse_boolean
+
+"""
+RATE LIMITING
+
+Every API call made through check_apikey is charged against a token bucket and a concurrent
+request counter keyed by the caller (API key, or the remote address if there is no key) and the
+endpoint. The remote address is the client's, not nginx's, because create_app() wraps the app in
+ProxyFix to read X-Forwarded-For (see PROXY_FIX_X_FOR). Calls made with bulk=true or stream=true are limited separately from the regular calls
+to the same endpoint since they hold a worker for much longer.
+
+The limits are read from the RATELIMIT_RATES and RATELIMIT_CONCURRENCY config dictionaries. The
+counters live in-process by default, which means each gunicorn worker enforces its own share of
+the limits. Set RATELIMIT_STORAGE_URL to a redis:// URL to share them between workers and hosts.
+"""
+
+
+class MemoryBackend(object):
+    """ Keeps the token buckets and concurrent request counters in this process. """
+
+    # Seconds between sweeps of the buckets that have refilled. A full bucket is the same as no bucket, so
+    # evicting them keeps the memory bounded by the callers seen in the last few minutes.
+    SWEEP_INTERVAL = 60
+
+    def __init__(self):
+        self._buckets = {}
+        self._concurrent = {}
+        self._lock = threading.Lock()
+        self._swept = time.monotonic()
+
+    def take(self, key, rate, burst):
+        """ Takes a token from the bucket. Returns 0 if one was available, otherwise the seconds until there is. """
+
+        with self._lock:
+            now = time.monotonic()
+            self._sweep(now)
+
+            tokens, last, _ = self._buckets.get(key, (burst, now, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+
+            # Also remember when the bucket will be full again, after which it can be evicted.
+            self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            return wait
+
+    def _sweep(self, now):
+        """ Evicts the buckets that are full again. Must be called with the lock held. """
+
+        if now - self._swept < self.SWEEP_INTERVAL:
+            return
+
+        self._swept = now
+        for key in [key for key, bucket in self._buckets.items() if bucket[2] <= now]:
+            del self._buckets[key]
+
+    def acquire(self, key, limit):
+        """ Increments the concurrent request counter unless it is already at the limit. """
+
+        with self._lock:
+            count = self._concurrent.get(key, 0)
+            if count >= limit:
+                return False
+            self._concurrent[key] = count + 1
+            return True
+
+    def release(self, key):
+        """ Decrements the concurrent request counter. """
+
+        with self._lock:
+            count = self._concurrent.get(key, 0) - 1
+            if count > 0:
+                self._concurrent[key] = count
+            else:
+                self._concurrent.pop(key, None)
+
+
+class RedisBackend(object):
+    """ Keeps the token buckets and concurrent request counters in Redis so they are shared by every worker. """
+
+    # Refill the bucket based on the time since it was last touched, then try to take a token.
+    # Returns the number of milliseconds until a token is available (0 if one was taken).
+    TAKE_SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local burst = tonumber(ARGV[2])
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'last')
+    local tokens = tonumber(bucket[1]) or burst
+    local last = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + (now - last) * rate)
+
+    local wait = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        wait = math.ceil((1 - tokens) / rate * 1000)
+    end
+
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'last', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return wait
+    """
+
+    # Concurrent request counters expire in case a worker dies before it can release them.
+    CONCURRENT_EXPIRE = 3600
+
+    def __init__(self, url):
+
+        # Redis is an optional dependency that is only needed when this backend is configured.
+        import redis
+
+        self._redis = redis.StrictRedis.from_url(url)
+        self._take = self._redis.register_script(self.TAKE_SCRIPT)
+
+    def take(self, key, rate, burst):
+        return self._take(keys=['ratelimit:bucket:{}'.format(key)], args=[rate, burst]) / 1000.0
+
+    def acquire(self, key, limit):
+        key = 'ratelimit:concurrent:{}'.format(key)
+        pipe = self._redis.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, self.CONCURRENT_EXPIRE)
+        count = pipe.execute()[0]
+        if count > limit:
+            self._redis.decr(key)
+            return False
+        return True
+
+    def release(self, key):
+        self._redis.decr('ratelimit:concurrent:{}'.format(key))
+
+
+def get_backend(app):
+    """ Returns the app's rate limit backend, creating it the first time it is needed. """
+
+    if 'ratelimit' not in app.extensions:
+        url = app.config.get('RATELIMIT_STORAGE_URL') or 'memory://'
+        if url.startswith('redis://') or url.startswith('rediss://'):
+            app.extensions['ratelimit'] = RedisBackend(url)
+        else:
+            app.extensions['ratelimit'] = MemoryBackend()
+    return app.extensions['ratelimit']
+
+
+def _endpoint():
+    """ Returns the name of the current endpoint, with :bulk appended for bulk and streamed requests. """
+
+    endpoint = request.endpoint or request.path
+    if any(parse_boolean(request.args.get(arg), default=False) for arg in ('bulk', 'stream')):
+        endpoint += ':bulk'
+    return endpoint
+
+
+def _rule(rules, endpoint):
+    """ Returns the endpoint's rule, falling back to the default rule. """
+
+    if endpoint in rules:
+        return rules[endpoint]
+    return rules.get('default')
+
+
+def limit(apikey):
+    """ Charges the current request against its caller's limits.
+
+    Returns a tuple of (retry_after, release). If retry_after is set, the request must be rejected.
+    Otherwise release is either None or a function that must be called once the request is finished. """
+
+    app = current_app._get_current_object()
+    if not app.config.get('RATELIMIT_ENABLED'):
+        return None, None
+
+    endpoint = _endpoint()
+    key = '{}:{}'.format(apikey or request.remote_addr, endpoint)
+    backend = get_backend(app)
+
+    rate = _rule(app.config.get('RATELIMIT_RATES', {}), endpoint)
+    if rate:
+        retry_after = backend.take(key, *rate)
+        if retry_after:
+            return retry_after, None
+
+    concurrency = _rule(app.config.get('RATELIMIT_CONCURRENCY', {}), endpoint)
+    if concurrency:
+        if not backend.acquire(key, concurrency):
+            return 1, None
+        return None, lambda: backend.release(key)
+
+    return None, None
@@ -1,12 +1,16 @@
 from flask import current_app, jsonify, request, url_for
 from sqlalchemy import exc
+from sqlalchemy.orm import selectinload
 
 from project import db
 from project.api import bp
+from project.api.caching import table_cache
 from project.api.decorators import check_apikey, validate_json, validate_schema
-from project.api.errors import error_response
 from project.api.schemas import campaign_create, campaign_update
-from project.models import Campaign, CampaignAlias
+from project.helpers import error_response, parse_boolean
+from project.models import Campaign, CampaignAlias, Indicator, indicator_campaign_association
+from project.queries import collection_filters, find_campaign, indicator_load_options, mapped_indicator_count, \
+    mapped_indicators_response
 
 """
 CREATE
@@ -142,10 +146,11 @@ def read_campaign(campaign_id):
 
 @bp.route('/campaigns', methods=['GET'])
 @check_apikey
+@table_cache('campaign', 'campaign_alias')
 def read_campaigns():
-    """ Gets a list of all the campaigns.
+    """ Gets a paginated list of all the campaigns.
     
-    .. :quickref: Campaign; Gets a list of all the campaigns.
+    .. :quickref: Campaign; Gets a paginated list of all the campaigns.
 
     **Example request**:
 
@@ -162,31 +167,212 @@ def read_campaigns():
       HTTP/1.1 200 OK
       Content-Type: application/json
 
-      [
-        {
-          "id": 1,
-          "aliases": ["icanhaz"],
-          "created_time": "Thu, 28 Feb 2019 17:10:44 GMT",
-          "modified_time": "Thu, 28 Feb 2019 17:10:44 GMT",
-          "name": "LOLcats"
+      {
+        "_links": {
+          "next": null,
+          "prev": null,
+          "self": "/api/campaigns?page=1&per_page=100&sort=id"
+        },
+        "_meta": {
+          "page": 1,
+          "per_page": 100,
+          "sort": "id",
+          "total_items": 2,
+          "total_pages": 1
         },
-        {
-          "id": 2,
-          "aliases": [],
-          "created_time": "Thu, 28 Feb 2019 17:11:37 GMT",
-          "modified_time": "Thu, 28 Feb 2019 17:11:37 GMT",
-          "name": "Derpsters"
-        }
-      ]
+        "items": [
+          {
+            "id": 1,
+            "aliases": ["icanhaz"],
+            "created_time": "Thu, 28 Feb 2019 17:10:44 GMT",
+            "modified_time": "Thu, 28 Feb 2019 17:10:44 GMT",
+            "name": "LOLcats"
+          },
+          {
+            "id": 2,
+            "aliases": [],
+            "created_time": "Thu, 28 Feb 2019 17:11:37 GMT",
+            "modified_time": "Thu, 28 Feb 2019 17:11:37 GMT",
+            "name": "Derpsters"
+          }
+        ]
+      }
 
     :reqheader Authorization: Optional Apikey value
+    :reqheader If-None-Match: Optional ETag of a previous response
     :resheader Content-Type: application/json
+    :query created_after: Parsable date or datetime in GMT. Ex: YYYY-MM-DD or YYYY-MM-DD HH:MM:SS
+    :query cursor: Cursor from a previous page's next_cursor (use an empty value for the first page)
+    :query legacy: true returns all of the matching campaigns as a plain list without pagination
+    :query name: Only return campaigns whose name starts with this
+    :query page: Page number to read when not using a cursor
+    :query per_page: Number of campaigns per page (maximum 1000)
+    :query sort: id, created_time, modified_time or name. Prefix with - to sort descending (defaults to id)
     :status 200: Campaigns found
+    :status 304: Not modified since the request's If-None-Match ETag
+    :status 400: Invalid cursor
+    :status 400: Invalid sort
+    :status 401: Invalid role to perform this action
+    """
+
+    filters = collection_filters(request.args, {'name': Campaign.name}, created_column=Campaign.created_time)
+    query = Campaign.query.options(selectinload(Campaign.aliases)).filter(*filters)
+
+    if parse_boolean(request.args.get('legacy'), default=False):
+        return jsonify([item.to_dict() for item in query])
+
+    try:
+        data = Campaign.to_collection_dict(query, 'api.read_campaigns', **request.args)
+    except ValueError as e:
+        return error_response(400, str(e))
+    return jsonify(data)
+
+
+@bp.route('/campaigns/<campaign_id>/indicators', methods=['GET'])
+@check_apikey
+def read_campaign_indicators(campaign_id):
+    """ Gets a paginated list of the indicators in the campaign.
+
+    .. :quickref: Indicator; Gets a paginated list of the indicators in the campaign.
+
+    The campaign can be given by its ID, name or any of its aliases.
+
+    *NOTE*: The bulk and stream modes read the indicators straight from the mapping table and only return the
+    requested fields (id, type and value by default). The stream mode returns one JSON object per line (NDJSON).
+
+    **Example request**:
+
+    .. sourcecode:: http
+
+      GET /campaigns/LOLcats/indicators?per_page=1 HTTP/1.1
+      Host: 127.0.0.1
+      Accept: application/json
+
+    **Example response**:
+
+    .. sourcecode:: http
+
+      HTTP/1.1 200 OK
+      Content-Type: application/json
+
+      {
+        "_links": {
+          "next": "/api/campaigns/1/indicators?page=2&per_page=1&sort=id",
+          "prev": null,
+          "self": "/api/campaigns/1/indicators?page=1&per_page=1&sort=id"
+        },
+        "_meta": {
+          "page": 1,
+          "per_page": 1,
+          "sort": "id",
+          "total_items": 2,
+          "total_pages": 2
+        },
+        "items": [
+          {
+            "all_children": [],
+            "all_equal": [],
+            "campaigns": [],
+            "case_sensitive": false,
+            "children": [],
+            "confidence": "LOW",
+            "created_time": "Fri, 01 Mar 2019 18:00:51 GMT",
+            "equal": [],
+            "id": 2,
+            "impact": "LOW",
+            "modified_time": "Fri, 01 Mar 2019 18:00:51 GMT",
+            "parent": null,
+            "references": [],
+            "status": "NEW",
+            "substring": false,
+            "tags": ["from_address", "phish"],
+            "type": "Email - Address",
+            "user": "your_SIP_username",
+            "value": "badguy@evil.com"
+          }
+        ]
+      }
+
+    :reqheader Authorization: Optional Apikey value
+    :resheader Content-Type: application/json or application/x-ndjson
+    :query bulk: True/False to receive all of the indicators as a single list of the requested fields
+    :query cursor: Cursor from a previous page's next_cursor (use an empty value for the first page)
+    :query fields: Comma-separated list of the fields to return in bulk and stream mode: case_sensitive, confidence, created_time, id, impact, modified_time, status, substring, type, user, value
+    :query page: Page number to read when not using a cursor
+    :query per_page: Number of indicators per page (maximum 1000)
+    :query sort: id, created_time or modified_time. Prefix with - to sort descending (defaults to id)
+    :query stream: True/False to stream all of the indicators as NDJSON, one object of the requested fields per line
+    :status 200: Indicators found
+    :status 400: Invalid cursor
+    :status 400: Invalid field
+    :status 400: Invalid sort
     :status 401: Invalid role to perform this action
+    :status 404: Campaign not found
     """
 
-    data = Campaign.query.all()
-    return jsonify([item.to_dict() for item in data])
+    campaign = find_campaign(campaign_id)
+    if not campaign:
+        return error_response(404, 'Campaign not found')
+
+    mapping_column = indicator_campaign_association.c.campaign_id
+
+    response = mapped_indicators_response(mapping_column, campaign.id)
+    if response is not None:
+        return response
+
+    # Inject the campaign_id parameter into the request arguments.
+    args = dict(request.args.copy())
+    args['campaign_id'] = campaign.id
+
+    try:
+        query = Indicator.query.options(*indicator_load_options()) \
+            .join(indicator_campaign_association, indicator_campaign_association.c.indicator_id == Indicator.id).filter(mapping_column == campaign.id)
+        data = Indicator.to_collection_dict(query, 'api.read_campaign_indicators', **args)
+    except ValueError as e:
+        return error_response(400, str(e))
+    return jsonify(data)
+
+
+@bp.route('/campaigns/<campaign_id>/indicators/count', methods=['GET'])
+@check_apikey
+def read_campaign_indicator_count(campaign_id):
+    """ Gets the number of indicators in the campaign.
+
+    .. :quickref: Indicator; Gets the number of indicators in the campaign.
+
+    **Example request**:
+
+    .. sourcecode:: http
+
+      GET /campaigns/LOLcats/indicators/count HTTP/1.1
+      Host: 127.0.0.1
+      Accept: application/json
+
+    **Example response**:
+
+    .. sourcecode:: http
+
+      HTTP/1.1 200 OK
+      Content-Type: application/json
+
+      {
+        "count": 2,
+        "id": 1
+      }
+
+    :reqheader Authorization: Optional Apikey value
+    :resheader Content-Type: application/json
+    :status 200: Indicators counted
+    :status 401: Invalid role to perform this action
+    :status 404: Campaign not found
+    """
+
+    campaign = find_campaign(campaign_id)
+    if not campaign:
+        return error_response(404, 'Campaign not found')
+
+    count = mapped_indicator_count(indicator_campaign_association.c.campaign_id, campaign.id)
+    return jsonify({'count': count, 'id': campaign.id})
 
 
 """
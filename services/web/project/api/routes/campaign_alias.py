@@ -1,12 +1,15 @@
 from flask import jsonify, request, url_for
 from sqlalchemy import exc
+from sqlalchemy.orm import joinedload
 
 from project import db
 from project.api import bp
+from project.api.caching import table_cache
 from project.api.decorators import check_apikey, validate_json, validate_schema
-from project.api.errors import error_response
 from project.api.schemas import campaign_alias_create, campaign_alias_update
+from project.helpers import error_response, parse_boolean
 from project.models import Campaign, CampaignAlias
+from project.queries import collection_filters
 
 """
 CREATE
@@ -134,10 +137,11 @@ def read_campaign_alias(campaign_alias_id):
 
 @bp.route('/campaigns/alias', methods=['GET'])
 @check_apikey
+@table_cache('campaign_alias', 'campaign')
 def read_campaign_aliases():
-    """ Gets a list of all the campaign aliases.
+    """ Gets a paginated list of all the campaign aliases.
     
-    .. :quickref: CampaignAlias; Gets a list of all the campaign aliases.
+    .. :quickref: CampaignAlias; Gets a paginated list of all the campaign aliases.
 
     **Example request**:
 
@@ -154,27 +158,60 @@ def read_campaign_aliases():
       HTTP/1.1 200 OK
       Content-Type: application/json
 
-      [
-        {
-          "id": 1,
-          "alias": "icanhaz",
-          "campaign": "LOLcats"
+      {
+        "_links": {
+          "next": null,
+          "prev": null,
+          "self": "/api/campaigns/alias?page=1&per_page=100&sort=id"
+        },
+        "_meta": {
+          "page": 1,
+          "per_page": 100,
+          "sort": "id",
+          "total_items": 2,
+          "total_pages": 1
         },
-        {
-          "id": 2,
-          "alias": "Dino",
-          "campaign": "Riders"
-        }
-      ]
+        "items": [
+          {
+            "id": 1,
+            "alias": "icanhaz",
+            "campaign": "LOLcats"
+          },
+          {
+            "id": 2,
+            "alias": "Dino",
+            "campaign": "Riders"
+          }
+        ]
+      }
 
     :reqheader Authorization: Optional Apikey value
+    :reqheader If-None-Match: Optional ETag of a previous response
     :resheader Content-Type: application/json
+    :query alias: Only return campaign aliases that start with this
+    :query cursor: Cursor from a previous page's next_cursor (use an empty value for the first page)
+    :query legacy: true returns all of the matching campaign aliases as a plain list without pagination
+    :query page: Page number to read when not using a cursor
+    :query per_page: Number of campaign aliases per page (maximum 1000)
+    :query sort: id or alias. Prefix with - to sort descending (defaults to id)
     :status 200: Campaign aliases found
+    :status 304: Not modified since the request's If-None-Match ETag
+    :status 400: Invalid cursor
+    :status 400: Invalid sort
     :status 401: Invalid role to perform this action
     """
 
-    data = CampaignAlias.query.all()
-    return jsonify([item.to_dict() for item in data])
+    filters = collection_filters(request.args, {'alias': CampaignAlias.alias})
+    query = CampaignAlias.query.options(joinedload(CampaignAlias.campaign)).filter(*filters)
+
+    if parse_boolean(request.args.get('legacy'), default=False):
+        return jsonify([item.to_dict() for item in query])
+
+    try:
+        data = CampaignAlias.to_collection_dict(query, 'api.read_campaign_aliases', **request.args)
+    except ValueError as e:
+        return error_response(400, str(e))
+    return jsonify(data)
 
 
 """
@@ -1,19 +1,17 @@
-import datetime
-import gzip
 import json
 
-from dateutil.parser import parse
 from flask import current_app, jsonify, request, Response, url_for
-from sqlalchemy import and_, exc, func
+from sqlalchemy import exc, func
 
 from project import db
 from project.api import bp
 from project.api.decorators import check_apikey, validate_json, validate_schema
-from project.api.errors import error_response
-from project.api.helpers import get_apikey, parse_boolean
 from project.api.schemas import indicator_create, indicator_update
-from project.models import Campaign, Indicator, IndicatorConfidence, IndicatorImpact, IndicatorStatus, IndicatorType, \
-    IntelReference, IntelSource, Tag, User
+from project.helpers import error_response, get_apikey, parse_boolean
+from project.models import Campaign, Indicator, IndicatorConfidence, IndicatorFacetCount, IndicatorImpact, \
+    IndicatorStatus, IndicatorType, IntelReference, IntelSource, Tag, User, indicator_value_hash
+from project.queries import FACETS, facet_counts, find_intel_reference, indicator_filters, indicator_load_options, \
+    refresh_saved_searches, split_arg
 
 """
 CREATE
@@ -175,13 +173,16 @@ def create_indicator():
     else:
         case_sensitive = False
 
-    # Verify this type+value does not already exist based off of case_sensitive.
+    # Verify this type+value does not already exist based off of case_sensitive. The value hash narrows the
+    # candidates down with an index.
+    candidates = Indicator.query.filter(Indicator.type == indicator_type,
+                                        Indicator.value_hash == indicator_value_hash(data['value']))
     if case_sensitive:
-        existing = Indicator.query.filter(Indicator.type == indicator_type, func.binary(Indicator.value) == func.binary(data['value'])).first()
+        existing = candidates.filter(func.binary(Indicator.value) == func.binary(data['value'])).first()
         if existing:
             return error_response(409, 'Case-sensitive indicator already exists')
     else:
-        existing = Indicator.query.filter(Indicator.type == indicator_type, func.lower(Indicator.value) == func.lower(data['value'])).first()
+        existing = candidates.filter(func.lower(Indicator.value) == func.lower(data['value'])).first()
         if existing:
             return error_response(409, 'Case-insensitive indicator already exists')
 
@@ -259,9 +260,7 @@ def create_indicator():
     # Verify any references that were specified.
     if 'references' in data:
         for item in data['references']:
-            reference = IntelReference.query.filter(and_(IntelReference.reference == item['reference'],
-                                                         IntelReference.source.has(
-                                                             IntelSource.value == item['source']))).first()
+            reference = find_intel_reference(item['source'], item['reference'])
             if not reference:
                 if current_app.config['INDICATOR_AUTO_CREATE_INTELREFERENCE']:
                     source = IntelSource.query.filter_by(value=item['source']).first()
@@ -290,6 +289,9 @@ def create_indicator():
             indicator.tags.append(tag)
 
     db.session.add(indicator)
+    db.session.flush()
+    IndicatorFacetCount.apply(indicator.facet_keys(), set())
+    refresh_saved_searches([indicator])
     db.session.commit()
 
     response = jsonify(indicator.to_dict())
@@ -417,11 +419,12 @@ def read_indicators():
         "_links": {
           "next": null,
           "prev": null,
-          "self": "/api/indicators?page=1&per_page=10&value=evil.com&status=NEW"
+          "self": "/api/indicators?page=1&per_page=10&sort=id&value=evil.com&status=NEW"
         },
         "_meta": {
           "page": 1,
           "per_page": 10,
+          "sort": "id",
           "total_items": 1,
           "total_pages": 1
         },
@@ -480,128 +483,112 @@ def read_indicators():
 
     :reqheader Authorization: Optional Apikey value
     :resheader Content-Type: application/json
-    :query bulk: True/False to enable "bulk" mode and received a gzipped response of all indicators, but only id+type+value
+    :query bulk: True/False to enable "bulk" mode and receive all indicators, but only id+type+value (compressed if the request has an Accept-Encoding header)
+    :query campaigns: Comma-separated list of campaign names or aliases (indicator must be in ALL of them)
+    :query campaigns_any: Comma-separated list of campaign names or aliases (indicator must be in ANY of them)
     :query case_sensitive: True/False
-    :query confidence: Confidence value
+    :query confidence: Comma-separated list of confidence values
     :query created_after: Parsable date or datetime in GMT. Ex: YYYY-MM-DD or YYYY-MM-DD HH:MM:SS
     :query created_before: Parsable date or datetime in GMT. Ex: YYYY-MM-DD or YYYY-MM-DD HH:MM:SS
-    :query impact: Impact value
+    :query cursor: Cursor from a previous page's next_cursor (use an empty value for the first page)
+    :query impact: Comma-separated list of impact values
     :query modified_after: Parsable date or datetime in GMT. Ex: YYYY-MM-DD or YYYY-MM-DD HH:MM:SS
     :query modified_before: Parsable date or datetime in GMT. Ex: YYYY-MM-DD or YYYY-MM-DD HH:MM:SS
     :query not_sources: Comma-separated list of intel sources to EXCLUDE
-    :query sources: Comma-separated list of intel sources
-    :query status: Status value
+    :query page: Page number to read when not using a cursor
+    :query per_page: Number of indicators per page (maximum 1000)
+    :query sort: id, created_time or modified_time. Prefix with - to sort descending (defaults to id)
+    :query sources: Comma-separated list of intel sources (indicator must have ALL of them)
+    :query sources_any: Comma-separated list of intel sources (indicator must have ANY of them)
+    :query status: Comma-separated list of status values
     :query substring: True/False
-    :query tags: Comma-separated list of tags
-    :query type: Type value
+    :query tags: Comma-separated list of tags (indicator must have ALL of them)
+    :query tags_any: Comma-separated list of tags (indicator must have ANY of them)
+    :query type: Comma-separated list of type values
     :query user: Username of person who created the associated reference
     :query value: String found in value (uses wildcard search)
     :status 200: Indicators found
+    :status 400: Invalid cursor
+    :status 400: Invalid sort
     :status 401: Invalid role to perform this action
+    :status 429: Rate limit exceeded (see the Retry-After header)
     """
 
-    filters = set()
-
-    # Case-sensitive filter
-    if 'case_sensitive' in request.args:
-        arg = parse_boolean(request.args.get('case_sensitive'), default=None)
-        filters.add(Indicator.case_sensitive.is_(arg))
-
-    # Confidence filter
-    if 'confidence' in request.args:
-        filters.add(Indicator.confidence.has(IndicatorConfidence.value == request.args.get('confidence')))
-
-    # Created after filter
-    if 'created_after' in request.args:
-        try:
-            created_after = parse(request.args.get('created_after'), ignoretz=True)
-        except (ValueError, OverflowError):
-            created_after = datetime.date.max
-        filters.add(created_after < Indicator.created_time)
-
-    # Created before filter
-    if 'created_before' in request.args:
-        try:
-            created_before = parse(request.args.get('created_before'), ignoretz=True)
-        except (ValueError, OverflowError):
-            created_before = datetime.date.min
-        filters.add(Indicator.created_time < created_before)
-
-    # Impact filter
-    if 'impact' in request.args:
-        filters.add(Indicator.impact.has(IndicatorImpact.value == request.args.get('impact')))
-
-    # Modified after filter
-    if 'modified_after' in request.args:
-        try:
-            modified_after = parse(request.args.get('modified_after'))
-        except (ValueError, OverflowError):
-            modified_after = datetime.date.max
-        filters.add(modified_after < Indicator.modified_time)
-
-    # Modified before filter
-    if 'modified_before' in request.args:
-        try:
-            modified_before = parse(request.args.get('modified_before'))
-        except (ValueError, OverflowError):
-            modified_before = datetime.date.min
-        filters.add(Indicator.modified_time < modified_before)
-
-    # NOT Source filter (IntelReference)
-    if 'not_sources' in request.args:
-        not_sources = request.args.get('not_sources').split(',')
-        for ns in not_sources:
-            filters.add(~Indicator.references.any(IntelReference.source.has(IntelSource.value == ns)))
-
-    # Source filter (IntelReference)
-    if 'sources' in request.args:
-        sources = request.args.get('sources').split(',')
-        for s in sources:
-            filters.add(Indicator.references.any(IntelReference.source.has(IntelSource.value == s)))
-
-    # Status filter
-    if 'status' in request.args:
-        filters.add(Indicator.status.has(IndicatorStatus.value == request.args.get('status')))
-
-    # Substring filter
-    if 'substring' in request.args:
-        arg = parse_boolean(request.args.get('substring'), default=None)
-        filters.add(Indicator.substring.is_(arg))
-
-    # Tags filter
-    if 'tags' in request.args:
-        search_tags = request.args.get('tags').split(',')
-        for search_tag in search_tags:
-            filters.add(Indicator.tags.any(value=search_tag))
-
-    # Type filter
-    if 'type' in request.args:
-        filters.add(Indicator.type.has(IndicatorType.value == request.args.get('type')))
-
-    # Username filter
-    if 'user' in request.args:
-        filters.add(Indicator.references.any(IntelReference.user.has(User.username == request.args.get('user'))))
-
-    # Value filter
-    if 'value' in request.args:
-        filters.add(Indicator.value.like('%{}%'.format(request.args.get('value'))))
-
-    # If bulk is enabled, get all of the results and compress them.
+    filters = indicator_filters(request.args)
+
+    # If bulk is enabled, get all of the results (compressed if the client sent Accept-Encoding).
     if 'bulk' in request.args:
         if parse_boolean(request.args.get('bulk')):
             data = [indicator.to_dict(bulk=True) for indicator in Indicator.query.filter(*filters)]
-            data = json.dumps(data).encode('utf-8')
-
-            response = Response(status=200, mimetype='application/json')
-            response.data = gzip.compress(data)
-            response.headers['Content-Encoding'] = 'gzip'
-            response.headers['Content-Length'] = len(response.data)
-            return response
+            return Response(json.dumps(data), status=200, mimetype='application/json')
 
-    data = Indicator.to_collection_dict(Indicator.query.filter(*filters), 'api.read_indicators', **request.args)
+    try:
+        query = Indicator.query.options(*indicator_load_options()).filter(*filters)
+        data = Indicator.to_collection_dict(query, 'api.read_indicators', **request.args)
+    except ValueError as e:
+        return error_response(400, str(e))
     return jsonify(data)
 
 
+@bp.route('/indicators/facets', methods=['GET'])
+@check_apikey
+def read_indicator_facets():
+    """ Gets the number of indicators for each value of the requested facets based on various filter criteria.
+
+    .. :quickref: Indicator; Gets the number of indicators for each value of the requested facets.
+
+    **Example request**:
+
+    *NOTE*: Accepts all of the same filters as reading multiple indicators. Unfiltered counts are
+    served from a counts table that is maintained as indicators are created, updated and deleted.
+
+    .. sourcecode:: http
+
+      GET /indicators/facets?facets=status,type&sources=OSINT HTTP/1.1
+      Host: 127.0.0.1
+      Accept: application/json
+
+    **Example response**:
+
+    .. sourcecode:: http
+
+      HTTP/1.1 200 OK
+      Content-Type: application/json
+
+      {
+        "_meta": {
+          "total_items": 3
+        },
+        "facets": {
+          "status": {
+            "Analyzed": 1,
+            "New": 2
+          },
+          "type": {
+            "Email - Address": 2,
+            "IP": 1
+          }
+        }
+      }
+
+    :reqheader Authorization: Optional Apikey value
+    :resheader Content-Type: application/json
+    :query facets: Comma-separated list of facets to count: campaign, source, status, tag, type (defaults to all)
+    :status 200: Facet counts found
+    :status 400: Invalid facet
+    :status 401: Invalid role to perform this action
+    """
+
+    facets = FACETS
+    if 'facets' in request.args:
+        facets = sorted(set(split_arg(request.args.get('facets'))))
+        for facet in facets:
+            if facet not in FACETS:
+                return error_response(400, 'Invalid facet: {}'.format(facet))
+
+    return jsonify(facet_counts(facets, indicator_filters(request.args)))
+
+
 """
 UPDATE
 """
@@ -709,6 +696,9 @@ def update_indicator(indicator_id):
     if not indicator:
         return error_response(404, 'Indicator ID not found')
 
+    # Remember the facet values so the facet counts can be adjusted after the update.
+    old_facet_keys = indicator.facet_keys()
+
     # Verify campaigns if it was specified.
     if 'campaigns' in data:
         valid_campaigns = []
@@ -788,6 +778,10 @@ def update_indicator(indicator_id):
 
         indicator.user = user
 
+    db.session.flush()
+    new_facet_keys = indicator.facet_keys()
+    IndicatorFacetCount.apply(new_facet_keys - old_facet_keys, old_facet_keys - new_facet_keys)
+    refresh_saved_searches([indicator])
     db.session.commit()
 
     response = jsonify(indicator.to_dict())
@@ -831,6 +825,7 @@ def delete_indicator(indicator_id):
         return error_response(404, 'Indicator ID not found')
 
     try:
+        IndicatorFacetCount.apply(set(), indicator.facet_keys())
         db.session.delete(indicator)
         db.session.commit()
     except exc.IntegrityError:
@@ -3,10 +3,12 @@ from sqlalchemy import exc
 
 from project import db
 from project.api import bp
+from project.api.caching import table_cache
 from project.api.decorators import check_apikey, validate_json, validate_schema
-from project.api.errors import error_response
 from project.api.schemas import value_create, value_update
+from project.helpers import error_response, parse_boolean
 from project.models import IndicatorImpact
+from project.queries import collection_filters
 
 """
 CREATE
@@ -121,10 +123,11 @@ def read_indicator_impact(indicator_impact_id):
 
 @bp.route('/indicators/impact', methods=['GET'])
 @check_apikey
+@table_cache('indicator_impact')
 def read_indicator_impacts():
-    """ Gets a list of all the indicator impacts.
+    """ Gets a paginated list of all the indicator impacts.
     
-    .. :quickref: IndicatorImpact; Gets a list of all the indicator impacts.
+    .. :quickref: IndicatorImpact; Gets a paginated list of all the indicator impacts.
 
     **Example request**:
 
@@ -141,25 +144,58 @@ def read_indicator_impacts():
       HTTP/1.1 200 OK
       Content-Type: application/json
 
-      [
-        {
-          "id": 1,
-          "value": "LOW"
+      {
+        "_links": {
+          "next": null,
+          "prev": null,
+          "self": "/api/indicators/impact?page=1&per_page=100&sort=id"
+        },
+        "_meta": {
+          "page": 1,
+          "per_page": 100,
+          "sort": "id",
+          "total_items": 2,
+          "total_pages": 1
         },
-        {
-          "id": 2,
-          "value": "HIGH"
-        }
-      ]
+        "items": [
+          {
+            "id": 1,
+            "value": "LOW"
+          },
+          {
+            "id": 2,
+            "value": "HIGH"
+          }
+        ]
+      }
 
     :reqheader Authorization: Optional Apikey value
+    :reqheader If-None-Match: Optional ETag of a previous response
     :resheader Content-Type: application/json
+    :query cursor: Cursor from a previous page's next_cursor (use an empty value for the first page)
+    :query legacy: true returns all of the matching indicator impacts as a plain list without pagination
+    :query page: Page number to read when not using a cursor
+    :query per_page: Number of indicator impacts per page (maximum 1000)
+    :query sort: id or value. Prefix with - to sort descending (defaults to id)
+    :query value: Only return indicator impacts whose value starts with this
     :status 200: Indicator impacts found
+    :status 304: Not modified since the request's If-None-Match ETag
+    :status 400: Invalid cursor
+    :status 400: Invalid sort
     :status 401: Invalid role to perform this action
     """
 
-    data = IndicatorImpact.query.all()
-    return jsonify([item.to_dict() for item in data])
+    filters = collection_filters(request.args, {'value': IndicatorImpact.value})
+    query = IndicatorImpact.query.filter(*filters)
+
+    if parse_boolean(request.args.get('legacy'), default=False):
+        return jsonify([item.to_dict() for item in query])
+
+    try:
+        data = IndicatorImpact.to_collection_dict(query, 'api.read_indicator_impacts', **request.args)
+    except ValueError as e:
+        return error_response(400, str(e))
+    return jsonify(data)
 
 
 """
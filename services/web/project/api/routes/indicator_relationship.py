@@ -1,8 +1,8 @@
 from project import db
 from project.api import bp
 from project.api.decorators import check_apikey, validate_schema
-from project.api.errors import error_response
 from project.api.schemas import null_create
+from project.helpers import error_response
 from project.models import Indicator
 
 """
@@ -1,13 +1,16 @@
 from flask import current_app, jsonify, request, url_for
-from sqlalchemy import and_, exc
+from sqlalchemy import exc
+from sqlalchemy.orm import joinedload
 
 from project import db
 from project.api import bp
 from project.api.decorators import check_apikey, validate_json, validate_schema
-from project.api.errors import error_response
-from project.api.helpers import get_apikey
 from project.api.schemas import intel_reference_create, intel_reference_update
-from project.models import IntelReference, IntelSource, User
+from project.helpers import error_response, get_apikey
+from project.models import Indicator, IndicatorFacetCount, IntelReference, IntelSource, User, \
+    indicator_reference_association
+from project.queries import expire_saved_searches, find_intel_reference, indicator_load_options, \
+    intel_reference_filters, mapped_indicators_response, reference_source_deltas
 
 
 """
@@ -96,9 +99,7 @@ def create_intel_reference():
             return error_response(404, 'Intel source not found: {}'.format(data['source']))
 
     # Verify this reference does not already exist.
-    existing = IntelReference.query.filter(and_(IntelReference.reference == data['reference'],
-                                                IntelReference.source.has(
-                                                    IntelSource.value == source.value))).first()
+    existing = find_intel_reference(source.value, data['reference'])
     if existing:
         return error_response(409, 'Intel reference already exists')
 
@@ -186,16 +187,18 @@ def read_intel_references():
         "_links": {
           "next": null,
           "prev": null,
-          "self": "/api/intel/reference?page=1&per_page=10"
+          "self": "/api/intel/reference?page=1&per_page=10&sort=id"
         },
         "_meta": {
           "page": 1,
           "per_page": 10,
+          "sort": "id",
           "total_items": 3,
           "total_pages": 1
         },
         "items": [
           {
+            "created_time": "Thu, 28 Feb 2019 17:10:44 GMT",
             "id": 1,
             "reference": "http://yourwiki.com/page-for-the-event",
             "source": "Your company",
@@ -218,12 +221,27 @@ def read_intel_references():
 
     :reqheader Authorization: Optional Apikey value
     :resheader Content-Type: application/json
+    :query created_after: Parsable date or datetime in GMT. Ex: YYYY-MM-DD or YYYY-MM-DD HH:MM:SS
+    :query cursor: Cursor from a previous page's next_cursor (use an empty value for the first page)
+    :query page: Page number to read when not using a cursor
+    :query per_page: Number of intel references per page (maximum 1000)
+    :query reference: Only return intel references that start with this
+    :query reference_contains: Only return intel references that contain this
+    :query sort: id or reference. Prefix with - to sort descending (defaults to id)
+    :query source: Comma-separated list of intel sources
+    :query user: Comma-separated list of usernames of the people who created the intel references
     :status 200: Intel references found
+    :status 400: Invalid cursor
+    :status 400: Invalid sort
     :status 401: Invalid role to perform this action
     """
 
-    filters = set()
-    data = IntelReference.to_collection_dict(IntelReference.query.filter(*filters), 'api.read_intel_references', **request.args)
+    filters = intel_reference_filters(request.args)
+    try:
+        query = IntelReference.query.options(joinedload(IntelReference.source), joinedload(IntelReference.user))
+        data = IntelReference.to_collection_dict(query.filter(*filters), 'api.read_intel_references', **request.args)
+    except ValueError as e:
+        return error_response(400, str(e))
     return jsonify(data)
 
 
@@ -234,6 +252,10 @@ def read_intel_reference_indicators(intel_reference_id):
 
     .. :quickref: Indicator; Gets a paginated list of the indicators associated with the intel reference.
 
+    *NOTE*: The bulk and stream modes read the indicators straight from the mapping table and only return the
+    requested fields (id, type and value by default), which is much faster for references with thousands of
+    indicators. The stream mode returns one JSON object per line (NDJSON) as the rows are read.
+
     **Example request**:
 
     .. sourcecode:: http
@@ -253,11 +275,12 @@ def read_intel_reference_indicators(intel_reference_id):
         "_links": {
           "next": null,
           "prev": null,
-          "self": "/api/intel/reference/1/indicators?page=1&per_page=10"
+          "self": "/api/intel/reference/1/indicators?page=1&per_page=10&sort=id"
         },
         "_meta": {
           "page": 1,
           "per_page": 10,
+          "sort": "id",
           "total_items": 1,
           "total_pages": 1
         },
@@ -314,22 +337,64 @@ def read_intel_reference_indicators(intel_reference_id):
         ]
       }
 
+    **Example bulk request**:
+
+    .. sourcecode:: http
+
+      GET /intel/reference/1/indicators?bulk=true&fields=id,value,created_time HTTP/1.1
+      Host: 127.0.0.1
+      Accept: application/json
+
+    **Example bulk response**:
+
+    .. sourcecode:: http
+
+      HTTP/1.1 200 OK
+      Content-Type: application/json
+
+      [
+        {
+          "created_time": "Fri, 01 Mar 2019 18:00:51 GMT",
+          "id": 2,
+          "value": "badguy@evil.com"
+        }
+      ]
+
     :reqheader Authorization: Optional Apikey value
-    :resheader Content-Type: application/json
+    :resheader Content-Type: application/json or application/x-ndjson
+    :query bulk: True/False to receive all of the indicators as a single list of the requested fields
+    :query cursor: Cursor from a previous page's next_cursor (use an empty value for the first page)
+    :query fields: Comma-separated list of the fields to return in bulk and stream mode: case_sensitive, confidence, created_time, id, impact, modified_time, status, substring, type, user, value
+    :query page: Page number to read when not using a cursor
+    :query per_page: Number of indicators per page (maximum 1000)
+    :query sort: id, created_time or modified_time. Prefix with - to sort descending (defaults to id)
+    :query stream: True/False to stream all of the indicators as NDJSON, one object of the requested fields per line
     :status 200: Indicators found
+    :status 400: Invalid cursor
+    :status 400: Invalid field
+    :status 400: Invalid sort
     :status 401: Invalid role to perform this action
+    :status 404: Intel reference ID not found
     """
 
     intel_reference = IntelReference.query.get(intel_reference_id)
     if not intel_reference:
         return error_response(404, 'Intel reference ID not found')
 
+    response = mapped_indicators_response(indicator_reference_association.c.intel_reference_id, intel_reference.id)
+    if response is not None:
+        return response
+
     # Inject the intel_reference_id parameter into the request arguments.
     # Also need to cast as a dict since request.args is a MultiDict, which causes issues in to_collection_dict.
     args = dict(request.args.copy())
     args['intel_reference_id'] = intel_reference.id
 
-    data = IntelReference.to_collection_dict(intel_reference.indicators, 'api.read_intel_reference_indicators', **args)
+    try:
+        query = intel_reference.indicators.options(*indicator_load_options())
+        data = Indicator.to_collection_dict(query, 'api.read_intel_reference_indicators', **args)
+    except ValueError as e:
+        return error_response(400, str(e))
     return jsonify(data)
 
 
@@ -420,8 +485,18 @@ def update_intel_reference(intel_reference_id):
         if not user.active:
             return error_response(401, 'Cannot update an intel reference with an inactive user')
 
+        # The indicators of the reference now match a different user filter.
+        if user.id != intel_reference.user_id:
+            expire_saved_searches('user')
+
         intel_reference.user = user
 
+    # Moving the reference to another source changes the source of all of its indicators.
+    if source.id != intel_reference.intel_source_id:
+        IndicatorFacetCount.adjust(reference_source_deltas(intel_reference.id, intel_reference.intel_source_id,
+                                                           source.id))
+        expire_saved_searches('not_sources', 'sources', 'sources_any')
+
     # Set the new values.
     intel_reference.reference = reference
     intel_reference.source = source
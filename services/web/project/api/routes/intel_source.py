@@ -3,10 +3,12 @@ from sqlalchemy import exc
 
 from project import db
 from project.api import bp
+from project.api.caching import table_cache
 from project.api.decorators import check_apikey, validate_json, validate_schema
-from project.api.errors import error_response
 from project.api.schemas import value_create, value_update
+from project.helpers import error_response, parse_boolean
 from project.models import IntelSource
+from project.queries import collection_filters
 
 """
 CREATE
@@ -121,10 +123,11 @@ def read_intel_source(intel_source_id):
 
 @bp.route('/intel/source', methods=['GET'])
 @check_apikey
+@table_cache('intel_source')
 def read_intel_sources():
-    """ Gets a list of all the intel sources.
+    """ Gets a paginated list of all the intel sources.
     
-    .. :quickref: IntelSource; Gets a list of all the intel sources.
+    .. :quickref: IntelSource; Gets a paginated list of all the intel sources.
 
     **Example request**:
 
@@ -141,25 +144,58 @@ def read_intel_sources():
       HTTP/1.1 200 OK
       Content-Type: application/json
 
-      [
-        {
-          "id": 1,
-          "value": "OSINT"
+      {
+        "_links": {
+          "next": null,
+          "prev": null,
+          "self": "/api/intel/source?page=1&per_page=100&sort=id"
+        },
+        "_meta": {
+          "page": 1,
+          "per_page": 100,
+          "sort": "id",
+          "total_items": 2,
+          "total_pages": 1
         },
-        {
-          "id": 2,
-          "value": "VirusTotal"
-        }
-      ]
+        "items": [
+          {
+            "id": 1,
+            "value": "OSINT"
+          },
+          {
+            "id": 2,
+            "value": "VirusTotal"
+          }
+        ]
+      }
 
     :reqheader Authorization: Optional Apikey value
+    :reqheader If-None-Match: Optional ETag of a previous response
     :resheader Content-Type: application/json
+    :query cursor: Cursor from a previous page's next_cursor (use an empty value for the first page)
+    :query legacy: true returns all of the matching intel sources as a plain list without pagination
+    :query page: Page number to read when not using a cursor
+    :query per_page: Number of intel sources per page (maximum 1000)
+    :query sort: id or value. Prefix with - to sort descending (defaults to id)
+    :query value: Only return intel sources whose value starts with this
     :status 200: Intel sources found
+    :status 304: Not modified since the request's If-None-Match ETag
+    :status 400: Invalid cursor
+    :status 400: Invalid sort
     :status 401: Invalid role to perform this action
     """
 
-    data = IntelSource.query.all()
-    return jsonify([item.to_dict() for item in data])
+    filters = collection_filters(request.args, {'value': IntelSource.value})
+    query = IntelSource.query.filter(*filters)
+
+    if parse_boolean(request.args.get('legacy'), default=False):
+        return jsonify([item.to_dict() for item in query])
+
+    try:
+        data = IntelSource.to_collection_dict(query, 'api.read_intel_sources', **request.args)
+    except ValueError as e:
+        return error_response(400, str(e))
+    return jsonify(data)
 
 
 """
@@ -3,10 +3,13 @@ from sqlalchemy import exc
 
 from project import db
 from project.api import bp
+from project.api.caching import table_cache
 from project.api.decorators import check_apikey, validate_json, validate_schema, verify_admin
-from project.api.errors import error_response
 from project.api.schemas import role_create, role_update
+from project.apikeys import invalidate_apikey_cache
+from project.helpers import error_response, parse_boolean
 from project.models import Role
+from project.queries import collection_filters
 
 """
 CREATE
@@ -128,10 +131,11 @@ def read_role(role_id):
 
 @bp.route('/roles', methods=['GET'])
 @check_apikey
+@table_cache('role')
 def read_roles():
-    """ Gets a list of all the roles.
+    """ Gets a paginated list of all the roles.
 
-    .. :quickref: Role; Gets a list of all the roles.
+    .. :quickref: Role; Gets a paginated list of all the roles.
 
     **Example request**:
 
@@ -148,27 +152,60 @@ def read_roles():
       HTTP/1.1 200 OK
       Content-Type: application/json
 
-      [
-        {
-          "id": 1,
-          "name": "analyst",
-          "description": "Users that create and process intel"
+      {
+        "_links": {
+          "next": null,
+          "prev": null,
+          "self": "/api/roles?page=1&per_page=100&sort=id"
+        },
+        "_meta": {
+          "page": 1,
+          "per_page": 100,
+          "sort": "id",
+          "total_items": 2,
+          "total_pages": 1
         },
-        {
-          "id": 2,
-          "name": "readonly",
-          "description": "Users that can only read the database"
-        }
-      ]
+        "items": [
+          {
+            "id": 1,
+            "name": "analyst",
+            "description": "Users that create and process intel"
+          },
+          {
+            "id": 2,
+            "name": "readonly",
+            "description": "Users that can only read the database"
+          }
+        ]
+      }
 
     :reqheader Authorization: Optional Apikey value
+    :reqheader If-None-Match: Optional ETag of a previous response
     :resheader Content-Type: application/json
+    :query cursor: Cursor from a previous page's next_cursor (use an empty value for the first page)
+    :query legacy: true returns all of the matching roles as a plain list without pagination
+    :query name: Only return roles whose name starts with this
+    :query page: Page number to read when not using a cursor
+    :query per_page: Number of roles per page (maximum 1000)
+    :query sort: id or name. Prefix with - to sort descending (defaults to id)
     :status 200: Roles found
+    :status 304: Not modified since the request's If-None-Match ETag
+    :status 400: Invalid cursor
+    :status 400: Invalid sort
     :status 401: Invalid role to perform this action
     """
 
-    data = Role.query.all()
-    return jsonify([item.to_dict() for item in data])
+    filters = collection_filters(request.args, {'name': Role.name})
+    query = Role.query.filter(*filters)
+
+    if parse_boolean(request.args.get('legacy'), default=False):
+        return jsonify([item.to_dict() for item in query])
+
+    try:
+        data = Role.to_collection_dict(query, 'api.read_roles', **request.args)
+    except ValueError as e:
+        return error_response(400, str(e))
+    return jsonify(data)
 
 
 """
@@ -241,6 +278,7 @@ def update_role(role_id):
         role.description = data['description']
 
     db.session.commit()
+    invalidate_apikey_cache()
     response = jsonify(role.to_dict())
     return response
 
@@ -284,6 +322,7 @@ def delete_role(role_id):
     try:
         db.session.delete(role)
         db.session.commit()
+        invalidate_apikey_cache()
     except exc.IntegrityError:
         db.session.rollback()
         return error_response(409, 'Unable to delete role due to foreign key constraints')
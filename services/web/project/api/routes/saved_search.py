@@ -0,0 +1,409 @@
+import json
+
+from flask import current_app, jsonify, request, url_for
+
+from project import db
+from project.api import bp
+from project.api.decorators import check_apikey, validate_json, validate_schema
+from project.api.schemas import saved_search_create, saved_search_update
+from project.helpers import error_response
+from project.models import Indicator, SavedSearch
+from project.queries import indicator_load_options, normalize_filters, refresh_saved_search
+
+"""
+CREATE
+"""
+
+
+@bp.route('/searches', methods=['POST'])
+@check_apikey
+@validate_json
+@validate_schema(saved_search_create)
+def create_saved_search():
+    """ Creates a new saved search and builds its result set.
+
+    .. :quickref: SavedSearch; Creates a new saved search.
+
+    The filters accept the same values as the read_indicators query arguments.
+
+    **Example request**:
+
+    .. sourcecode:: http
+
+      POST /searches HTTP/1.1
+      Host: 127.0.0.1
+      Content-Type: application/json
+
+      {
+        "name": "New phish URIs",
+        "filters": {
+          "status": "New",
+          "tags": "phish",
+          "type": "URI - URL"
+        }
+      }
+
+    **Example response**:
+
+    .. sourcecode:: http
+
+      HTTP/1.1 201 Created
+      Content-Type: application/json
+
+      {
+        "id": 1,
+        "created_time": "Thu, 28 Feb 2019 17:10:44 GMT",
+        "filters": {
+          "status": "New",
+          "tags": "phish",
+          "type": "URI - URL"
+        },
+        "name": "New phish URIs",
+        "refreshed_time": "Thu, 28 Feb 2019 17:10:44 GMT"
+      }
+
+    :reqheader Authorization: Optional Apikey value
+    :resheader Content-Type: application/json
+    :status 201: Saved search created
+    :status 400: JSON does not match the schema
+    :status 401: Invalid role to perform this action
+    :status 409: Saved search already exists
+    """
+
+    data = request.get_json()
+
+    # Verify this name does not already exist.
+    existing = SavedSearch.query.filter_by(name=data['name']).first()
+    if existing:
+        return error_response(409, 'Saved search already exists')
+
+    saved_search = SavedSearch(name=data['name'], filters=json.dumps(normalize_filters(data['filters']), sort_keys=True))
+    db.session.add(saved_search)
+    db.session.flush()
+
+    # Materialize the result set.
+    refresh_saved_search(saved_search)
+    db.session.commit()
+
+    response = jsonify(saved_search.to_dict())
+    response.status_code = 201
+    response.headers['Location'] = url_for('api.read_saved_search', name=saved_search.name)
+    return response
+
+
+"""
+READ
+"""
+
+
+@bp.route('/searches/<name>', methods=['GET'])
+@check_apikey
+def read_saved_search(name):
+    """ Gets a single saved search given its name.
+
+    .. :quickref: SavedSearch; Gets a single saved search given its name.
+
+    **Example request**:
+
+    .. sourcecode:: http
+
+      GET /searches/New%20phish%20URIs HTTP/1.1
+      Host: 127.0.0.1
+      Accept: application/json
+
+    **Example response**:
+
+    .. sourcecode:: http
+
+      HTTP/1.1 200 OK
+      Content-Type: application/json
+
+      {
+        "id": 1,
+        "created_time": "Thu, 28 Feb 2019 17:10:44 GMT",
+        "filters": {
+          "status": "New",
+          "tags": "phish",
+          "type": "URI - URL"
+        },
+        "name": "New phish URIs",
+        "refreshed_time": "Thu, 28 Feb 2019 17:10:44 GMT"
+      }
+
+    :reqheader Authorization: Optional Apikey value
+    :resheader Content-Type: application/json
+    :status 200: Saved search found
+    :status 401: Invalid role to perform this action
+    :status 404: Saved search not found
+    """
+
+    saved_search = SavedSearch.query.filter_by(name=name).first()
+    if not saved_search:
+        return error_response(404, 'Saved search not found')
+
+    return jsonify(saved_search.to_dict())
+
+
+@bp.route('/searches', methods=['GET'])
+@check_apikey
+def read_saved_searches():
+    """ Gets a list of all the saved searches.
+
+    .. :quickref: SavedSearch; Gets a list of all the saved searches.
+
+    **Example request**:
+
+    .. sourcecode:: http
+
+      GET /searches HTTP/1.1
+      Host: 127.0.0.1
+      Accept: application/json
+
+    **Example response**:
+
+    .. sourcecode:: http
+
+      HTTP/1.1 200 OK
+      Content-Type: application/json
+
+      [
+        {
+          "id": 1,
+          "created_time": "Thu, 28 Feb 2019 17:10:44 GMT",
+          "filters": {
+            "status": "New",
+            "tags": "phish",
+            "type": "URI - URL"
+          },
+          "name": "New phish URIs",
+          "refreshed_time": "Thu, 28 Feb 2019 17:10:44 GMT"
+        }
+      ]
+
+    :reqheader Authorization: Optional Apikey value
+    :resheader Content-Type: application/json
+    :status 200: Saved searches found
+    :status 401: Invalid role to perform this action
+    """
+
+    data = SavedSearch.query.all()
+    return jsonify([item.to_dict() for item in data])
+
+
+@bp.route('/searches/<name>/results', methods=['GET'])
+@check_apikey
+def read_saved_search_results(name):
+    """ Gets a paginated list of the indicators that match a saved search.
+
+    .. :quickref: SavedSearch; Gets the indicators that match a saved search.
+
+    The results are read from the materialized result set, which is kept up to date as indicators
+    are created and updated. Result sets older than SAVED_SEARCH_REFRESH_INTERVAL seconds are
+    rebuilt before they are returned to pick up any indirect changes (ex: intel references).
+
+    **Example request**:
+
+    .. sourcecode:: http
+
+      GET /searches/New%20phish%20URIs/results HTTP/1.1
+      Host: 127.0.0.1
+      Accept: application/json
+
+    **Example response**:
+
+    .. sourcecode:: http
+
+      HTTP/1.1 200 OK
+      Content-Type: application/json
+
+      {
+        "_links": {
+          "next": null,
+          "prev": null,
+          "self": "/api/searches/New%20phish%20URIs/results?page=1&per_page=100&sort=id"
+        },
+        "_meta": {
+          "page": 1,
+          "per_page": 100,
+          "sort": "id",
+          "total_items": 1,
+          "total_pages": 1
+        },
+        "items": [
+          {
+            "all_children": [],
+            "all_equal": [],
+            "campaigns": [],
+            "case_sensitive": false,
+            "children": [],
+            "confidence": "LOW",
+            "created_time": "Fri, 26 Apr 2019 18:48:55 GMT",
+            "equal": [],
+            "id": 1,
+            "impact": "LOW",
+            "modified_time": "Fri, 26 Apr 2019 18:48:55 GMT",
+            "parent": null,
+            "references": [],
+            "status": "New",
+            "substring": false,
+            "tags": ["phish"],
+            "type": "URI - URL",
+            "username": "analyst",
+            "value": "http://example.com/phish"
+          }
+        ]
+      }
+
+    :reqheader Authorization: Optional Apikey value
+    :resheader Content-Type: application/json
+    :query cursor: The cursor returned by the previous page to use keyset pagination
+    :query page: The page number of the results (Defaults to 1)
+    :query per_page: The number of results per page (Defaults to 100, maximum 1000)
+    :query sort: The field to sort by: id, created_time or modified_time (Prefix with - for descending)
+    :status 200: Saved search found
+    :status 400: Invalid sort or cursor
+    :status 401: Invalid role to perform this action
+    :status 404: Saved search not found
+    """
+
+    saved_search = SavedSearch.query.filter_by(name=name).first()
+    if not saved_search:
+        return error_response(404, 'Saved search not found')
+
+    # Rebuild the result set if it has gone stale.
+    if saved_search.is_stale(current_app.config['SAVED_SEARCH_REFRESH_INTERVAL']):
+        refresh_saved_search(saved_search)
+        db.session.commit()
+
+    args = dict(request.args.copy())
+    args['name'] = saved_search.name
+
+    try:
+        query = saved_search.indicators.options(*indicator_load_options())
+        data = Indicator.to_collection_dict(query, 'api.read_saved_search_results', **args)
+    except ValueError as e:
+        return error_response(400, str(e))
+    return jsonify(data)
+
+
+"""
+UPDATE
+"""
+
+
+@bp.route('/searches/<name>', methods=['PUT'])
+@check_apikey
+@validate_json
+@validate_schema(saved_search_update)
+def update_saved_search(name):
+    """ Updates an existing saved search and rebuilds its result set.
+
+    .. :quickref: SavedSearch; Updates an existing saved search.
+
+    **Example request**:
+
+    .. sourcecode:: http
+
+      PUT /searches/New%20phish%20URIs HTTP/1.1
+      Host: 127.0.0.1
+      Content-Type: application/json
+
+      {
+        "filters": {
+          "status": "Analyzed",
+          "tags": "phish"
+        }
+      }
+
+    **Example response**:
+
+    .. sourcecode:: http
+
+      HTTP/1.1 200 OK
+      Content-Type: application/json
+
+      {
+        "id": 1,
+        "created_time": "Thu, 28 Feb 2019 17:10:44 GMT",
+        "filters": {
+          "status": "Analyzed",
+          "tags": "phish"
+        },
+        "name": "New phish URIs",
+        "refreshed_time": "Thu, 28 Feb 2019 17:18:29 GMT"
+      }
+
+    :reqheader Authorization: Optional Apikey value
+    :resheader Content-Type: application/json
+    :status 200: Saved search updated
+    :status 400: JSON does not match the schema
+    :status 401: Invalid role to perform this action
+    :status 404: Saved search not found
+    :status 409: Saved search already exists
+    """
+
+    data = request.get_json()
+
+    # Verify the saved search exists.
+    saved_search = SavedSearch.query.filter_by(name=name).first()
+    if not saved_search:
+        return error_response(404, 'Saved search not found')
+
+    # Verify the new name does not already exist.
+    if 'name' in data and data['name'] != saved_search.name:
+        existing = SavedSearch.query.filter_by(name=data['name']).first()
+        if existing:
+            return error_response(409, 'Saved search already exists')
+        saved_search.name = data['name']
+
+    # Rebuild the result set using the new filters.
+    if 'filters' in data:
+        saved_search.filters = json.dumps(normalize_filters(data['filters']), sort_keys=True)
+        refresh_saved_search(saved_search)
+
+    # Save the changes.
+    db.session.commit()
+
+    response = jsonify(saved_search.to_dict())
+    return response
+
+
+"""
+DELETE
+"""
+
+
+@bp.route('/searches/<name>', methods=['DELETE'])
+@check_apikey
+def delete_saved_search(name):
+    """ Deletes a saved search.
+
+    .. :quickref: SavedSearch; Deletes a saved search.
+
+    **Example request**:
+
+    .. sourcecode:: http
+
+      DELETE /searches/New%20phish%20URIs HTTP/1.1
+      Host: 127.0.0.1
+
+    **Example response**:
+
+    .. sourcecode:: http
+
+      HTTP/1.1 204 No Content
+
+    :reqheader Authorization: Optional Apikey value
+    :status 204: Saved search deleted
+    :status 401: Invalid role to perform this action
+    :status 404: Saved search not found
+    """
+
+    saved_search = SavedSearch.query.filter_by(name=name).first()
+    if not saved_search:
+        return error_response(404, 'Saved search not found')
+
+    db.session.delete(saved_search)
+    db.session.commit()
+
+    return '', 204
@@ -3,10 +3,13 @@ from sqlalchemy import exc
 
 from project import db
 from project.api import bp
+from project.api.caching import table_cache
 from project.api.decorators import check_apikey, validate_json, validate_schema
-from project.api.errors import error_response
 from project.api.schemas import value_create, value_update
-from project.models import Tag
+from project.helpers import error_response, parse_boolean
+from project.models import Indicator, Tag, indicator_tag_association
+from project.queries import collection_filters, indicator_load_options, mapped_indicator_count, \
+    mapped_indicators_response
 
 """
 CREATE
@@ -120,10 +123,11 @@ def read_tag(tag_id):
 
 @bp.route('/tags', methods=['GET'])
 @check_apikey
+@table_cache('tag')
 def read_tags():
-    """ Gets a list of all the tags.
+    """ Gets a paginated list of all the tags.
     
-    .. :quickref: Tag; Gets a list of all the tags.
+    .. :quickref: Tag; Gets a paginated list of all the tags.
 
     **Example request**:
 
@@ -140,25 +144,203 @@ def read_tags():
       HTTP/1.1 200 OK
       Content-Type: application/json
 
-      [
-        {
-          "id": 1,
-          "value": "phish"
+      {
+        "_links": {
+          "next": null,
+          "prev": null,
+          "self": "/api/tags?page=1&per_page=100&sort=id"
+        },
+        "_meta": {
+          "page": 1,
+          "per_page": 100,
+          "sort": "id",
+          "total_items": 2,
+          "total_pages": 1
         },
-        {
-          "id": 2,
-          "value": "from_address"
-        }
-      ]
+        "items": [
+          {
+            "id": 1,
+            "value": "phish"
+          },
+          {
+            "id": 2,
+            "value": "from_address"
+          }
+        ]
+      }
 
     :reqheader Authorization: Optional Apikey value
+    :reqheader If-None-Match: Optional ETag of a previous response
     :resheader Content-Type: application/json
+    :query cursor: Cursor from a previous page's next_cursor (use an empty value for the first page)
+    :query legacy: true returns all of the matching tags as a plain list without pagination
+    :query page: Page number to read when not using a cursor
+    :query per_page: Number of tags per page (maximum 1000)
+    :query sort: id or value. Prefix with - to sort descending (defaults to id)
+    :query value: Only return tags whose value starts with this
     :status 200: Tags found
+    :status 304: Not modified since the request's If-None-Match ETag
+    :status 400: Invalid cursor
+    :status 400: Invalid sort
+    :status 401: Invalid role to perform this action
+    """
+
+    filters = collection_filters(request.args, {'value': Tag.value})
+    query = Tag.query.filter(*filters)
+
+    if parse_boolean(request.args.get('legacy'), default=False):
+        return jsonify([item.to_dict() for item in query])
+
+    try:
+        data = Tag.to_collection_dict(query, 'api.read_tags', **request.args)
+    except ValueError as e:
+        return error_response(400, str(e))
+    return jsonify(data)
+
+
+@bp.route('/tags/<int:tag_id>/indicators', methods=['GET'])
+@check_apikey
+def read_tag_indicators(tag_id):
+    """ Gets a paginated list of the indicators with the tag.
+
+    .. :quickref: Indicator; Gets a paginated list of the indicators with the tag.
+
+    *NOTE*: The bulk and stream modes read the indicators straight from the mapping table and only return the
+    requested fields (id, type and value by default). The stream mode returns one JSON object per line (NDJSON).
+
+    **Example request**:
+
+    .. sourcecode:: http
+
+      GET /tags/1/indicators?per_page=1 HTTP/1.1
+      Host: 127.0.0.1
+      Accept: application/json
+
+    **Example response**:
+
+    .. sourcecode:: http
+
+      HTTP/1.1 200 OK
+      Content-Type: application/json
+
+      {
+        "_links": {
+          "next": "/api/tags/1/indicators?page=2&per_page=1&sort=id",
+          "prev": null,
+          "self": "/api/tags/1/indicators?page=1&per_page=1&sort=id"
+        },
+        "_meta": {
+          "page": 1,
+          "per_page": 1,
+          "sort": "id",
+          "total_items": 2,
+          "total_pages": 2
+        },
+        "items": [
+          {
+            "all_children": [],
+            "all_equal": [],
+            "campaigns": [],
+            "case_sensitive": false,
+            "children": [],
+            "confidence": "LOW",
+            "created_time": "Fri, 01 Mar 2019 18:00:51 GMT",
+            "equal": [],
+            "id": 2,
+            "impact": "LOW",
+            "modified_time": "Fri, 01 Mar 2019 18:00:51 GMT",
+            "parent": null,
+            "references": [],
+            "status": "NEW",
+            "substring": false,
+            "tags": ["from_address", "phish"],
+            "type": "Email - Address",
+            "user": "your_SIP_username",
+            "value": "badguy@evil.com"
+          }
+        ]
+      }
+
+    :reqheader Authorization: Optional Apikey value
+    :resheader Content-Type: application/json or application/x-ndjson
+    :query bulk: True/False to receive all of the indicators as a single list of the requested fields
+    :query cursor: Cursor from a previous page's next_cursor (use an empty value for the first page)
+    :query fields: Comma-separated list of the fields to return in bulk and stream mode: case_sensitive, confidence, created_time, id, impact, modified_time, status, substring, type, user, value
+    :query page: Page number to read when not using a cursor
+    :query per_page: Number of indicators per page (maximum 1000)
+    :query sort: id, created_time or modified_time. Prefix with - to sort descending (defaults to id)
+    :query stream: True/False to stream all of the indicators as NDJSON, one object of the requested fields per line
+    :status 200: Indicators found
+    :status 400: Invalid cursor
+    :status 400: Invalid field
+    :status 400: Invalid sort
+    :status 401: Invalid role to perform this action
+    :status 404: Tag ID not found
+    """
+
+    tag = Tag.query.get(tag_id)
+    if not tag:
+        return error_response(404, 'Tag ID not found')
+
+    mapping_column = indicator_tag_association.c.tag_id
+
+    response = mapped_indicators_response(mapping_column, tag.id)
+    if response is not None:
+        return response
+
+    # Inject the tag_id parameter into the request arguments.
+    args = dict(request.args.copy())
+    args['tag_id'] = tag.id
+
+    try:
+        query = Indicator.query.options(*indicator_load_options()) \
+            .join(indicator_tag_association, indicator_tag_association.c.indicator_id == Indicator.id).filter(mapping_column == tag.id)
+        data = Indicator.to_collection_dict(query, 'api.read_tag_indicators', **args)
+    except ValueError as e:
+        return error_response(400, str(e))
+    return jsonify(data)
+
+
+@bp.route('/tags/<int:tag_id>/indicators/count', methods=['GET'])
+@check_apikey
+def read_tag_indicator_count(tag_id):
+    """ Gets the number of indicators with the tag.
+
+    .. :quickref: Indicator; Gets the number of indicators with the tag.
+
+    **Example request**:
+
+    .. sourcecode:: http
+
+      GET /tags/1/indicators/count HTTP/1.1
+      Host: 127.0.0.1
+      Accept: application/json
+
+    **Example response**:
+
+    .. sourcecode:: http
+
+      HTTP/1.1 200 OK
+      Content-Type: application/json
+
+      {
+        "count": 2,
+        "id": 1
+      }
+
+    :reqheader Authorization: Optional Apikey value
+    :resheader Content-Type: application/json
+    :status 200: Indicators counted
     :status 401: Invalid role to perform this action
+    :status 404: Tag ID not found
     """
 
-    data = Tag.query.all()
-    return jsonify([item.to_dict() for item in data])
+    tag = Tag.query.get(tag_id)
+    if not tag:
+        return error_response(404, 'Tag ID not found')
+
+    count = mapped_indicator_count(indicator_tag_association.c.tag_id, tag.id)
+    return jsonify({'count': count, 'id': tag.id})
 
 
 """
@@ -2,13 +2,16 @@ from flask import current_app, jsonify, request, url_for
 from flask_security import SQLAlchemyUserDatastore
 from flask_security.utils import hash_password
 from sqlalchemy import exc
+from sqlalchemy.orm import selectinload
 
 from project import db
 from project.api import bp
 from project.api.decorators import check_apikey, validate_json, validate_schema, verify_admin
-from project.api.errors import error_response
 from project.api.schemas import user_create, user_update
+from project.apikeys import invalidate_apikey_cache
+from project.helpers import error_response, parse_boolean
 from project.models import Role, User
+from project.queries import collection_filters
 
 
 """
@@ -183,9 +186,9 @@ def read_user(user_id):
 @bp.route('/users', methods=['GET'])
 @check_apikey
 def read_users():
-    """ Gets a list of all the users.
+    """ Gets a paginated list of all the users.
 
-    .. :quickref: User; Gets a list of all the users.
+    .. :quickref: User; Gets a paginated list of all the users.
 
     **Example request**:
 
@@ -202,35 +205,66 @@ def read_users():
       HTTP/1.1 200 OK
       Content-Type: application/json
 
-      [
-        {
-          "active": true,
-          "email": "admin@localhost",
-          "first_name": "Admin",
-          "id": 1,
-          "last_name": "Admin",
-          "roles": ["admin", "analyst"],
-          "username": "admin"
+      {
+        "_links": {
+          "next": null,
+          "prev": null,
+          "self": "/api/users?page=1&per_page=100&sort=id"
+        },
+        "_meta": {
+          "page": 1,
+          "per_page": 100,
+          "sort": "id",
+          "total_items": 2,
+          "total_pages": 1
         },
-        {
-          "active": true,
-          "email": "johndoe@company.com",
-          "first_name": "John",
-          "id": 2,
-          "last_name": "Doe",
-          "roles": ["analyst"],
-          "username": "johndoe"
-        }
-      ]
+        "items": [
+          {
+            "active": true,
+            "email": "admin@localhost",
+            "first_name": "Admin",
+            "id": 1,
+            "last_name": "Admin",
+            "roles": ["admin", "analyst"],
+            "username": "admin"
+          },
+          {
+            "active": true,
+            "email": "johndoe@company.com",
+            "first_name": "John",
+            "id": 2,
+            "last_name": "Doe",
+            "roles": ["analyst"],
+            "username": "johndoe"
+          }
+        ]
+      }
 
     :reqheader Authorization: Optional Apikey value
     :resheader Content-Type: application/json
+    :query cursor: Cursor from a previous page's next_cursor (use an empty value for the first page)
+    :query legacy: true returns all of the matching users as a plain list without pagination
+    :query page: Page number to read when not using a cursor
+    :query per_page: Number of users per page (maximum 1000)
+    :query sort: id or username. Prefix with - to sort descending (defaults to id)
+    :query username: Only return users whose username starts with this
     :status 200: Users found
+    :status 400: Invalid cursor
+    :status 400: Invalid sort
     :status 401: Invalid role to perform this action
     """
 
-    data = User.query.all()
-    return jsonify([item.to_dict() for item in data])
+    filters = collection_filters(request.args, {'username': User.username})
+    query = User.query.options(selectinload(User.roles)).filter(*filters)
+
+    if parse_boolean(request.args.get('legacy'), default=False):
+        return jsonify([item.to_dict() for item in query])
+
+    try:
+        data = User.to_collection_dict(query, 'api.read_users', **request.args)
+    except ValueError as e:
+        return error_response(400, str(e))
+    return jsonify(data)
 
 
 """
@@ -351,6 +385,7 @@ def update_user(user_id):
             user.username = data['username']
 
     db.session.commit()
+    invalidate_apikey_cache()
 
     response = jsonify(user.to_dict())
     return response
@@ -395,6 +430,7 @@ def delete_user(user_id):
     try:
         db.session.delete(user)
         db.session.commit()
+        invalidate_apikey_cache()
     except exc.IntegrityError:
         db.session.rollback()
         return error_response(409, 'Unable to delete user due to foreign key constraints')
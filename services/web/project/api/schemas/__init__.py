@@ -37,6 +37,12 @@ with open(os.path.join(this_dir, 'role_create.json')) as j:
 with open(os.path.join(this_dir, 'role_update.json')) as j:
     role_update = json.load(j)
 
+# SavedSearch
+with open(os.path.join(this_dir, 'saved_search_create.json')) as j:
+    saved_search_create = json.load(j)
+with open(os.path.join(this_dir, 'saved_search_update.json')) as j:
+    saved_search_update = json.load(j)
+
 # User
 with open(os.path.join(this_dir, 'user_create.json')) as j:
     user_create = json.load(j)
@@ -0,0 +1,58 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from project import db
+from project.models import User
+
+"""
+API KEY CACHE
+
+Each worker keeps a small cache of apikey -> (active, role names) so that authorizing a request
+is a dictionary lookup instead of a User query plus a lazy load of the user's roles. Entries
+expire after APIKEY_CACHE_TTL seconds, and the user and role routes clear the cache whenever
+they change something that could affect authorization. Only the APIKEY_CACHE_SIZE most recently
+used keys are kept, and keys that do not exist are never cached so that random keys cannot fill it.
+"""
+
+
+_apikey_cache = OrderedDict()
+_apikey_cache_lock = threading.Lock()
+
+
+def invalidate_apikey_cache():
+    """ Clears this worker's cache of API key users and roles. """
+
+    with _apikey_cache_lock:
+        _apikey_cache.clear()
+
+
+def lookup_apikey(apikey):
+    """ Returns a tuple of (active, role names) for the given API key, or None if the user does not exist. """
+
+    ttl = current_app.config.get('APIKEY_CACHE_TTL', 0)
+    now = time.monotonic()
+
+    if ttl:
+        with _apikey_cache_lock:
+            cached = _apikey_cache.get(apikey)
+            if cached and cached[0] > now:
+                _apikey_cache.move_to_end(apikey)
+                return cached[1]
+
+    user = db.session.query(User).filter_by(apikey=apikey).first()
+    if not user:
+        return None
+
+    entry = (user.active, frozenset(role.name.lower() for role in user.roles))
+
+    if ttl:
+        with _apikey_cache_lock:
+            _apikey_cache[apikey] = (now + ttl, entry)
+            _apikey_cache.move_to_end(apikey)
+            while len(_apikey_cache) > current_app.config.get('APIKEY_CACHE_SIZE', 1024):
+                _apikey_cache.popitem(last=False)
+
+    return entry
@@ -0,0 +1,168 @@
+import zlib
+
+from flask import current_app, request
+
+"""
+RESPONSE COMPRESSION
+
+Responses are compressed with the best encoding the client lists in its Accept-Encoding header.
+gzip and deflate are always available. zstd and brotli are used when the optional zstandard or
+brotli packages are installed. Only responses with a compressible mimetype that are at least
+COMPRESS_MIN_SIZE bytes are compressed, and anything that already has a Content-Encoding is left
+alone. Streamed responses are compressed chunk by chunk as they are sent.
+"""
+
+
+class _ZlibEncoder(object):
+    def __init__(self, wbits, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliEncoder(object):
+    def __init__(self, level):
+        import brotli
+        self._compressor = brotli.Compressor(quality=min(level, 11))
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class _ZstdEncoder(object):
+    def __init__(self, level):
+        import zstandard
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        import zstandard
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+def _available(module):
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+
+# The encodings in order of preference, along with a function that creates an encoder for a compression level.
+ENCODERS = [('gzip', lambda level: _ZlibEncoder(16 + zlib.MAX_WBITS, level)),
+            ('deflate', lambda level: _ZlibEncoder(zlib.MAX_WBITS, level))]
+if _available('brotli'):
+    ENCODERS.insert(0, ('br', _BrotliEncoder))
+if _available('zstandard'):
+    ENCODERS.insert(0, ('zstd', _ZstdEncoder))
+
+
+def negotiate(accept_encoding):
+    """ Returns the name of the preferred encoding that the Accept-Encoding header allows, or None. """
+
+    accepted = {}
+    for item in accept_encoding.split(','):
+        parts = item.strip().split(';')
+        name = parts[0].strip().lower()
+        quality = 1.0
+        for param in parts[1:]:
+            param = param.strip()
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if name:
+            accepted[name] = quality
+
+    for name, _ in ENCODERS:
+        if accepted.get(name, accepted.get('*', 0)) > 0:
+            return name
+    return None
+
+
+def _encoder(name):
+    level = current_app.config.get('COMPRESS_LEVEL', 6)
+    return dict(ENCODERS)[name](level)
+
+
+def _compress_stream(iterable, encoder):
+    """ Compresses a streamed response, flushing after every chunk so the client gets data as it is produced. """
+
+    try:
+        for chunk in iterable:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if chunk:
+                yield encoder.compress(chunk) + encoder.flush()
+        yield encoder.finish()
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+
+
+def compress_response(response):
+    """ Compresses the response body if the client accepts it and it is worth compressing. """
+
+    config = current_app.config
+    if not config.get('COMPRESS_ENABLED', True):
+        return response
+
+    if response.mimetype not in config.get('COMPRESS_MIMETYPES', ()):
+        return response
+
+    response.vary.add('Accept-Encoding')
+
+    if (request.method == 'HEAD' or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers or 'Content-Range' in response.headers):
+        return response
+
+    encoding = negotiate(request.headers.get('Accept-Encoding', ''))
+    if not encoding:
+        return response
+
+    if response.is_streamed:
+        response.direct_passthrough = False
+        response.response = _compress_stream(response.response, _encoder(encoding))
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config.get('COMPRESS_MIN_SIZE', 1024):
+            return response
+
+        encoder = _encoder(encoding)
+        compressed = encoder.compress(data) + encoder.finish()
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+
+    response.headers['Content-Encoding'] = encoding
+
+    # The compressed body is no longer byte-for-byte the same entity.
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+    return response
+
+
+def init_compression(app):
+    app.after_request(compress_response)
@@ -0,0 +1,171 @@
+import logging
+import time
+
+import flask_sqlalchemy
+from flask import g, has_request_context
+from flask_sqlalchemy import get_state, SignallingSession
+from prometheus_client import Gauge, Histogram
+from sqlalchemy import event, exc, orm
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.dml import UpdateBase
+
+logger = logging.getLogger(__name__)
+
+"""
+CONNECTION POOL
+
+The pool settings come from the SQLALCHEMY_POOL_* config values (see ProductionConfig). Two things are
+added on top of the stock QueuePool:
+
+ - Checkouts are timed and the pool usage is exported as metrics, so pool exhaustion shows up as
+   wait time instead of as mysteriously slow requests.
+
+ - Stale connections are detected without a round trip on every checkout. A connection is only pinged
+   if it sat idle in the pool for longer than SQLALCHEMY_POOL_PING_IDLE seconds, which is when MySQL's
+   wait_timeout or a network device may have dropped it. A failed ping is raised as a
+   DisconnectionError, so the pool throws the connection away and transparently tries another one.
+"""
+
+
+POOL_WAIT = Histogram('sip_db_pool_wait_seconds', 'Time spent waiting to check out a database connection',
+                      ['pool'], buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, float('inf')))
+POOL_CHECKED_OUT = Gauge('sip_db_pool_checked_out', 'Database connections currently checked out',
+                         ['pool'], multiprocess_mode='livesum')
+POOL_OVERFLOW = Gauge('sip_db_pool_overflow', 'Database connections currently open beyond the pool size',
+                      ['pool'], multiprocess_mode='livesum')
+POOL_SIZE = Gauge('sip_db_pool_size', 'Configured size of the database connection pool',
+                  ['pool'], multiprocess_mode='livesum')
+
+# Checkouts that wait longer than this many seconds are logged.
+SLOW_CHECKOUT = 1.0
+
+
+class TimedQueuePool(QueuePool):
+    """ QueuePool that records its checkout wait time and usage. """
+
+    # Set on the subclasses created by timed_pool_class.
+    label = 'default'
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super(TimedQueuePool, self)._do_get()
+        finally:
+            wait = time.perf_counter() - start
+            POOL_WAIT.labels(self.label).observe(wait)
+            if wait > SLOW_CHECKOUT:
+                logger.warning('Waited {:.2f}s for a database connection: {}'.format(wait, self.status()))
+            self._record_usage()
+
+    def _do_return_conn(self, conn):
+        super(TimedQueuePool, self)._do_return_conn(conn)
+        self._record_usage()
+
+    def _record_usage(self):
+        POOL_CHECKED_OUT.labels(self.label).set(self.checkedout())
+        POOL_OVERFLOW.labels(self.label).set(max(self.overflow(), 0))
+        POOL_SIZE.labels(self.label).set(self.size())
+
+
+@event.listens_for(TimedQueuePool, 'checkin')
+def _checkin(dbapi_connection, connection_record):
+    connection_record.info['checkin_time'] = time.monotonic()
+
+
+def _ping_stale(ping_idle):
+    """ Returns a checkout listener that pings connections that were idle for longer than ping_idle seconds. """
+
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        checkin_time = connection_record.info.get('checkin_time')
+
+        # Connections that were just opened or recently used are trusted as-is.
+        if checkin_time is None or time.monotonic() - checkin_time < ping_idle:
+            return
+
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        except Exception:
+            raise exc.DisconnectionError()
+        finally:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+
+    return checkout
+
+
+_pool_classes = {}
+
+
+def timed_pool_class(label, ping_idle):
+    """ Returns a TimedQueuePool subclass that reports its metrics under the given label and pings idle connections. """
+
+    key = (label, ping_idle)
+    if key not in _pool_classes:
+        cls = type('TimedQueuePool', (TimedQueuePool,), {'label': label})
+        if ping_idle is not None:
+            event.listen(cls, 'checkout', _ping_stale(ping_idle))
+        _pool_classes[key] = cls
+    return _pool_classes[key]
+
+
+"""
+READ REPLICA
+
+If a "replica" bind is configured in SQLALCHEMY_BINDS, the GET requests that go through check_apikey
+read from it. A session switches to the primary for good as soon as it flushes or executes an
+INSERT/UPDATE/DELETE, so anything read after a write in the same request sees that write.
+"""
+
+
+REPLICA_BIND = 'replica'
+
+
+def use_replica():
+    """ Marks the current request as read-only so that its queries can be sent to the replica. """
+
+    g.use_replica = True
+
+
+class RoutingSession(SignallingSession):
+    """ Session that sends the queries of read-only requests to the replica until something is written. """
+
+    def __init__(self, db, **options):
+        super(RoutingSession, self).__init__(db, **options)
+        self._wrote = False
+
+    def _replica_engine(self):
+        if self._wrote or not has_request_context() or not g.get('use_replica'):
+            return None
+        if REPLICA_BIND not in (self.app.config.get('SQLALCHEMY_BINDS') or {}):
+            return None
+        return get_state(self.app).db.get_engine(self.app, bind=REPLICA_BIND)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or isinstance(clause, UpdateBase):
+            self._wrote = True
+        else:
+            engine = self._replica_engine()
+            if engine is not None:
+                return engine
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class SQLAlchemy(flask_sqlalchemy.SQLAlchemy):
+    """ Flask-SQLAlchemy extension that uses the timed and idle-pinged connection pool and routes reads to a
+    replica when one is configured. """
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, info, options):
+        super(SQLAlchemy, self).apply_driver_hacks(app, info, options)
+
+        # SQLite uses its own pool classes.
+        if info.drivername.startswith('sqlite'):
+            return
+
+        label = '{}/{}'.format(info.host or 'localhost', info.database or '')
+        options['poolclass'] = timed_pool_class(label, app.config.get('SQLALCHEMY_POOL_PING_IDLE'))
@@ -1,24 +1,30 @@
-from flask import request
+from flask import current_app, request
 
 from project import db
 from project.errors import bp
-from project.api.errors import error_response
-from project.gui.views import DefaultView
+from project.helpers import error_response
+
+
+def _is_api_request():
+    """ API requests (and every request in API-only mode) get JSON errors instead of GUI pages. """
+
+    return request.path.startswith('/api/') or current_app.config.get('APP_MODE', 'all') == 'api'
 
 
 @bp.app_errorhandler(404)
 def not_found_error(error):
-    if request.path.startswith('/api/'):
+    if _is_api_request():
         return error_response(404, 'API endpoint not found')
     else:
+        from project.gui.views import DefaultView
         return DefaultView().render('errors/404.html'), 404
 
 
 @bp.app_errorhandler(500)
 def internal_error(error):
-    if request.path.startswith('/api/'):
+    if _is_api_request():
         db.session.rollback()
         return error_response(500, 'Internal server error')
     else:
-
+        from project.gui.views import DefaultView
         return DefaultView().render('errors/500.html'), 500
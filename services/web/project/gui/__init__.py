@@ -1,9 +1,11 @@
 from flask import Blueprint
+from flask_admin import Admin
 
-from project import admin, db, models
-from project.gui.views import AdminView, AdminUserView, AnalystView, CampaignView, IndicatorView, LoginMenuLink, \
+from project import db, models
+from project.gui.views import AdminRoleView, AdminUserView, AnalystView, CampaignView, IndicatorView, LoginMenuLink, \
     LogoutMenuLink
 
+admin = Admin(name='SIP', url='/SIP')
 bp = Blueprint('gui', __name__)
 
 admin.add_view(CampaignView(models.Campaign, db.session, category='Campaigns'))
@@ -20,7 +22,7 @@ admin.add_view(AnalystView(models.IntelSource, db.session, category='Intel'))
 
 admin.add_view(AnalystView(models.Tag, db.session))
 
-admin.add_view(AdminView(models.Role, db.session, category='Admin'))
+admin.add_view(AdminRoleView(models.Role, db.session, category='Admin'))
 admin.add_view(AdminUserView(models.User, db.session, category='Admin'))
 
 admin.add_link(LoginMenuLink(name='Login', url='/login'))
@@ -8,7 +8,10 @@ from flask_security import current_user
 from flask_security.utils import hash_password
 from wtforms import PasswordField, validators
 
+from project.apikeys import invalidate_apikey_cache
 from project.config import BaseConfig
+from project.models import IndicatorFacetCount
+from project.queries import refresh_saved_searches
 
 
 # Restrict access to 'admin' users
@@ -58,8 +61,34 @@ class CampaignView(AnalystView):
 
 
 class IndicatorView(AnalystView):
-    column_exclude_list = ('children', 'parent', 'equal',)
-    form_excluded_columns = ('children', 'parent', 'equal', 'created_time', 'modified_time',)
+    column_exclude_list = ('children', 'parent', 'equal', 'value_hash',)
+    form_excluded_columns = ('children', 'parent', 'equal', 'created_time', 'modified_time', 'value_hash',)
+
+    # Remember the indicator's facet values before the form changes them so that the facet counts can be adjusted.
+    def update_model(self, form, model):
+        model.old_facet_keys = model.facet_keys()
+        return super(IndicatorView, self).update_model(form, model)
+
+    # Keep the facet counts and saved searches in sync with indicators that are created or edited through the GUI.
+    def on_model_change(self, form, model, is_created):
+        self.session.flush()
+        old_facet_keys = set() if is_created else model.old_facet_keys
+        new_facet_keys = model.facet_keys()
+        IndicatorFacetCount.apply(new_facet_keys - old_facet_keys, old_facet_keys - new_facet_keys)
+        refresh_saved_searches([model])
+
+    def on_model_delete(self, model):
+        IndicatorFacetCount.apply(set(), model.facet_keys())
+
+
+# Changes to a Role must not wait for the cached API key roles to expire.
+class AdminRoleView(AdminView):
+
+    def after_model_change(self, form, model, is_created):
+        invalidate_apikey_cache()
+
+    def after_model_delete(self, model):
+        invalidate_apikey_cache()
 
 
 # Enable editing of Users but replace the 'password' field with a separate one that gets hashed upon submit.
@@ -95,6 +124,10 @@ class AdminUserView(AdminView):
     def on_model_change(self, form, model, is_created):
         model.password = hash_password(model.password2)
 
+    # Changes to a User's API key, roles or active flag must not wait for the cached copy to expire.
+    def after_model_change(self, form, model, is_created):
+        invalidate_apikey_cache()
+
 
 # Basic view that everyone can see
 class DefaultView(BaseView):
@@ -0,0 +1,7 @@
+"""
+BULK IMPORTERS
+
+The importers turn an input file into normalized indicator records (see project.importers.writer)
+and hand them to an IndicatorWriter, which writes them in batches with Core executemany statements
+instead of building an ORM object for every row.
+"""
@@ -0,0 +1,69 @@
+import inspect
+
+import click
+from flask.cli import AppGroup, with_appcontext
+
+"""
+IMPORT COMMANDS
+
+"flask import <parser> PATH" imports a file with one of the registered parsers (see project.importers.plugins).
+Every command has the options below on top of the parser's own.
+"""
+
+
+class ImportGroup(AppGroup):
+    """ The "flask import" group. Its commands are only built the first time the group is used, since loading the
+    parsers imports the whole import pipeline, which the processes that serve requests never need. """
+
+    def __init__(self, plugins=()):
+        super(ImportGroup, self).__init__('import', help='Imports indicators from files.')
+        self.plugins = plugins
+        self.loaded = False
+
+    def _load(self):
+        if not self.loaded:
+            from project.importers.plugins import load_plugins
+            for parser_class in load_plugins(self.plugins).values():
+                self.add_command(parser_command(parser_class))
+            self.loaded = True
+
+    def list_commands(self, ctx):
+        self._load()
+        return super(ImportGroup, self).list_commands(ctx)
+
+    def get_command(self, ctx, name):
+        self._load()
+        return super(ImportGroup, self).get_command(ctx, name)
+
+
+def parser_command(parser_class):
+    """ Returns the click command that imports files with the given parser class. """
+
+    def callback(path, username, tags, batch_size, resume, **options):
+        from project.importers.plugins import import_file
+
+        try:
+            parser = parser_class(**options)
+        except ValueError as e:
+            raise click.UsageError(str(e))
+
+        stats = import_file(parser, path, username=username, tags=tags, batch_size=batch_size, resume=resume)
+        click.echo(str(stats))
+
+    params = [
+        click.Argument(['path'], type=click.Path(exists=True, dir_okay=False)),
+        click.Option(['--username'], help='User that owns the indicators that do not name one'),
+        click.Option(['--tag', 'tags'], multiple=True, help='Tag to add to every indicator'),
+        click.Option(['--batch-size'], default=5000, show_default=True,
+                     help='Number of indicators written per transaction'),
+        click.Option(['--resume'], is_flag=True, help='Continue after the last batch that a previous import committed'),
+    ]
+
+    return click.Command(parser_class.name, callback=with_appcontext(callback),
+                         params=params + list(parser_class.params), help=inspect.cleandoc(parser_class.__doc__ or ''))
+
+
+def init_import_commands(app):
+    """ Registers the import group with the app's CLI. """
+
+    app.cli.add_command(ImportGroup(app.config.get('IMPORT_PLUGINS', [])))
@@ -0,0 +1,331 @@
+import json
+import multiprocessing
+from collections import deque
+
+import jsonschema
+from dateutil.parser import parse
+from flask import current_app
+
+from project import db
+from project.importers.jsonstream import iter_array
+from project.importers.writer import ImportStats, IndicatorWriter, select_ids, start_position
+from project.models import Campaign, CampaignAlias, ImportCheckpoint, TableVersion
+
+"""
+CRITS
+
+Imports the campaigns and indicators exported from the CRITS MongoDB. The campaigns are one JSON array,
+which is read one item at a time (see project.importers.jsonstream). The indicators are one JSON
+document per line.
+
+Parsing a line (JSON decoding, schema validation and date parsing) costs more CPU than writing it, so
+with more than one worker the lines are parsed by a process pool in chunks of PARSE_CHUNK_SIZE. The
+parsed chunks are handed to the single IndicatorWriter in file order, which keeps the dedupe (first
+occurrence wins) and the batch contents the same as a serial import. Only a few chunks per worker are
+in flight at a time, so memory does not grow with the size of the file.
+
+Every committed batch records a checkpoint with the line number it ended on. With resume, the lines up
+to the latest checkpoint are skipped without being parsed. Without it, the old checkpoints are deleted
+and the import starts over.
+"""
+
+
+# Number of lines sent to a worker process at a time.
+PARSE_CHUNK_SIZE = 1000
+
+# The names the checkpoints of the imports are recorded under.
+CAMPAIGNS_CHECKPOINT = 'crits_campaigns'
+INDICATORS_CHECKPOINT = 'crits_indicators'
+
+CAMPAIGN_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'aliases': {
+            'type': 'array',
+            'items': {'type': 'string', 'maxLength': 255}
+        },
+        'created': {
+            'type': 'object',
+            'properties': {
+                '$date': {'type': 'string', 'minLength': 24, 'maxLength': 24}
+            }
+        },
+        'modified': {
+            'type': 'object',
+            'properties': {
+                '$date': {'type': 'string', 'minLength': 24, 'maxLength': 24}
+            }
+        },
+        'name': {'type': 'string', 'minLength': 1, 'maxLength': 255}
+    },
+    'required': ['aliases', 'created', 'modified', 'name']
+}
+
+INDICATOR_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'bucket_list': {
+            'type': 'array',
+            'items': {'type': 'string', 'maxLength': 255}
+        },
+        'campaign': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'name': {'type': 'string', 'maxLength': 255}
+                }
+            }
+        },
+        'confidence': {
+            'type': 'object',
+            'properties': {
+                'rating': {'type': 'string', 'minLength': 1, 'maxLength': 255}
+            }
+        },
+        'created': {
+            'type': 'object',
+            'properties': {
+                '$date': {'type': 'string', 'minLength': 24, 'maxLength': 24}
+            }
+        },
+        'impact': {
+            'type': 'object',
+            'properties': {
+                'rating': {'type': 'string', 'minLength': 1, 'maxLength': 255}
+            }
+        },
+        'modified': {
+            'type': 'object',
+            'properties': {
+                '$date': {'type': 'string', 'minLength': 24, 'maxLength': 24}
+            }
+        },
+        'source': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'instances': {
+                        'type': 'array',
+                        'items': {
+                            'type': 'object',
+                            'properties': {
+                                'analyst': {'type': 'string', 'minLength': 1, 'maxLength': 255},
+                                'reference': {'type': 'string', 'maxLength': 512}
+                            }
+                        }
+                    },
+                    'name': {'type': 'string', 'minLength': 1, 'maxLength': 255}
+                }
+            }
+        },
+        'status': {'type': 'string', 'minLength': 1, 'maxLength': 255},
+        'type': {'type': 'string', 'minLength': 1, 'maxLength': 255},
+        'value': {'type': 'string', 'minLength': 1}
+    },
+    'required': ['confidence', 'created', 'impact', 'modified', 'source', 'status', 'type', 'value']
+}
+
+
+def parse_campaign(campaign):
+    """ Validates one item of the CRITS campaigns export and returns the campaign's name, times and aliases. """
+
+    jsonschema.validate(campaign, CAMPAIGN_SCHEMA)
+    return {'name': campaign['name'],
+            'created_time': parse(campaign['created']['$date'], ignoretz=True),
+            'modified_time': parse(campaign['modified']['$date'], ignoretz=True),
+            'aliases': campaign['aliases']}
+
+
+def parse_indicator(line):
+    """ Parses and validates one line of the CRITS indicators export into a normalized indicator record. """
+
+    indicator = json.loads(line)
+    jsonschema.validate(indicator, INDICATOR_SCHEMA)
+
+    references = []
+    for source in indicator['source']:
+        for instance in source['instances']:
+            if instance.get('reference') and (source['name'], instance['reference']) not in references:
+                references.append((source['name'], instance['reference']))
+
+    return {'type': indicator['type'],
+            'value': indicator['value'],
+            'username': indicator['source'][0]['instances'][0]['analyst'],
+            'confidence': indicator['confidence']['rating'],
+            'impact': indicator['impact']['rating'],
+            'status': indicator['status'],
+            'created_time': parse(indicator['created']['$date'], ignoretz=True),
+            'modified_time': parse(indicator['modified']['$date'], ignoretz=True),
+            'campaigns': sorted(set(c['name'] for c in indicator.get('campaign') or [] if c.get('name'))),
+            'tags': sorted(set(indicator.get('bucket_list') or [])),
+            'references': references}
+
+
+def parse_chunk(chunk):
+    """ Parses a chunk of (line number, line) tuples into (line number, record, error) tuples.
+
+    This runs in the worker processes, so the errors are returned as strings that can be pickled. """
+
+    results = []
+    for line_number, line in chunk:
+        try:
+            results.append((line_number, parse_indicator(line), None))
+        except jsonschema.ValidationError as e:
+            results.append((line_number, None, e.message))
+        except (IndexError, KeyError, ValueError) as e:
+            results.append((line_number, None, repr(e)))
+    return results
+
+
+def _chunks(f, size, skip=0):
+    """ Yields the non-empty lines of a file after the first skip lines in chunks of (line number, line) tuples. """
+
+    chunk = []
+    for line_number, line in enumerate(f, start=1):
+        if line_number > skip and line.strip():
+            chunk.append((line_number, line))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _parsed_chunks(chunks, workers):
+    """ Yields the parsed chunks in order, parsing them in a process pool if there is more than one worker. """
+
+    if workers <= 1:
+        for chunk in chunks:
+            yield parse_chunk(chunk)
+        return
+
+    # Pool.imap would read the whole file into its task queue, so the chunks are submitted as the results are used.
+    with multiprocessing.Pool(workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(parse_chunk, (chunk,)))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+def import_indicators(path, batch_size=5000, workers=1, resume=False):
+    """ Imports the CRITS indicators export at the given path. Returns the ImportStats. """
+
+    skip = start_position(INDICATORS_CHECKPOINT, resume, 'CRITS IMPORT')
+    writer = IndicatorWriter(batch_size=batch_size, label='CRITS IMPORT', checkpoint=INDICATORS_CHECKPOINT,
+                             position=skip)
+
+    with open(path) as f:
+        for results in _parsed_chunks(_chunks(f, PARSE_CHUNK_SIZE, skip=skip), workers):
+            for line_number, record, error in results:
+                if error:
+                    writer.reject(line_number, error)
+                else:
+                    writer.add(record, position=line_number)
+
+    stats = writer.finish()
+    current_app.logger.info('CRITS IMPORT: Finished importing indicators: {}'.format(stats))
+    return stats
+
+
+def _write_campaigns(campaigns, stats, seen_aliases):
+    """ Writes a batch of parsed campaigns without committing it.
+
+    Campaigns that already exist are skipped along with their aliases, and so are aliases that already exist. """
+
+    if not campaigns:
+        return
+
+    existing = select_ids(Campaign.name, set(c['name'] for c in campaigns))
+    new = [c for c in campaigns if c['name'] not in existing]
+    stats.duplicates += len(campaigns) - len(new)
+    if not new:
+        return
+
+    db.session.execute(Campaign.__table__.insert(),
+                       [{'name': c['name'], 'created_time': c['created_time'], 'modified_time': c['modified_time']}
+                        for c in new])
+    ids = select_ids(Campaign.name, set(c['name'] for c in new))
+    stats.imported += len(new)
+    written = {Campaign.__tablename__}
+
+    aliases = {}
+    for campaign in new:
+        for alias in campaign['aliases']:
+            if alias.lower() not in seen_aliases:
+                seen_aliases.add(alias.lower())
+                aliases[alias] = ids[campaign['name']]
+    for alias in select_ids(CampaignAlias.alias, set(aliases)):
+        del aliases[alias]
+
+    if aliases:
+        db.session.execute(CampaignAlias.__table__.insert().prefix_with('IGNORE'),
+                           [{'alias': alias, 'campaign_id': _id} for alias, _id in sorted(aliases.items())])
+        written.add(CampaignAlias.__tablename__)
+
+    TableVersion.bump(db.session.connection(), written)
+
+
+def import_campaigns(path, batch_size=1000, resume=False):
+    """ Imports the CRITS campaigns export at the given path. Returns the ImportStats.
+
+    Each batch resolves its existing campaigns and aliases with one SELECT each and inserts the new ones
+    with one executemany each, then commits along with its checkpoint. Duplicates within the file are
+    detected with sets of the names and aliases that were already seen. """
+
+    skip = start_position(CAMPAIGNS_CHECKPOINT, resume, 'CRITS IMPORT')
+    stats = ImportStats()
+    checkpointed = (0, 0, 0, 0)
+    seen_names = set()
+    seen_aliases = set()
+    batch = []
+    position = skip
+
+    def flush():
+        nonlocal batch, checkpointed
+        _write_campaigns(batch, stats, seen_aliases)
+        counts = (stats.read, stats.imported, stats.duplicates, stats.failed)
+        read, imported, duplicates, failed = [now - then for now, then in zip(counts, checkpointed)]
+        ImportCheckpoint.record(CAMPAIGNS_CHECKPOINT, position, read=read, imported=imported,
+                                duplicates=duplicates, failed=failed)
+        db.session.commit()
+        batch = []
+        checkpointed = counts
+        current_app.logger.info('CRITS IMPORT: {} (position {})'.format(stats, position))
+
+    with open(path) as f:
+        for position, item in enumerate(iter_array(f), start=1):
+
+            # Skip the campaigns that a previous import already committed.
+            if position <= skip:
+                continue
+
+            stats.read += 1
+            try:
+                campaign = parse_campaign(item)
+            except (jsonschema.ValidationError, ValueError) as e:
+                stats.failed += 1
+                error = getattr(e, 'message', e)
+                current_app.logger.warning('CRITS IMPORT: Skipping invalid campaign {}: {}'.format(position, error))
+                continue
+
+            # Skip this campaign if it is a duplicate.
+            if campaign['name'].lower() in seen_names:
+                current_app.logger.warning('CRITS IMPORT: Skipping duplicate campaign: {}'.format(campaign['name']))
+                stats.duplicates += 1
+                continue
+            seen_names.add(campaign['name'].lower())
+
+            batch.append(campaign)
+            if len(batch) >= batch_size:
+                flush()
+
+    if batch or stats.read > checkpointed[0]:
+        flush()
+
+    current_app.logger.info('CRITS IMPORT: Finished importing campaigns: {}'.format(stats))
+    return stats
@@ -0,0 +1,139 @@
+import csv
+
+import click
+from dateutil.parser import parse
+
+from project.helpers import parse_boolean
+from project.importers.plugins import IndicatorParser, register_parser
+
+"""
+DELIMITED FILES
+
+Imports indicators from CSV or TSV files. The column map says which column holds which indicator field,
+for example:
+
+    flask import csv indicators.csv --header --columns "type=Type,value=Indicator,tags=Tags"
+    flask import tsv indicators.tsv --columns "value=0,tags=2" --set "type=URI - URL" --username analyst
+
+Columns are given by their 0-based index, or by their name when the file has a header row. Fields that
+are the same for every row can be set with --set instead.
+"""
+
+
+# The record fields a column can be mapped to.
+FIELDS = ('campaigns', 'case_sensitive', 'confidence', 'created_time', 'impact', 'modified_time', 'reference', 'source',
+          'status', 'substring', 'tags', 'type', 'username', 'value')
+
+LIST_FIELDS = ('campaigns', 'tags')
+BOOLEAN_FIELDS = ('case_sensitive', 'substring')
+TIME_FIELDS = ('created_time', 'modified_time')
+
+
+def _pairs(value, option):
+    """ Parses "field=value" pairs and makes sure the fields are known. """
+
+    pairs = {}
+    for item in value:
+        field, sep, column = item.partition('=')
+        field = field.strip()
+        if not sep or not column.strip():
+            raise ValueError('Invalid {} (expected field=value): {}'.format(option, item))
+        if field not in FIELDS:
+            raise ValueError('Invalid {} field: {}'.format(option, field))
+        pairs[field] = column.strip()
+    return pairs
+
+
+@register_parser
+class CsvParser(IndicatorParser):
+    """ Imports indicators from a comma-separated file using a column map. """
+
+    name = 'csv'
+    delimiter = ','
+    params = [
+        click.Option(['--columns'], required=True,
+                     help='Comma-separated field=column pairs. Columns are 0-based indexes or header names'),
+        click.Option(['--set', 'constants'], multiple=True, help='field=value to use for every row'),
+        click.Option(['--header'], is_flag=True, help='The first row is a header row'),
+        click.Option(['--delimiter'], default=None, help='Column delimiter (overrides the default of the format)'),
+        click.Option(['--list-separator'], default=',', show_default=True,
+                     help='Separator of the values in the campaigns and tags columns'),
+    ]
+
+    def __init__(self, columns, constants=(), header=False, delimiter=None, list_separator=',', **options):
+        super(CsvParser, self).__init__(**options)
+        self.columns = _pairs(columns.split(','), 'column')
+        self.constants = _pairs(constants, 'value')
+        self.header = header
+        self.list_separator = list_separator
+        if delimiter:
+            self.delimiter = delimiter.replace('\\t', '\t')
+
+        if not header:
+            for field, column in self.columns.items():
+                if not column.isdigit():
+                    raise ValueError('Column {} must be an index without --header: {}'.format(field, column))
+
+        if ('reference' in self.columns or 'reference' in self.constants) != \
+                ('source' in self.columns or 'source' in self.constants):
+            raise ValueError('The reference and source fields must be used together')
+
+    def _indexes(self, header):
+        indexes = {}
+        for field, column in self.columns.items():
+            if column.isdigit():
+                indexes[field] = int(column)
+            elif column in header:
+                indexes[field] = header.index(column)
+            else:
+                raise ValueError('Column not found in the header row: {}'.format(column))
+        return indexes
+
+    def _record(self, values):
+        record = {}
+        for field, value in values.items():
+            value = value.strip()
+
+            # Empty cells fall back to the defaults.
+            if not value:
+                continue
+
+            if field in LIST_FIELDS:
+                value = sorted(set(v.strip() for v in value.split(self.list_separator) if v.strip()))
+            elif field in BOOLEAN_FIELDS:
+                value = parse_boolean(value, default=False)
+            elif field in TIME_FIELDS:
+                value = parse(value, ignoretz=True)
+            record[field] = value
+
+        source = record.pop('source', None)
+        reference = record.pop('reference', None)
+        if source and reference:
+            record['references'] = [(source, reference)]
+        return record
+
+    def records(self, f):
+        reader = csv.reader(f, delimiter=self.delimiter)
+        indexes = self._indexes(next(reader, []) if self.header else [])
+
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+
+            try:
+                values = dict(self.constants)
+                values.update((field, row[index]) for field, index in indexes.items())
+                record = self._record(values)
+            except (IndexError, ValueError, OverflowError) as e:
+                yield reader.line_num, None, repr(e)
+                continue
+
+            yield reader.line_num, record, None
+
+
+@register_parser
+class TsvParser(CsvParser):
+    """ Imports indicators from a tab-separated file using a column map. """
+
+    name = 'tsv'
+    delimiter = '\t'
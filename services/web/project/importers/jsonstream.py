@@ -0,0 +1,76 @@
+import json
+import re
+
+"""
+STREAMING JSON
+
+json.load needs the whole document in memory. Exports that are one big JSON array are instead read a
+block at a time and decoded one item at a time, so memory is bounded by the largest item rather than
+by the file.
+"""
+
+
+_WHITESPACE = re.compile(r'\s*')
+
+
+def iter_array(f, read_size=65536):
+    """ Yields the items of the JSON array in a text file one at a time. Raises ValueError if it is not an array. """
+
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    state = 'start'
+
+    while True:
+        pos = _WHITESPACE.match(buffer, pos).end()
+
+        # Read the next block when the buffer runs out or an item is cut off at the end of it.
+        if pos == len(buffer) or state == 'more':
+            if eof:
+                raise ValueError('Unexpected end of the JSON array')
+            # Reading at least as much as is buffered keeps an item that spans many blocks linear to decode.
+            block = f.read(max(read_size, len(buffer) - pos))
+            eof = not block
+            buffer = buffer[pos:] + block
+            pos = 0
+            if state == 'more':
+                state = 'item'
+            continue
+
+        char = buffer[pos]
+
+        if state == 'start':
+            if char != '[':
+                raise ValueError('Expected a JSON array')
+            pos += 1
+            state = 'first'
+
+        elif state == 'separator':
+            if char == ']':
+                return
+            if char != ',':
+                raise ValueError('Expected "," or "]" at {} in the JSON array'.format(buffer[pos:pos + 20]))
+            pos += 1
+            state = 'item'
+
+        elif state == 'first' and char == ']':
+            return
+
+        else:
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                if eof:
+                    raise
+                state = 'more'
+                continue
+
+            # A number at the end of the buffer may continue in the next block.
+            if end == len(buffer) and not eof:
+                state = 'more'
+                continue
+
+            pos = end
+            state = 'separator'
+            yield item
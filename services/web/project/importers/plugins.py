@@ -0,0 +1,99 @@
+import importlib
+import os
+
+from flask import current_app
+
+from project.importers.writer import IndicatorWriter, start_position
+
+"""
+IMPORT PLUGINS
+
+Each "flask import <name>" command is backed by an IndicatorParser. A parser only has to turn its input
+file into normalized indicator records (see project.importers.writer). Everything else is shared: the
+records of every parser go through the same batched IndicatorWriter, which also gives every command
+checkpoints and --resume.
+
+Parsers register themselves with the register_parser decorator. The built-in ones live in this package,
+and the modules listed in the IMPORT_PLUGINS config value are imported to register more.
+"""
+
+
+PARSERS = {}
+
+BUILTIN_PLUGINS = ('project.importers.delimited', 'project.importers.stix')
+
+
+def register_parser(parser_class):
+    """ Class decorator that makes a parser available as a "flask import" command. """
+
+    PARSERS[parser_class.name] = parser_class
+    return parser_class
+
+
+def load_plugins(modules=()):
+    """ Imports the built-in parsers and the given plugin modules. Returns the registered parsers by name. """
+
+    for module in BUILTIN_PLUGINS + tuple(modules):
+        importlib.import_module(module)
+    return PARSERS
+
+
+class IndicatorParser(object):
+    """
+    Base class of the import parsers. Subclasses set the command name, list any extra click options in params
+    (their values are passed to __init__ as keyword arguments) and implement records(). The class docstring is
+    the help text of the command.
+    """
+
+    name = None
+    params = []
+
+    def __init__(self, **options):
+        pass
+
+    def records(self, f):
+        """ Yields a (position, record, error) tuple for every record in the open input file.
+
+        The position locates the record in the file (ex: its line number) for the log messages and the
+        checkpoints, so it must increase with every record. A record that could not be parsed is yielded
+        as None along with an error message. """
+
+        raise NotImplementedError
+
+
+REQUIRED_FIELDS = ('type', 'value', 'username')
+
+
+def import_file(parser, path, username=None, tags=(), batch_size=5000, resume=False):
+    """ Imports a file with the given parser. Returns the ImportStats.
+
+    The username is used for the records that do not have one, and the tags are added to every record. """
+
+    label = '{} IMPORT'.format(parser.name.upper())
+    checkpoint = '{}:{}'.format(parser.name, os.path.abspath(path))[:255]
+    skip = start_position(checkpoint, resume, label)
+    writer = IndicatorWriter(batch_size=batch_size, label=label, checkpoint=checkpoint, position=skip)
+
+    with open(path, newline='', encoding='utf-8') as f:
+        for position, record, error in parser.records(f):
+            if position <= skip:
+                continue
+
+            if not error:
+                if username and not record.get('username'):
+                    record['username'] = username
+                if tags:
+                    record['tags'] = sorted(set(record.get('tags', [])) | set(tags))
+
+                missing = [field for field in REQUIRED_FIELDS if not record.get(field)]
+                if missing:
+                    error = 'Missing {}'.format(', '.join(missing))
+
+            if error:
+                writer.reject(position, error)
+            else:
+                writer.add(record, position=position)
+
+    stats = writer.finish()
+    current_app.logger.info('{}: Finished importing {}: {}'.format(label, path, stats))
+    return stats
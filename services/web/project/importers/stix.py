@@ -0,0 +1,154 @@
+import json
+import re
+
+import click
+from dateutil.parser import parse
+
+from project.importers.plugins import IndicatorParser, register_parser
+
+"""
+STIX
+
+Imports indicators from STIX 2.0 and 2.1 bundles. Indicators are read from:
+
+ - indicator objects whose pattern is made of equality comparisons joined by OR. Every comparison
+   becomes its own indicator, since SIP has no way to store a conjunction. Patterns that use any other
+   operator are skipped.
+
+ - The cyber observables inside observed-data objects (STIX 2.0) and top-level cyber observables (STIX 2.1).
+
+The object paths (ex: ipv4-addr:value or file:hashes.MD5) are mapped to SIP indicator types with
+STIX_TYPES, which --type can extend. Values at any other path are ignored. The labels and indicator
+types become tags, the external references become intel references, and the campaigns an indicator
+"indicates" become its campaigns.
+
+The whole bundle is loaded, because relationships can appear anywhere in it.
+"""
+
+
+STIX_TYPES = {
+    'domain-name:value': 'URI - Domain Name',
+    'email-addr:value': 'Email - Address',
+    'email-message:subject': 'Email - Subject',
+    'file:hashes.MD5': 'Hash - MD5',
+    'file:hashes.SHA-1': 'Hash - SHA1',
+    'file:hashes.SHA-256': 'Hash - SHA256',
+    'ipv4-addr:value': 'Address - ipv4-addr',
+    'ipv6-addr:value': 'Address - ipv6-addr',
+    'url:value': 'URI - URL',
+}
+
+# Objects that are never cyber observables.
+NON_OBSERVABLES = ('attack-pattern', 'bundle', 'campaign', 'course-of-action', 'grouping', 'identity', 'indicator',
+                   'infrastructure', 'intrusion-set', 'location', 'malware', 'malware-analysis', 'marking-definition',
+                   'note', 'observed-data', 'opinion', 'relationship', 'report', 'sighting', 'threat-actor', 'tool',
+                   'vulnerability')
+
+_STRING = r"'(?:[^'\\]|\\.)*'"
+_COMPARISON = re.compile(r"([a-z0-9-]+:[\w.'-]+)\s*=\s*(" + _STRING + ")")
+_OTHER_OPERATORS = re.compile(r"\b(AND|FOLLOWEDBY|NOT|LIKE|MATCHES|IN|ISSUBSET|ISSUPERSET|WITHIN|REPEATS|START|STOP)\b|"
+                              r"!=|<|>")
+
+
+def _unquote(string):
+    """ Returns the value of a STIX pattern string literal. """
+
+    return re.sub(r'\\(.)', r'\1', string[1:-1])
+
+
+def pattern_comparisons(pattern):
+    """ Returns the (object path, value) of each comparison in a pattern of equality comparisons joined by OR.
+
+    Raises ValueError for any other pattern. """
+
+    without_strings = re.sub(_STRING, "''", pattern)
+    if _OTHER_OPERATORS.search(without_strings):
+        raise ValueError('Unsupported pattern: {}'.format(pattern))
+
+    comparisons = [(path.replace("'", ''), _unquote(value)) for path, value in _COMPARISON.findall(pattern)]
+    if not comparisons:
+        raise ValueError('Unsupported pattern: {}'.format(pattern))
+    return comparisons
+
+
+def observable_values(observable):
+    """ Yields the (object path, value) of each string property (and hash) of a cyber observable. """
+
+    for key, value in sorted(observable.items()):
+        if key == 'hashes' and isinstance(value, dict):
+            for name, digest in sorted(value.items()):
+                yield '{}:hashes.{}'.format(observable['type'], name), digest
+        elif isinstance(value, str) and key not in ('id', 'type', 'spec_version'):
+            yield '{}:{}'.format(observable['type'], key), value
+
+
+@register_parser
+class StixParser(IndicatorParser):
+    """ Imports the indicators and cyber observables of a STIX 2.x bundle. """
+
+    name = 'stix'
+    params = [
+        click.Option(['--type', 'types'], multiple=True,
+                     help='"object path=indicator type" to add to or override the default type mapping'),
+    ]
+
+    def __init__(self, types=(), **options):
+        super(StixParser, self).__init__(**options)
+        self.types = dict(STIX_TYPES)
+        for item in types:
+            path, sep, _type = item.partition('=')
+            if not sep or not path.strip() or not _type.strip():
+                raise ValueError('Invalid type mapping (expected object path=indicator type): {}'.format(item))
+            self.types[path.strip()] = _type.strip()
+
+    def _records(self, obj, campaigns):
+        """ Returns the records of a STIX object, which has none if it is not an indicator or observable. """
+
+        if obj.get('type') == 'indicator':
+            if obj.get('pattern_type', 'stix') != 'stix':
+                raise ValueError('Unsupported pattern type: {}'.format(obj['pattern_type']))
+            values = pattern_comparisons(obj['pattern'])
+        elif obj.get('type') == 'observed-data':
+            values = [v for o in obj.get('objects', {}).values() for v in observable_values(o)]
+        elif obj.get('type') not in NON_OBSERVABLES:
+            values = list(observable_values(obj))
+        else:
+            return []
+
+        common = {'campaigns': sorted(campaigns.get(obj.get('id'), [])),
+                  'tags': sorted(set(obj.get('labels', []) + obj.get('indicator_types', []))),
+                  'references': [(ref['source_name'], ref.get('url') or ref['external_id'])
+                                 for ref in obj.get('external_references', [])
+                                 if ref.get('source_name') and (ref.get('url') or ref.get('external_id'))]}
+        if obj.get('created'):
+            common['created_time'] = parse(obj['created'], ignoretz=True)
+        if obj.get('modified'):
+            common['modified_time'] = parse(obj['modified'], ignoretz=True)
+
+        return [dict(common, type=self.types[path], value=value) for path, value in values if path in self.types]
+
+    def records(self, f):
+        data = json.load(f)
+        objects = data.get('objects', []) if isinstance(data, dict) else data
+
+        # The campaigns each indicator indicates.
+        names = dict((o['id'], o['name']) for o in objects if o.get('type') == 'campaign' and o.get('name'))
+        campaigns = {}
+        for o in objects:
+            if o.get('type') == 'relationship' and o.get('relationship_type') == 'indicates' \
+                    and o.get('target_ref') in names:
+                campaigns.setdefault(o['source_ref'], set()).add(names[o['target_ref']])
+
+        # Records are numbered in the order they are found, since one object can have several of them.
+        position = 0
+        for obj in objects:
+            try:
+                records = self._records(obj, campaigns)
+            except (KeyError, TypeError, ValueError, OverflowError) as e:
+                position += 1
+                yield position, None, '{}: {!r}'.format(obj.get('id'), e)
+                continue
+
+            for record in records:
+                position += 1
+                yield position, record, None
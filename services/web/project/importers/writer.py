@@ -0,0 +1,406 @@
+import hashlib
+import random
+import string
+import time
+from datetime import datetime
+
+from flask import current_app
+from flask_security.utils import hash_password
+
+from project import db
+from project.models import Campaign, Indicator, IndicatorConfidence, IndicatorImpact, IndicatorStatus, IndicatorType, \
+    ImportCheckpoint, IntelReference, IntelSource, SavedSearch, TableVersion, Tag, User, indicator_campaign_association, \
+    indicator_reference_association, indicator_tag_association, indicator_value_hash
+from project.queries import campaign_ids, rebuild_facet_counts, refresh_saved_search
+
+"""
+INDICATOR WRITER
+
+The importers hand the writer normalized indicator records, which are dictionaries with these keys:
+
+    type, value, username: Required strings.
+    confidence, impact, status: Lookup values (default to LOW, LOW and New).
+    created_time, modified_time: Naive UTC datetimes (default to the time of the import).
+    case_sensitive, substring: Booleans (default to False).
+    campaigns, tags: Lists of campaign names (or aliases) and tag values.
+    references: List of (intel source, reference) tuples.
+
+Records are collected into batches. Each batch is written in its own transaction with a handful of
+Core statements no matter how many records it holds:
+
+ - Every lookup value the batch uses (types, tags, users, intel references, etc.) is resolved to its
+   ID with one SELECT per table. The missing ones are inserted with a single INSERT IGNORE and selected
+   again. The IDs are cached for the rest of the import.
+
+ - Indicators that already exist (using the same case-sensitivity rules as the API) are merged: only
+   their missing campaigns, tags and references are added. They are found with the indexed value hash.
+   The rest are inserted with one executemany, and their IDs are selected with a primary key range.
+
+ - The campaign, tag and reference mapping rows are inserted with one executemany per mapping table.
+
+When the writer is given a checkpoint name, every batch also records an ImportCheckpoint with the position
+its last record had in the input, in the same transaction. If the import dies, everything up to the latest
+checkpoint is saved and a resumed import starts reading after it. Records that are read again after a
+checkpoint are merged like any other existing indicator, so resuming is idempotent.
+
+Memory is bounded by the batch size plus the lookup caches and a 20-byte digest for every indicator
+seen so far, which is what duplicates within the import are detected with. The facet counts and saved
+search results are rebuilt once when the import finishes instead of being maintained per indicator.
+"""
+
+
+class ImportStats(object):
+    """ Counts what happened to the records of an import. """
+
+    def __init__(self):
+        self.start = time.time()
+        self.read = 0
+        self.imported = 0
+        self.merged = 0
+        self.duplicates = 0
+        self.failed = 0
+
+    def elapsed(self):
+        return time.time() - self.start
+
+    def rate(self):
+        elapsed = self.elapsed()
+        return self.read / elapsed if elapsed else 0.0
+
+    def __str__(self):
+        return '{} read, {} imported, {} merged, {} duplicates, {} failed in {:.1f}s ({:.0f} records/s)'.format(
+            self.read, self.imported, self.merged, self.duplicates, self.failed, self.elapsed(), self.rate())
+
+
+def _random_password():
+    return ''.join(random.choice(string.ascii_letters + string.punctuation + string.digits) for x in range(20))
+
+
+def select_ids(column, values, *where):
+    """ Returns a dictionary of {value: id} for the given values of a unique lookup column.
+
+    MySQL compares strings with the column's collation, which ignores case (and with utf8mb4_unicode_ci also accents
+    and trailing spaces), so a value resolves to the existing row it is equal to under the collation. That is also why
+    inserting it would have been ignored. Rows are matched to the values in Python when the values are the same or
+    only differ in case. If that leaves values unresolved while some rows went unclaimed, those values are compared
+    by the database itself with one SELECT each. """
+
+    table = column.table
+    select = db.select([table.c.id, column])
+    for clause in where:
+        select = select.where(clause)
+    rows = db.session.execute(select.where(column.in_(values)).order_by(table.c.id)).fetchall()
+
+    ids = {}
+    for _id, value in rows:
+        if value in values:
+            ids.setdefault(value, _id)
+
+    lowered = {}
+    for _id, value in rows:
+        lowered.setdefault(value.lower(), _id)
+    for value in values:
+        if value not in ids and value.lower() in lowered:
+            ids[value] = lowered[value.lower()]
+
+    if set(_id for _id, _ in rows) - set(ids.values()):
+        for value in sorted(set(values) - ids.keys()):
+            row = db.session.execute(select.where(column == value).order_by(table.c.id).limit(1)).first()
+            if row:
+                ids[value] = row[0]
+
+    return ids
+
+
+class IndicatorWriter(object):
+    """ Writes normalized indicator records to the database in batches. """
+
+    def __init__(self, batch_size=5000, label='IMPORT', checkpoint=None, position=0):
+        self.batch_size = batch_size
+        self.label = label
+        self.checkpoint = checkpoint
+        self.position = position
+        self.stats = ImportStats()
+        self._checkpointed = self._counts()
+        self._batch = []
+        self._seen = set()
+        self._written = set()
+        self._reset_caches()
+
+    def _reset_caches(self):
+        self._ids = {'campaign': {}, 'confidence': {}, 'impact': {}, 'reference': {}, 'source': {}, 'status': {},
+                     'tag': {}, 'type': {}, 'user': {}}
+
+    def add(self, record, position=None):
+        """ Queues a record to be written. Returns False if the import already had the same indicator.
+
+        The position locates the record in the input (ex: its line number) and is what the checkpoints record. """
+
+        self.stats.read += 1
+        if position is not None:
+            self.position = position
+
+        # Case-insensitive indicators are duplicates of each other if their values only differ in case.
+        value = record['value'] if record.get('case_sensitive') else record['value'].lower()
+        digest = hashlib.sha1('{}\0{}'.format(record['type'], value).encode('utf-8')).digest()
+        if digest in self._seen:
+            self.stats.duplicates += 1
+            return False
+        self._seen.add(digest)
+
+        self._batch.append(record)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+        return True
+
+    def reject(self, position, error):
+        """ Counts a record that could not be parsed. """
+
+        self.stats.read += 1
+        self.stats.failed += 1
+        self.position = position
+        current_app.logger.warning('{}: Skipping invalid record {}: {}'.format(self.label, position, error))
+
+    def flush(self):
+        """ Writes and commits the queued records. A batch that fails is retried one record at a time. """
+
+        batch, self._batch = self._batch, []
+        if not batch and self._counts() == self._checkpointed:
+            return
+
+        try:
+            imported, merged = self._write(batch) if batch else (0, 0)
+            self._record_checkpoint(imported, merged)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self._reset_caches()
+            current_app.logger.exception('{}: Batch failed, retrying its records one at a time'.format(self.label))
+            imported, merged = self._write_each(batch)
+            self._record_checkpoint(imported, merged)
+            db.session.commit()
+
+        self.stats.imported += imported
+        self.stats.merged += merged
+        self._checkpointed = self._counts()
+        current_app.logger.info('{}: {} (position {})'.format(self.label, self.stats, self.position))
+
+    def _counts(self):
+        return self.stats.read, self.stats.duplicates, self.stats.failed
+
+    def _record_checkpoint(self, imported, merged):
+        """ Records what happened to the records since the last checkpoint, in the batch's transaction. """
+
+        if not self.checkpoint:
+            return
+
+        read, duplicates, failed = [now - then for now, then in zip(self._counts(), self._checkpointed)]
+        ImportCheckpoint.record(self.checkpoint, self.position, read=read, imported=imported, merged=merged,
+                                duplicates=duplicates, failed=failed)
+
+    def _write_each(self, batch):
+        imported = merged = 0
+        for record in batch:
+            try:
+                i, m = self._write([record])
+                db.session.commit()
+                imported += i
+                merged += m
+            except Exception as e:
+                db.session.rollback()
+                self._reset_caches()
+                self.stats.failed += 1
+                current_app.logger.error('{}: Unable to import indicator {}: {}'.format(self.label, record['value'], e))
+        return imported, merged
+
+    def finish(self):
+        """ Writes the remaining records and rebuilds the data that is derived from the indicators. """
+
+        self.flush()
+        rebuild_facet_counts()
+        for saved_search in SavedSearch.query.all():
+            refresh_saved_search(saved_search)
+        db.session.commit()
+        return self.stats
+
+    def _lookup(self, name, column, values, row=None):
+        """ Returns the cache of {value: id} for a lookup table after making sure it has the given values.
+
+        The values that are not cached are selected, and the ones that do not exist yet are inserted
+        with a single INSERT IGNORE. The row function returns the other columns for a new value. """
+
+        cache = self._ids[name]
+        missing = set(values) - cache.keys()
+        if missing:
+            cache.update(select_ids(column, missing))
+            missing -= cache.keys()
+        if missing:
+            rows = [dict(row(value) if row else {}, **{column.name: value}) for value in sorted(missing)]
+            db.session.execute(column.table.insert().prefix_with('IGNORE'), rows)
+            self._written.add(column.table.name)
+            cache.update(select_ids(column, missing))
+        return cache
+
+    def _user_ids(self, usernames):
+        def row(username):
+            return {'active': False,
+                    'email': '{}@unknown'.format(username),
+                    'first_name': username[:50],
+                    'last_name': 'Unknown',
+                    'password': hash_password(_random_password())}
+
+        return self._lookup('user', User.username, usernames, row)
+
+    def _campaign_ids(self, names):
+        """ Campaigns are resolved by name or alias. The names that are neither are created as campaigns. """
+
+        cache = self._ids['campaign']
+        missing = set(names) - cache.keys()
+        if missing:
+            cache.update(campaign_ids(missing))
+            missing -= cache.keys()
+        if missing:
+            now = datetime.utcnow()
+            rows = [{'name': name, 'created_time': now, 'modified_time': now} for name in sorted(missing)]
+            db.session.execute(Campaign.__table__.insert().prefix_with('IGNORE'), rows)
+            self._written.add(Campaign.__tablename__)
+            cache.update(campaign_ids(missing))
+        return cache
+
+    def _reference_ids(self, batch, source_ids, user_ids):
+        """ Returns the cache of {(intel source ID, reference): id}. A new reference belongs to the user of the first
+        indicator in the batch that has it. """
+
+        cache = self._ids['reference']
+        owners = {}
+        for record in batch:
+            for source, reference in record.get('references', []):
+                owners.setdefault((source_ids[source], reference), user_ids[record['username']])
+
+        missing = set(owners) - cache.keys()
+        if missing:
+            self._select_references(missing)
+            missing -= cache.keys()
+        if missing:
+            now = datetime.utcnow()
+            rows = [{'intel_source_id': source_id, 'reference': reference, 'user_id': owners[(source_id, reference)],
+                     'created_time': now} for source_id, reference in sorted(missing)]
+            db.session.execute(IntelReference.__table__.insert().prefix_with('IGNORE'), rows)
+            self._written.add(IntelReference.__tablename__)
+            self._select_references(missing)
+        return cache
+
+    def _select_references(self, keys):
+        """ Caches the IDs of the given (intel source ID, reference) keys that exist with one SELECT per source. """
+
+        for source_id in set(key[0] for key in keys):
+            references = set(key[1] for key in keys if key[0] == source_id)
+            ids = select_ids(IntelReference.reference, references, IntelReference.intel_source_id == source_id)
+            self._ids['reference'].update(((source_id, reference), _id) for reference, _id in ids.items())
+
+    def _existing_indicators(self, rows, after_id=None):
+        """ Returns a dictionary of {(type ID, value): id} for the rows whose indicator already exists.
+
+        Like the API, a case-sensitive indicator only matches the exact value, while a case-insensitive
+        one matches any value that only differs in case. The candidates are found with the indexed
+        (type ID, value hash) columns, or with a primary key range for the indicators inserted after the
+        given ID. """
+
+        table = Indicator.__table__
+        select = db.select([table.c.id, table.c.type_id, table.c.value]).order_by(table.c.id)
+        if after_id is None:
+            select = select.where(table.c.type_id.in_(set(row['type_id'] for row in rows))) \
+                .where(table.c.value_hash.in_(set(row['value_hash'] for row in rows)))
+        else:
+            select = select.where(table.c.id > after_id)
+
+        exact = {}
+        lowered = {}
+        for _id, type_id, value in db.session.execute(select):
+            exact.setdefault((type_id, value), _id)
+            lowered.setdefault((type_id, value.lower()), _id)
+
+        ids = {}
+        for row in rows:
+            key = (row['type_id'], row['value'])
+            if row['case_sensitive']:
+                _id = exact.get(key)
+            else:
+                _id = lowered.get((row['type_id'], row['value'].lower()))
+            if _id:
+                ids[key] = _id
+        return ids
+
+    def _write(self, batch):
+        """ Writes a batch of records without committing it. Returns the number of indicators imported and merged. """
+
+        self._written = set()
+        now = datetime.utcnow()
+
+        confidence_ids = self._lookup('confidence', IndicatorConfidence.value,
+                                      set(r.get('confidence', 'LOW') for r in batch))
+        impact_ids = self._lookup('impact', IndicatorImpact.value, set(r.get('impact', 'LOW') for r in batch))
+        status_ids = self._lookup('status', IndicatorStatus.value, set(r.get('status', 'New') for r in batch))
+        type_ids = self._lookup('type', IndicatorType.value, set(r['type'] for r in batch))
+        user_ids = self._user_ids(set(r['username'] for r in batch))
+        tag_ids = self._lookup('tag', Tag.value, set(t for r in batch for t in r.get('tags', [])))
+        campaign_ids = self._campaign_ids(set(c for r in batch for c in r.get('campaigns', [])))
+        source_ids = self._lookup('source', IntelSource.value,
+                                  set(s for r in batch for s, _ in r.get('references', [])))
+        reference_ids = self._reference_ids(batch, source_ids, user_ids)
+
+        rows = [{'case_sensitive': bool(r.get('case_sensitive', False)),
+                 'confidence_id': confidence_ids[r.get('confidence', 'LOW')],
+                 'created_time': r.get('created_time') or now,
+                 'impact_id': impact_ids[r.get('impact', 'LOW')],
+                 'modified_time': r.get('modified_time') or now,
+                 'status_id': status_ids[r.get('status', 'New')],
+                 'substring': bool(r.get('substring', False)),
+                 'type_id': type_ids[r['type']],
+                 'user_id': user_ids[r['username']],
+                 'value': r['value'],
+                 'value_hash': indicator_value_hash(r['value'])} for r in batch]
+
+        # Insert the indicators that do not exist yet and select the IDs they were given.
+        ids = self._existing_indicators(rows)
+        merged = len(ids)
+        new_rows = [row for row in rows if (row['type_id'], row['value']) not in ids]
+        if new_rows:
+            max_id = db.session.execute(db.select([db.func.max(Indicator.id)])).scalar() or 0
+            db.session.execute(Indicator.__table__.insert(), new_rows)
+            self._written.add(Indicator.__tablename__)
+            ids.update(self._existing_indicators(new_rows, after_id=max_id))
+
+        # Add the mapping rows. Any that an existing indicator already has are ignored.
+        mappings = ((indicator_campaign_association, 'campaign_id', 'campaigns', campaign_ids),
+                    (indicator_tag_association, 'tag_id', 'tags', tag_ids))
+        for table, column, key, lookup in mappings:
+            mapping_rows = set((ids[(row['type_id'], row['value'])], lookup[value])
+                               for row, r in zip(rows, batch) for value in r.get(key, []))
+            if mapping_rows:
+                db.session.execute(table.insert().prefix_with('IGNORE'),
+                                   [{'indicator_id': i, column: v} for i, v in sorted(mapping_rows)])
+                self._written.add(table.name)
+
+        reference_rows = set((ids[(row['type_id'], row['value'])], reference_ids[(source_ids[s], reference)])
+                             for row, r in zip(rows, batch) for s, reference in r.get('references', []))
+        if reference_rows:
+            db.session.execute(indicator_reference_association.insert().prefix_with('IGNORE'),
+                               [{'indicator_id': i, 'intel_reference_id': v} for i, v in sorted(reference_rows)])
+            self._written.add(indicator_reference_association.name)
+
+        TableVersion.bump(db.session.connection(), self._written)
+        return len(batch) - merged, merged
+
+
+def start_position(name, resume, label='IMPORT'):
+    """ Returns the position an import starts after: its latest checkpoint when resuming, otherwise 0. """
+
+    if resume:
+        position = ImportCheckpoint.latest_position(name)
+        current_app.logger.info('{}: Resuming {} after position {}'.format(label, name, position))
+        return position
+
+    ImportCheckpoint.clear(name)
+    db.session.commit()
+    return 0
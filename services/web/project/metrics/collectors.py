@@ -0,0 +1,89 @@
+import time
+
+from flask import g, has_request_context, request
+from prometheus_client import Histogram
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from project.metrics import bp
+
+"""
+REQUEST METRICS
+
+Every request is timed and its response size recorded, labeled by the endpoint's URL rule, the HTTP
+method and the status code. The size is the one sent to the client, after compression. The SQL statements executed while handling the request are counted and
+timed through SQLAlchemy engine events, which catches every query no matter where it is issued.
+"""
+
+
+# Buckets that cover everything from cached lookups up to the multi-minute bulk requests.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, float('inf'))
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000, 100000000, float('inf'))
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500, float('inf'))
+
+REQUEST_LATENCY = Histogram('sip_request_duration_seconds', 'Request latency in seconds',
+                            ['endpoint', 'method', 'status'], buckets=LATENCY_BUCKETS)
+RESPONSE_SIZE = Histogram('sip_response_size_bytes', 'Response body size in bytes',
+                          ['endpoint', 'method', 'status'], buckets=SIZE_BUCKETS)
+REQUEST_QUERIES = Histogram('sip_request_db_queries', 'Number of SQL statements executed per request',
+                            ['endpoint', 'method'], buckets=QUERY_BUCKETS)
+REQUEST_DB_TIME = Histogram('sip_request_db_duration_seconds', 'Time spent executing SQL statements per request',
+                            ['endpoint', 'method'], buckets=LATENCY_BUCKETS)
+
+
+def _endpoint():
+    """ Returns the URL rule of the current request so the label values stay bounded. """
+
+    if request.url_rule:
+        return request.url_rule.rule
+    return 'none'
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info['metrics_query_start'].pop()
+    if has_request_context() and 'metrics_start' in g:
+        g.metrics_queries += 1
+        g.metrics_db_time += time.perf_counter() - start
+
+
+@event.listens_for(Engine, 'handle_error')
+def handle_error(context):
+    # A statement that fails never gets to after_cursor_execute, so its start time has to be dropped here or it
+    # would pile up on the pooled connection. Errors from before there was a cursor never pushed a start time.
+    if context.connection is not None and context.cursor is not None:
+        starts = context.connection.info.get('metrics_query_start')
+        if starts:
+            starts.pop()
+
+
+@bp.before_app_request
+def start_request_metrics():
+    g.metrics_start = time.perf_counter()
+    g.metrics_queries = 0
+    g.metrics_db_time = 0.0
+
+
+@bp.after_app_request
+def record_request_metrics(response):
+    if 'metrics_start' not in g:
+        return response
+
+    endpoint = _endpoint()
+    method = request.method
+    status = str(response.status_code)
+
+    REQUEST_LATENCY.labels(endpoint, method, status).observe(time.perf_counter() - g.metrics_start)
+    REQUEST_QUERIES.labels(endpoint, method).observe(g.metrics_queries)
+    REQUEST_DB_TIME.labels(endpoint, method).observe(g.metrics_db_time)
+
+    # Streamed responses do not have a known length.
+    if response.content_length is not None:
+        RESPONSE_SIZE.labels(endpoint, method, status).observe(response.content_length)
+
+    return response
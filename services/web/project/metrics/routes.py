@@ -0,0 +1,40 @@
+import ipaddress
+import os
+
+from flask import current_app, request, Response
+from prometheus_client import CollectorRegistry, CONTENT_TYPE_LATEST, generate_latest, multiprocess, REGISTRY
+
+from project.helpers import error_response
+from project.metrics import bp
+
+
+def _allowed(remote_addr):
+    """ Returns True if the address is in one of the METRICS_ALLOWED_NETWORKS. """
+
+    try:
+        address = ipaddress.ip_address(remote_addr)
+    except ValueError:
+        return False
+
+    networks = current_app.config.get('METRICS_ALLOWED_NETWORKS', [])
+    return any(address in ipaddress.ip_network(network, strict=False) for network in networks)
+
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    """ Returns the request metrics in the Prometheus text format.
+
+    When the prometheus_multiproc_dir environment variable is set (as it is under gunicorn), every
+    worker writes its metrics to that directory and they are aggregated here. Otherwise only the
+    metrics of the current process are returned. Only the clients in METRICS_ALLOWED_NETWORKS can read them. """
+
+    if not _allowed(request.remote_addr or ''):
+        return error_response(403, 'Address not allowed to read the metrics')
+
+    if 'prometheus_multiproc_dir' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
@@ -1,10 +1,17 @@
+import base64
+import hashlib
+import json
 import logging
 import uuid
 
 from project import db
 from datetime import datetime
+from dateutil.parser import parse
 from flask import url_for
 from flask_security import UserMixin, RoleMixin
+from sqlalchemy import event
+from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.orm import Session, validates
 logger = logging.getLogger(__name__)
 
 
@@ -17,35 +24,94 @@ PAGINATED API QUERY MIXIN
 """
 
 
+def _first(value):
+    """ Request arguments can be passed through as either a single value or a list of values. """
+
+    if isinstance(value, (list, tuple)):
+        return value[0]
+    return value
+
+
+def encode_cursor(values):
+    """ Encodes the sort values of the last item on a page into an opaque cursor string. """
+
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, columns):
+    """ Decodes a cursor string back into the sort values of the given columns. """
+
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError('Invalid cursor')
+
+    return [parse(v) if isinstance(c.type, db.DateTime) and v is not None else v for c, v in zip(columns, values)]
+
+
+def _sorts_after(column, value, descending):
+    """ Returns a filter for the rows whose column sorts after the value. MySQL sorts NULL before every other value. """
+
+    if value is None:
+        return db.false() if descending else column.isnot(None)
+    if descending:
+        return db.or_(column < value, column.is_(None))
+    return column > value
+
+
+def _sorts_equal(column, value):
+    """ Returns a filter for the rows whose column equals the value, which can be NULL. """
+
+    return column.is_(None) if value is None else column == value
+
+
 class PaginatedAPIMixin:
-    @staticmethod
-    def to_collection_dict(query, endpoint, **kwargs):
-        """ Returns a paginated dictionary of a query. """
+
+    # The columns that collections of this model can be sorted by using the "sort" query argument.
+    # Prefixing the name with a "-" sorts in descending order. The id column is always used as the
+    # final sort key so that the order (and therefore the pagination) is deterministic.
+    sortable_columns = ('id',)
+
+    @classmethod
+    def sort_columns(cls, sort):
+        """ Returns the list of columns and the direction for the given sort argument. """
+
+        descending = sort.startswith('-')
+        name = sort[1:] if descending else sort
+        if name not in cls.sortable_columns:
+            raise ValueError('Invalid sort: {}'.format(sort))
+
+        columns = [getattr(cls, name)]
+        if name != 'id':
+            columns.append(cls.id)
+        return columns, descending
+
+    @classmethod
+    def to_collection_dict(cls, query, endpoint, **kwargs):
+        """ Returns a paginated dictionary of a query.
+
+        Pages are selected with either the page (offset) or the cursor (keyset) query arguments. Cursor
+        pagination skips the total count and stays fast no matter how deep into the results it goes. """
 
         # Create a copy of the request arguments so that we can modify them.
         args = kwargs.copy()
 
-        # Read the page and per_page values or use the defaults.
-        if 'page' in args:
-            page = int(args['page'][0])
-        else:
-            page = 1
-        if 'per_page' in args:
-            per_page = min(int(args['per_page'][0]), 1000)
-        else:
-            per_page = 100
-
-        # Now that we have the page and per_page values, remove them
-        # from the arguments so that the url_for function does not
-        # receive duplicates of them.
-        try:
-            del args['page']
-        except KeyError:
-            pass
-        try:
-            del args['per_page']
-        except KeyError:
-            pass
+        # Read the page, per_page and sort values or use the defaults.
+        page = int(_first(args.pop('page', 1)))
+        per_page = min(int(_first(args.pop('per_page', 100))), 1000)
+        sort = _first(args.pop('sort', 'id'))
+
+        # Sort the query using the column's index plus the id as a tie-breaker.
+        columns, descending = cls.sort_columns(sort)
+        query = query.order_by(*[c.desc() if descending else c for c in columns])
+
+        if 'cursor' in args:
+            return cls._to_cursor_dict(query, endpoint, columns, descending, _first(args.pop('cursor')), per_page,
+                                       sort, args)
 
         # Paginate the query.
         resources = query.paginate(page, per_page, False)
@@ -56,13 +122,52 @@ class PaginatedAPIMixin:
             '_meta': {
                 'page': page,
                 'per_page': per_page,
+                'sort': sort,
                 'total_pages': resources.pages,
                 'total_items': resources.total
             },
             '_links': {
-                'self': url_for(endpoint, page=page, per_page=per_page, **args),
-                'next': url_for(endpoint, page=page + 1, per_page=per_page, **args) if resources.has_next else None,
-                'prev': url_for(endpoint, page=page - 1, per_page=per_page, **args) if resources.has_prev else None
+                'self': url_for(endpoint, page=page, per_page=per_page, sort=sort, **args),
+                'next': url_for(endpoint, page=page + 1, per_page=per_page, sort=sort, **args) if resources.has_next else None,
+                'prev': url_for(endpoint, page=page - 1, per_page=per_page, sort=sort, **args) if resources.has_prev else None
+            }
+        }
+        return data
+
+    @staticmethod
+    def _to_cursor_dict(query, endpoint, columns, descending, cursor, per_page, sort, args):
+        """ Returns a keyset paginated dictionary of a sorted query, starting after the given cursor. """
+
+        # Only return the items that sort after the cursor: (a > x) OR (a = x AND id > y)
+        if cursor:
+            values = decode_cursor(cursor, columns)
+            after = None
+            for i in reversed(range(len(columns))):
+                compare = _sorts_after(columns[i], values[i], descending)
+                clause = db.and_(*[_sorts_equal(columns[j], values[j]) for j in range(i)] + [compare])
+                after = clause if after is None else db.or_(clause, after)
+            query = query.filter(after)
+
+        # Fetch one extra item to know if there is a next page.
+        items = query.limit(per_page + 1).all()
+        has_next = len(items) > per_page
+        items = items[:per_page]
+
+        next_cursor = None
+        if has_next:
+            next_cursor = encode_cursor([getattr(items[-1], c.key) for c in columns])
+
+        data = {
+            'items': [item.to_dict() for item in items],
+            '_meta': {
+                'cursor': cursor,
+                'next_cursor': next_cursor,
+                'per_page': per_page,
+                'sort': sort
+            },
+            '_links': {
+                'self': url_for(endpoint, cursor=cursor, per_page=per_page, sort=sort, **args),
+                'next': url_for(endpoint, cursor=next_cursor, per_page=per_page, sort=sort, **args) if has_next else None
             }
         }
         return data
@@ -75,7 +180,8 @@ ASSOCIATION TABLES
 
 indicator_campaign_association = db.Table('indicator_campaign_mapping',
                                           db.Column('indicator_id', db.Integer, db.ForeignKey('indicator.id'), primary_key=True),
-                                          db.Column('campaign_id', db.Integer, db.ForeignKey('campaign.id'), primary_key=True))
+                                          db.Column('campaign_id', db.Integer, db.ForeignKey('campaign.id'), primary_key=True),
+                                          db.Index('ix_indicator_campaign_mapping_campaign_id_indicator_id', 'campaign_id', 'indicator_id'))
 
 indicator_equal_association = db.Table('indicator_equal_mapping',
                                        db.Column('left_id', db.Integer, db.ForeignKey('indicator.id'), primary_key=True),
@@ -83,7 +189,8 @@ indicator_equal_association = db.Table('indicator_equal_mapping',
 
 indicator_reference_association = db.Table('indicator_reference_mapping',
                                            db.Column('indicator_id', db.Integer, db.ForeignKey('indicator.id'), primary_key=True),
-                                           db.Column('intel_reference_id', db.Integer, db.ForeignKey('intel_reference.id'), primary_key=True))
+                                           db.Column('intel_reference_id', db.Integer, db.ForeignKey('intel_reference.id'), primary_key=True),
+                                           db.Index('ix_indicator_reference_mapping_intel_reference_id_indicator_id', 'intel_reference_id', 'indicator_id'))
 
 indicator_relationship_association = db.Table('indicator_relationship_mapping',
                                               db.Column('parent_id', db.Integer, db.ForeignKey('indicator.id'), primary_key=True),
@@ -91,7 +198,12 @@ indicator_relationship_association = db.Table('indicator_relationship_mapping',
 
 indicator_tag_association = db.Table('indicator_tag_mapping',
                                      db.Column('indicator_id', db.Integer, db.ForeignKey('indicator.id'), primary_key=True),
-                                     db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True))
+                                     db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True),
+                                     db.Index('ix_indicator_tag_mapping_tag_id_indicator_id', 'tag_id', 'indicator_id'))
+
+saved_search_result_association = db.Table('saved_search_result_mapping',
+                                           db.Column('saved_search_id', db.Integer, db.ForeignKey('saved_search.id', ondelete='CASCADE'), primary_key=True),
+                                           db.Column('indicator_id', db.Integer, db.ForeignKey('indicator.id', ondelete='CASCADE'), primary_key=True))
 
 roles_users_association = db.Table('role_user_mapping',
                                    db.Column('user_id', db.Integer(), db.ForeignKey('user.id'), primary_key=True),
@@ -102,9 +214,11 @@ TABLE CLASS DEFINITIONS
 """
 
 
-class Role(db.Model, RoleMixin):
+class Role(PaginatedAPIMixin, db.Model, RoleMixin):
     __tablename__ = 'role'
 
+    sortable_columns = ('id', 'name')
+
     id = db.Column(db.Integer, primary_key=True, nullable=False)
     name = db.Column(db.String(80), unique=True)
     description = db.Column(db.String(255))
@@ -116,9 +230,11 @@ class Role(db.Model, RoleMixin):
         return {'id': self.id, 'description': self.description, 'name': self.name}
 
 
-class User(UserMixin, db.Model):
+class User(PaginatedAPIMixin, UserMixin, db.Model):
     __tablename__ = 'user'
 
+    sortable_columns = ('id', 'username')
+
     id = db.Column(db.Integer, primary_key=True, nullable=False)
     active = db.Column(db.Boolean(), nullable=False, default=True)
     apikey = db.Column(db.String(36), index=True, unique=True, nullable=False, default=generate_apikey)
@@ -142,9 +258,11 @@ class User(UserMixin, db.Model):
                 'username': self.username}
 
 
-class Campaign(db.Model):
+class Campaign(PaginatedAPIMixin, db.Model):
     __tablename__ = 'campaign'
 
+    sortable_columns = ('id', 'created_time', 'modified_time', 'name')
+
     id = db.Column(db.Integer, primary_key=True, nullable=False)
     aliases = db.relationship('CampaignAlias', order_by='CampaignAlias.alias')
     created_time = db.Column(db.DateTime, default=datetime.utcnow)
@@ -162,9 +280,11 @@ class Campaign(db.Model):
                 'name': self.name}
 
 
-class CampaignAlias(db.Model):
+class CampaignAlias(PaginatedAPIMixin, db.Model):
     __tablename__ = 'campaign_alias'
 
+    sortable_columns = ('id', 'alias')
+
     id = db.Column(db.Integer, primary_key=True, nullable=False)
     alias = db.Column(db.String(255), unique=True, nullable=False)
     campaign = db.relationship('Campaign')
@@ -179,8 +299,66 @@ class CampaignAlias(db.Model):
                 'campaign': self.campaign.name}
 
 
+class ImportCheckpoint(db.Model):
+    """
+    A batch of a bulk import (see project.importers) that was committed, along with what happened to its records. The
+    position is where the batch ended in the input (ex: a line number), so a resumed import continues after the
+    latest checkpoint of its name.
+    """
+
+    __tablename__ = 'import_checkpoint'
+    __table_args__ = (
+        db.Index('ix_import_checkpoint_name_position', 'name', 'position'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, nullable=False)
+    created_time = db.Column(db.DateTime, default=datetime.utcnow)
+    duplicates = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    imported = db.Column(db.Integer, nullable=False, default=0)
+    merged = db.Column(db.Integer, nullable=False, default=0)
+    name = db.Column(db.String(255), nullable=False)
+    position = db.Column(db.BigInteger, nullable=False)
+    read = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def record(name, position, **counts):
+        """ Adds a checkpoint in the current transaction, so it is only saved along with the batch it describes. """
+
+        db.session.execute(ImportCheckpoint.__table__.insert(),
+                           dict(counts, name=name, position=position, created_time=datetime.utcnow()))
+
+    @staticmethod
+    def latest_position(name):
+        """ Returns the position of the latest checkpoint of an import, or 0 if it has none. """
+
+        position = db.session.query(db.func.max(ImportCheckpoint.position)).filter_by(name=name).scalar()
+        return position or 0
+
+    @staticmethod
+    def clear(name):
+        """ Deletes the checkpoints of an import so that it starts over. """
+
+        db.session.execute(ImportCheckpoint.__table__.delete().where(ImportCheckpoint.name == name))
+
+
+def indicator_value_hash(value):
+    """ Returns the lookup key of an indicator value. Values that only differ in case have the same key, so it finds
+    the candidates for both the case-sensitive and the case-insensitive duplicate checks. """
+
+    return hashlib.sha1(value.lower().encode('utf-8')).hexdigest()
+
+
 class Indicator(PaginatedAPIMixin, db.Model):
     __tablename__ = 'indicator'
+    __table_args__ = (
+        db.Index('ix_indicator_type_id_value_hash', 'type_id', 'value_hash'),
+        db.Index('ix_indicator_status_id_type_id_id', 'status_id', 'type_id', 'id'),
+        db.Index('ix_indicator_created_time_id', 'created_time', 'id'),
+        db.Index('ix_indicator_modified_time_id', 'modified_time', 'id'),
+    )
+
+    sortable_columns = ('id', 'created_time', 'modified_time')
 
     id = db.Column(db.Integer, primary_key=True, nullable=False)
     campaigns = db.relationship('Campaign', secondary=indicator_campaign_association)
@@ -212,6 +390,12 @@ class Indicator(PaginatedAPIMixin, db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     user = db.relationship('User')
     value = db.Column(db.UnicodeText, nullable=False)
+    value_hash = db.Column(db.String(40), nullable=False)
+
+    @validates('value')
+    def validate_value(self, key, value):
+        self.value_hash = indicator_value_hash(value)
+        return value
 
     def __str__(self):
         return str('{} : {}'.format(self.type, self.value))
@@ -249,6 +433,15 @@ class Indicator(PaginatedAPIMixin, db.Model):
 
         return data
 
+    def facet_keys(self):
+        """ Returns the set of (facet, value ID) pairs that this indicator counts towards in the facet counts table. """
+
+        keys = {('status', self.status.id), ('type', self.type.id)}
+        keys.update(('campaign', c.id) for c in self.campaigns)
+        keys.update(('source', r.source.id) for r in self.references)
+        keys.update(('tag', t.id) for t in self.tags)
+        return keys
+
     def add_child(self, other):
         if not self == other and not other.parent:
             self.children.append(other)
@@ -352,9 +545,11 @@ class Indicator(PaginatedAPIMixin, db.Model):
         return _results
 
 
-class IndicatorConfidence(db.Model):
+class IndicatorConfidence(PaginatedAPIMixin, db.Model):
     __tablename__ = 'indicator_confidence'
 
+    sortable_columns = ('id', 'value')
+
     id = db.Column(db.Integer, primary_key=True, nullable=False)
     value = db.Column(db.String(255), unique=True, nullable=False)
 
@@ -366,9 +561,48 @@ class IndicatorConfidence(db.Model):
                 'value': self.value}
 
 
-class IndicatorImpact(db.Model):
+class IndicatorFacetCount(db.Model):
+    """
+    Incrementally maintained indicator counts for each facet value (ex: the number of indicators with each status)
+    so that the unfiltered facet counts do not need to scan the indicator table. There is no total count, since
+    every indicator create and delete would have to lock the same row. The total is counted from the indicator
+    table instead.
+    """
+
+    __tablename__ = 'indicator_facet_count'
+
+    facet = db.Column(db.String(32), primary_key=True, nullable=False)
+    value_id = db.Column(db.Integer, primary_key=True, nullable=False, autoincrement=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def apply(added, removed):
+        """ Increments the counts of the added (facet, value ID) keys and decrements the removed ones. """
+
+        deltas = dict.fromkeys(added, 1)
+        deltas.update(dict.fromkeys(removed, -1))
+        IndicatorFacetCount.adjust(deltas)
+
+    @staticmethod
+    def adjust(deltas):
+        """ Adds the amounts in a dictionary of (facet, value ID) -> amount to their counts. """
+
+        # The rows are written in key order so that concurrent writes lock them in the same order.
+        rows = [{'facet': f, 'value_id': v, 'count': c} for (f, v), c in sorted(deltas.items()) if c]
+        if not rows:
+            return
+
+        table = IndicatorFacetCount.__table__
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_duplicate_key_update(count=table.c['count'] + stmt.inserted['count'])
+        db.session.execute(stmt)
+
+
+class IndicatorImpact(PaginatedAPIMixin, db.Model):
     __tablename__ = 'indicator_impact'
 
+    sortable_columns = ('id', 'value')
+
     id = db.Column(db.Integer, primary_key=True, nullable=False)
     value = db.Column(db.String(255), unique=True, nullable=False)
 
@@ -380,9 +614,11 @@ class IndicatorImpact(db.Model):
                 'value': self.value}
 
 
-class IndicatorStatus(db.Model):
+class IndicatorStatus(PaginatedAPIMixin, db.Model):
     __tablename__ = 'indicator_status'
 
+    sortable_columns = ('id', 'value')
+
     id = db.Column(db.Integer, primary_key=True, nullable=False)
     value = db.Column(db.String(255), unique=True, nullable=False)
 
@@ -394,9 +630,11 @@ class IndicatorStatus(db.Model):
                 'value': self.value}
 
 
-class IndicatorType(db.Model):
+class IndicatorType(PaginatedAPIMixin, db.Model):
     __tablename__ = 'indicator_type'
 
+    sortable_columns = ('id', 'value')
+
     id = db.Column(db.Integer, primary_key=True, nullable=False)
     value = db.Column(db.String(255), unique=True, nullable=False)
 
@@ -412,9 +650,14 @@ class IntelReference(PaginatedAPIMixin, db.Model):
     __tablename__ = 'intel_reference'
     __table_args__ = (
         db.UniqueConstraint('intel_source_id', 'reference'),
+        db.Index('ix_intel_reference_intel_source_id_id', 'intel_source_id', 'id'),
+        db.Index('ix_intel_reference_user_id_id', 'user_id', 'id'),
     )
 
+    sortable_columns = ('id', 'reference')
+
     id = db.Column(db.Integer, primary_key=True, nullable=False)
+    created_time = db.Column(db.DateTime, default=datetime.utcnow)
     user = db.relationship('User')
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     reference = db.Column(db.String(512), index=True, nullable=False)
@@ -432,14 +675,17 @@ class IntelReference(PaginatedAPIMixin, db.Model):
 
     def to_dict(self):
         return {'id': self.id,
+                'created_time': self.created_time,
                 'reference': self.reference,
                 'source': self.source.value,
                 'user': self.user.username}
 
 
-class IntelSource(db.Model):
+class IntelSource(PaginatedAPIMixin, db.Model):
     __tablename__ = 'intel_source'
 
+    sortable_columns = ('id', 'value')
+
     id = db.Column(db.Integer, primary_key=True, nullable=False)
     value = db.Column(db.String(255), unique=True, nullable=False)
 
@@ -451,9 +697,104 @@ class IntelSource(db.Model):
                 'value': self.value}
 
 
-class Tag(db.Model):
+class SavedSearch(db.Model):
+    __tablename__ = 'saved_search'
+
+    id = db.Column(db.Integer, primary_key=True, nullable=False)
+    created_time = db.Column(db.DateTime, default=datetime.utcnow)
+    filters = db.Column(db.Text, nullable=False)
+    name = db.Column(db.String(255), unique=True, nullable=False)
+    refreshed_time = db.Column(db.DateTime)
+
+    """
+    The IDs of the indicators that match the filters are materialized in the mapping table so that
+    reading the results is a primary key join instead of evaluating the filters again.
+    """
+    indicators = db.relationship('Indicator', secondary=saved_search_result_association, viewonly=True, lazy='dynamic')
+
+    def __str__(self):
+        return str(self.name)
+
+    def filters_dict(self):
+        return json.loads(self.filters)
+
+    def is_stale(self, interval):
+        """ Returns True if the result set has never been built or is older than the given number of seconds. """
+
+        if not self.refreshed_time:
+            return True
+        return (datetime.utcnow() - self.refreshed_time).total_seconds() > interval
+
+    def to_dict(self):
+        return {'id': self.id,
+                'created_time': self.created_time,
+                'filters': self.filters_dict(),
+                'name': self.name,
+                'refreshed_time': self.refreshed_time}
+
+
+# The tables that project.api.caching.table_cache routes depend on. Only these have versions, so that writes to the
+# busy tables (indicators and their mappings) do not all queue up on the same table_version row lock. It is declared
+# here instead of being filled in by the decorator so that the processes that do not load the API (APP_MODE=gui,
+# the CLI) still bump the versions that the API processes read.
+VERSIONED_TABLES = frozenset(['campaign', 'campaign_alias', 'indicator_confidence', 'indicator_impact',
+                              'indicator_status', 'indicator_type', 'intel_source', 'role', 'tag'])
+
+
+class TableVersion(db.Model):
+    """
+    A version counter for each table in VERSIONED_TABLES that is bumped in the same transaction as every write to it.
+    The API uses the versions to validate its cached responses (see project.api.caching) without reading the tables
+    themselves.
+    """
+
+    __tablename__ = 'table_version'
+
+    table_name = db.Column(db.String(64), primary_key=True, nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def bump(connection, tables):
+        """ Increments the versions of the given tables. Tables that are not in VERSIONED_TABLES are skipped. """
+
+        tables = VERSIONED_TABLES.intersection(tables)
+        if not tables:
+            return
+
+        table = TableVersion.__table__
+        stmt = insert(table).values([{'table_name': t, 'version': 1} for t in sorted(tables)])
+        stmt = stmt.on_duplicate_key_update(version=table.c.version + 1)
+        connection.execute(stmt)
+
+    @staticmethod
+    def versions(tables):
+        """ Returns a dictionary of the current versions of the given tables. Tables never written to are version 0. """
+
+        table = TableVersion.__table__
+        rows = db.session.execute(db.select([table.c.table_name, table.c.version])
+                                  .where(table.c.table_name.in_(tables)))
+        versions = dict.fromkeys(tables, 0)
+        versions.update((row[0], row[1]) for row in rows)
+        return versions
+
+
+@event.listens_for(Session, 'after_flush')
+def bump_table_versions(session, flush_context):
+    """ Bumps the version of every versioned table that had rows inserted, updated or deleted by the flush. """
+
+    tables = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, '__table__', None)
+        if table is not None and table.name in VERSIONED_TABLES:
+            tables.add(table.name)
+    TableVersion.bump(session.connection(), tables)
+
+
+class Tag(PaginatedAPIMixin, db.Model):
     __tablename__ = 'tag'
 
+    sortable_columns = ('id', 'value')
+
     id = db.Column(db.Integer, primary_key=True, nullable=False)
     value = db.Column(db.String(255), nullable=False, index=True)
 
@@ -0,0 +1,753 @@
+import datetime
+import re
+
+from dateutil.parser import parse
+from flask import json, request, Response, stream_with_context
+from sqlalchemy import exists, false, func, literal, null, or_, union_all
+from sqlalchemy.orm import joinedload, selectinload
+from werkzeug.http import http_date
+
+from project import db
+from project.helpers import error_response, parse_boolean
+from project.models import Campaign, CampaignAlias, Indicator, IndicatorConfidence, IndicatorFacetCount, IndicatorImpact, \
+    IndicatorStatus, IndicatorType, IntelReference, IntelSource, SavedSearch, Tag, User, \
+    indicator_campaign_association, indicator_reference_association, indicator_tag_association, \
+    saved_search_result_association
+
+
+def lookup_ids(column, values):
+    """ Resolves a list of lookup table values (ex: tag or intel source names) into their IDs with a single query. """
+
+    values = set(values)
+    if not values:
+        return set()
+
+    model = column.class_
+    return set(row[0] for row in db.session.query(model.id).filter(column.in_(values)))
+
+
+def split_arg(value):
+    """ Splits a comma-separated query argument into a list of its non-empty values. """
+
+    return [v for v in value.split(',') if v]
+
+
+def _matching(select, group_column, match_column, ids, match_all):
+    """ Restricts a mapping table SELECT to the given IDs using either ANY (IN) or ALL (GROUP BY/HAVING) semantics. """
+
+    select = select.where(match_column.in_(ids))
+    if match_all and len(ids) > 1:
+        select = select.group_by(group_column).having(func.count(func.distinct(match_column)) == len(ids))
+    return select
+
+
+def tagged_indicators(tag_ids, match_all=True):
+    """ Returns a SELECT of the indicator IDs that have all (or any) of the given tag IDs. """
+
+    m = indicator_tag_association
+    select = db.select([m.c.indicator_id])
+    return _matching(select, m.c.indicator_id, m.c.tag_id, tag_ids, match_all)
+
+
+def campaigned_indicators(campaign_ids, match_all=True):
+    """ Returns a SELECT of the indicator IDs that are in all (or any) of the given campaign IDs. """
+
+    m = indicator_campaign_association
+    select = db.select([m.c.indicator_id])
+    return _matching(select, m.c.indicator_id, m.c.campaign_id, campaign_ids, match_all)
+
+
+def sourced_indicators(source_ids, match_all=True):
+    """ Returns a SELECT of the indicator IDs that have references from all (or any) of the given intel source IDs. """
+
+    m = indicator_reference_association
+    r = IntelReference.__table__
+    select = db.select([m.c.indicator_id]).select_from(m.join(r, r.c.id == m.c.intel_reference_id))
+    return _matching(select, m.c.indicator_id, r.c.intel_source_id, source_ids, match_all)
+
+
+def campaign_ids(names):
+    """ Resolves a list of campaign names or aliases into a dictionary of {name: campaign ID}, usually with a single
+    query.
+
+    Names that are neither a campaign nor an alias are left out of the dictionary. """
+
+    names = set(names)
+    if not names:
+        return {}
+
+    query = db.session.query(Campaign.id, Campaign.name, CampaignAlias.alias) \
+        .outerjoin(CampaignAlias, CampaignAlias.campaign_id == Campaign.id) \
+        .filter(or_(Campaign.name.in_(names), CampaignAlias.alias.in_(names)))
+
+    ids = {}
+    rows = query.all()
+    for _id, name, alias in rows:
+        for n in (name, alias):
+            if n in names:
+                ids[n] = _id
+
+    # Names that are only equal to a campaign or alias under the collation (ex: they differ in case or accents) are
+    # compared by the database one at a time, which only happens when some of the rows were not matched above.
+    if set(row[0] for row in rows) - set(ids.values()):
+        for name in sorted(names - ids.keys()):
+            _id = query.with_entities(Campaign.id).filter(or_(Campaign.name == name, CampaignAlias.alias == name)) \
+                .order_by(Campaign.id).limit(1).scalar()
+            if _id:
+                ids[name] = _id
+    return ids
+
+
+def find_campaign(name_or_id):
+    """ Returns the campaign with the given ID, name or alias, or None. Names and aliases are resolved in one query.
+
+    Names and aliases are checked before IDs so that campaigns with an all-digit name can still be found. """
+
+    if isinstance(name_or_id, int):
+        return Campaign.query.get(name_or_id)
+
+    campaign = Campaign.query.outerjoin(CampaignAlias, CampaignAlias.campaign_id == Campaign.id) \
+        .filter(or_(Campaign.name == name_or_id, CampaignAlias.alias == name_or_id)).first()
+    if not campaign and name_or_id.isdigit():
+        campaign = Campaign.query.get(int(name_or_id))
+    return campaign
+
+
+def campaign_filter(values, match_all=True):
+    """ Builds a single filter for a list of campaign names or aliases, resolving them to their IDs up front. """
+
+    ids = campaign_ids(values)
+    if not ids or (match_all and len(ids) < len(set(values))):
+        return false()
+    return Indicator.id.in_(campaigned_indicators(set(ids.values()), match_all=match_all))
+
+
+def lookup_filter(id_column, column, values):
+    """ Builds an IN filter on a foreign key column (ex: Indicator.status_id) from a list of lookup table values.
+
+    The values are resolved to their IDs up front so the filter is a simple index range scan instead of
+    a correlated subquery. If none of the values exist, a false() filter is returned. """
+
+    ids = lookup_ids(column, values)
+    if not ids:
+        return false()
+    return id_column.in_(ids)
+
+
+def mapping_filter(id_column, column, values, select_function, match_all=True):
+    """ Builds a single filter for a list of lookup values that live behind a mapping table.
+
+    The values are resolved to their IDs up front. With ALL semantics, a value that does not
+    exist means nothing can match, so a false() filter is returned instead of running the query. """
+
+    ids = lookup_ids(column, values)
+    if not ids or (match_all and len(ids) < len(set(values))):
+        return false()
+    return id_column.in_(select_function(ids, match_all=match_all))
+
+
+def indicator_load_options():
+    """ Returns the loader options that fetch everything Indicator.to_dict() serializes for a page of indicators in
+    a constant number of queries, instead of lazy loading the lookups and collections of each indicator. """
+
+    return (joinedload(Indicator.confidence),
+            joinedload(Indicator.impact),
+            joinedload(Indicator.status),
+            joinedload(Indicator.type),
+            joinedload(Indicator.user),
+            selectinload(Indicator.campaigns).selectinload(Campaign.aliases),
+            selectinload(Indicator.references).joinedload(IntelReference.source),
+            selectinload(Indicator.references).joinedload(IntelReference.user),
+            selectinload(Indicator.tags))
+
+
+def indicator_filters(args):
+    """ Builds the set of indicator filters from the read_indicators query arguments. """
+
+    filters = set()
+
+    # Campaigns filter
+    if 'campaigns' in args:
+        filters.add(campaign_filter(split_arg(args.get('campaigns'))))
+
+    # Campaigns filter (ANY)
+    if 'campaigns_any' in args:
+        filters.add(campaign_filter(split_arg(args.get('campaigns_any')), match_all=False))
+
+    # Case-sensitive filter
+    if 'case_sensitive' in args:
+        arg = parse_boolean(args.get('case_sensitive'), default=None)
+        filters.add(Indicator.case_sensitive.is_(arg))
+
+    # Confidence filter
+    if 'confidence' in args:
+        filters.add(lookup_filter(Indicator.confidence_id, IndicatorConfidence.value, split_arg(args.get('confidence'))))
+
+    # Created after filter
+    if 'created_after' in args:
+        try:
+            created_after = parse(args.get('created_after'), ignoretz=True)
+        except (ValueError, OverflowError):
+            created_after = datetime.date.max
+        filters.add(created_after < Indicator.created_time)
+
+    # Created before filter
+    if 'created_before' in args:
+        try:
+            created_before = parse(args.get('created_before'), ignoretz=True)
+        except (ValueError, OverflowError):
+            created_before = datetime.date.min
+        filters.add(Indicator.created_time < created_before)
+
+    # Impact filter
+    if 'impact' in args:
+        filters.add(lookup_filter(Indicator.impact_id, IndicatorImpact.value, split_arg(args.get('impact'))))
+
+    # Modified after filter
+    if 'modified_after' in args:
+        try:
+            modified_after = parse(args.get('modified_after'))
+        except (ValueError, OverflowError):
+            modified_after = datetime.date.max
+        filters.add(modified_after < Indicator.modified_time)
+
+    # Modified before filter
+    if 'modified_before' in args:
+        try:
+            modified_before = parse(args.get('modified_before'))
+        except (ValueError, OverflowError):
+            modified_before = datetime.date.min
+        filters.add(Indicator.modified_time < modified_before)
+
+    # NOT Source filter (IntelReference)
+    if 'not_sources' in args:
+        not_source_ids = lookup_ids(IntelSource.value, split_arg(args.get('not_sources')))
+        if not_source_ids:
+            filters.add(~Indicator.id.in_(sourced_indicators(not_source_ids, match_all=False)))
+
+    # Source filter (IntelReference)
+    if 'sources' in args:
+        filters.add(mapping_filter(Indicator.id, IntelSource.value, split_arg(args.get('sources')),
+                                   sourced_indicators))
+
+    # Source filter (IntelReference, ANY)
+    if 'sources_any' in args:
+        filters.add(mapping_filter(Indicator.id, IntelSource.value, split_arg(args.get('sources_any')),
+                                   sourced_indicators, match_all=False))
+
+    # Status filter
+    if 'status' in args:
+        filters.add(lookup_filter(Indicator.status_id, IndicatorStatus.value, split_arg(args.get('status'))))
+
+    # Substring filter
+    if 'substring' in args:
+        arg = parse_boolean(args.get('substring'), default=None)
+        filters.add(Indicator.substring.is_(arg))
+
+    # Tags filter
+    if 'tags' in args:
+        filters.add(mapping_filter(Indicator.id, Tag.value, split_arg(args.get('tags')), tagged_indicators))
+
+    # Tags filter (ANY)
+    if 'tags_any' in args:
+        filters.add(mapping_filter(Indicator.id, Tag.value, split_arg(args.get('tags_any')), tagged_indicators,
+                                   match_all=False))
+
+    # Type filter
+    if 'type' in args:
+        filters.add(lookup_filter(Indicator.type_id, IndicatorType.value, split_arg(args.get('type'))))
+
+    # Username filter
+    if 'user' in args:
+        filters.add(Indicator.references.any(IntelReference.user.has(User.username == args.get('user'))))
+
+    # Value filter
+    if 'value' in args:
+        filters.add(Indicator.value.like('%{}%'.format(args.get('value'))))
+
+    return filters
+
+
+def collection_filters(args, prefixes, created_column=None):
+    """ Builds the filters for the lookup table collections (tags, campaigns, users, etc.).
+
+    prefixes maps query arguments to the columns they match the start of (ex: value=mal matches the tag
+    "malware"), which can use the columns' indexes. created_after is only supported when the table has a
+    created_column. """
+
+    filters = set()
+
+    for arg, column in prefixes.items():
+        if arg in args:
+            filters.add(column.startswith(args.get(arg), autoescape=True))
+
+    if created_column is not None and 'created_after' in args:
+        try:
+            created_after = parse(args.get('created_after'), ignoretz=True)
+        except (ValueError, OverflowError):
+            created_after = datetime.date.max
+        filters.add(created_after < created_column)
+
+    return filters
+
+
+"""
+INTEL REFERENCES
+"""
+
+
+def find_intel_reference(source, reference):
+    """ Returns the intel reference with the given intel source value and reference, or None.
+
+    The source is joined rather than checked with a correlated subquery, so the lookup is a single
+    probe of the unique (intel_source_id, reference) index. """
+
+    return IntelReference.query.join(IntelSource, IntelSource.id == IntelReference.intel_source_id) \
+        .filter(IntelSource.value == source, IntelReference.reference == reference).first()
+
+
+def intel_reference_filters(args):
+    """ Builds the set of intel reference filters from the read_intel_references query arguments. """
+
+    filters = set()
+
+    # Created after filter
+    if 'created_after' in args:
+        try:
+            created_after = parse(args.get('created_after'), ignoretz=True)
+        except (ValueError, OverflowError):
+            created_after = datetime.date.max
+        filters.add(created_after < IntelReference.created_time)
+
+    # Reference prefix filter
+    if 'reference' in args:
+        filters.add(IntelReference.reference.startswith(args.get('reference'), autoescape=True))
+
+    # Reference substring filter
+    if 'reference_contains' in args:
+        filters.add(IntelReference.reference.contains(args.get('reference_contains'), autoescape=True))
+
+    # Source filter
+    if 'source' in args:
+        filters.add(lookup_filter(IntelReference.intel_source_id, IntelSource.value, split_arg(args.get('source'))))
+
+    # Username filter
+    if 'user' in args:
+        filters.add(lookup_filter(IntelReference.user_id, User.username, split_arg(args.get('user'))))
+
+    return filters
+
+
+"""
+LIGHTWEIGHT INDICATOR ROWS
+"""
+
+
+# The indicator fields that can be requested with the "fields" query argument. The lookup fields map to the
+# indicator's foreign key column and the lookup table column holding the value.
+INDICATOR_COLUMN_FIELDS = ('case_sensitive', 'created_time', 'id', 'modified_time', 'substring', 'value')
+INDICATOR_LOOKUP_FIELDS = {
+    'confidence': ('confidence_id', IndicatorConfidence.__table__.c.value),
+    'impact': ('impact_id', IndicatorImpact.__table__.c.value),
+    'status': ('status_id', IndicatorStatus.__table__.c.value),
+    'type': ('type_id', IndicatorType.__table__.c.value),
+    'user': ('user_id', User.__table__.c.username)
+}
+INDICATOR_DEFAULT_FIELDS = ('id', 'type', 'value')
+
+# MySQL returns the boolean columns as 0 or 1.
+INDICATOR_BOOLEAN_FIELDS = ('case_sensitive', 'substring')
+
+
+def indicator_fields(arg):
+    """ Parses a comma-separated "fields" query argument into a list of indicator fields. """
+
+    if not arg:
+        return list(INDICATOR_DEFAULT_FIELDS)
+
+    fields = []
+    for field in split_arg(arg):
+        if field not in INDICATOR_COLUMN_FIELDS and field not in INDICATOR_LOOKUP_FIELDS:
+            raise ValueError('Invalid field: {}'.format(field))
+        if field not in fields:
+            fields.append(field)
+    return fields
+
+
+def mapped_indicators_select(mapping_column, mapping_id, fields):
+    """ Returns a SELECT of the given fields of the indicators mapped to mapping_id in a mapping table.
+
+    mapping_column is the mapping table's column for the other side of the mapping (ex: the intel_reference_id
+    column of indicator_reference_mapping). The rows are read straight from the mapping table joined to the
+    indicator table and only the lookup tables that the fields need, in indicator ID order so that the
+    (mapping_column, indicator_id) index covers both the filter and the sort. """
+
+    mapping = mapping_column.table
+    indicator = Indicator.__table__
+
+    from_clause = mapping.join(indicator, indicator.c.id == mapping.c.indicator_id)
+    columns = []
+    for field in fields:
+        if field in INDICATOR_LOOKUP_FIELDS:
+            foreign_key, value_column = INDICATOR_LOOKUP_FIELDS[field]
+            lookup = value_column.table
+            from_clause = from_clause.join(lookup, lookup.c.id == indicator.c[foreign_key])
+            columns.append(value_column.label(field))
+        else:
+            columns.append(indicator.c[field].label(field))
+
+    return db.select(columns).select_from(from_clause).where(mapping_column == mapping_id) \
+        .order_by(mapping.c.indicator_id)
+
+
+def mapped_indicator_count(mapping_column, mapping_id):
+    """ Returns the number of indicators mapped to mapping_id, counted from the mapping table alone. """
+
+    select = db.select([func.count()]).select_from(mapping_column.table).where(mapping_column == mapping_id)
+    return db.session.execute(select).scalar()
+
+
+def indicator_row(row):
+    """ Returns a row of mapped_indicators_select as a dictionary with the same values that Indicator.to_dict() gives
+    once it is JSON encoded: booleans instead of 0/1 and datetimes in the HTTP date format of Flask's encoder. """
+
+    data = dict(row)
+    for field, value in data.items():
+        if field in INDICATOR_BOOLEAN_FIELDS and value is not None:
+            data[field] = bool(value)
+        elif isinstance(value, datetime.datetime):
+            data[field] = http_date(value.utctimetuple())
+    return data
+
+
+def stream_rows(select, batch_size=1000):
+    """ Yields the rows of a mapped_indicators_select as lists of indicator_row dictionaries, batch_size rows at a time.
+
+    A server-side cursor is used so that neither the database driver nor the application ever holds the whole
+    result in memory. """
+
+    result = db.session.execute(select.execution_options(stream_results=True))
+    try:
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [indicator_row(row) for row in rows]
+    finally:
+        result.close()
+
+
+def mapped_indicators_response(mapping_column, mapping_id):
+    """ Returns the response of the bulk (JSON array) or stream (NDJSON) mode of an "indicators" endpoint, or None
+    if the request uses neither mode.
+
+    Both modes skip the ORM and read the requested fields straight from the mapping table. """
+
+    bulk = parse_boolean(request.args.get('bulk'), default=False)
+    stream = parse_boolean(request.args.get('stream'), default=False)
+    if not bulk and not stream:
+        return None
+
+    try:
+        fields = indicator_fields(request.args.get('fields'))
+    except ValueError as e:
+        return error_response(400, str(e))
+
+    select = mapped_indicators_select(mapping_column, mapping_id, fields)
+    if stream:
+        lines = (''.join(json.dumps(row) + '\n' for row in rows) for rows in stream_rows(select))
+        return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+
+    data = [indicator_row(row) for row in db.session.execute(select)]
+    return Response(json.dumps(data), mimetype='application/json')
+
+
+"""
+FACETS
+"""
+
+
+FACETS = ('campaign', 'source', 'status', 'tag', 'type')
+
+
+def _facet_from(facet):
+    """ Returns the FROM clause joining indicators to a facet's lookup table, along with its ID and value columns. """
+
+    i = Indicator.__table__
+
+    if facet == 'campaign':
+        m = indicator_campaign_association
+        c = Campaign.__table__
+        return i.join(m, m.c.indicator_id == i.c.id).join(c, c.c.id == m.c.campaign_id), c.c.id, c.c.name
+
+    if facet == 'source':
+        m = indicator_reference_association
+        r = IntelReference.__table__
+        s = IntelSource.__table__
+        from_ = i.join(m, m.c.indicator_id == i.c.id).join(r, r.c.id == m.c.intel_reference_id)
+        return from_.join(s, s.c.id == r.c.intel_source_id), s.c.id, s.c.value
+
+    if facet == 'status':
+        s = IndicatorStatus.__table__
+        return i.join(s, s.c.id == i.c.status_id), s.c.id, s.c.value
+
+    if facet == 'tag':
+        m = indicator_tag_association
+        t = Tag.__table__
+        return i.join(m, m.c.indicator_id == i.c.id).join(t, t.c.id == m.c.tag_id), t.c.id, t.c.value
+
+    if facet == 'type':
+        t = IndicatorType.__table__
+        return i.join(t, t.c.id == i.c.type_id), t.c.id, t.c.value
+
+    raise ValueError('Unknown facet: {}'.format(facet))
+
+
+def facet_counts_select(facets, filters):
+    """ Returns a single UNION ALL SELECT of (facet, value_id, value, count) rows for the given facets.
+
+    The "total" facet row holds the number of indicators that match the filters. """
+
+    i = Indicator.__table__
+    selects = []
+
+    for facet in facets:
+        from_, id_column, value_column = _facet_from(facet)
+        select = db.select([literal(facet).label('facet'),
+                            id_column.label('value_id'),
+                            value_column.label('value'),
+                            func.count(func.distinct(i.c.id)).label('count')]).select_from(from_)
+        for f in filters:
+            select = select.where(f)
+        selects.append(select.group_by(id_column, value_column))
+
+    total = db.select([literal('total'), literal(0), null(), func.count(i.c.id)]).select_from(i)
+    for f in filters:
+        total = total.where(f)
+    selects.append(total)
+
+    return union_all(*selects)
+
+
+def cached_facet_counts_select(facets):
+    """ Returns a single UNION ALL SELECT of (facet, value_id, value, count) rows from the facet counts table.
+
+    Every indicator has exactly one type, so the "total" row is the sum of the type counts. It is missing if the
+    facet counts table has no type rows, which means it has never been built. """
+
+    fc = IndicatorFacetCount.__table__
+    selects = []
+
+    for facet in facets:
+        _, id_column, value_column = _facet_from(facet)
+        select = db.select([literal(facet).label('facet'),
+                            id_column.label('value_id'),
+                            value_column.label('value'),
+                            fc.c['count'].label('count')])
+        select = select.select_from(fc.join(id_column.table, id_column == fc.c.value_id))
+        selects.append(select.where(fc.c.facet == facet).where(fc.c['count'] > 0))
+
+    selects.append(db.select([literal('total'), literal(0), null(), func.sum(fc.c['count'])])
+                   .where(fc.c.facet == 'type').having(func.count() > 0))
+
+    return union_all(*selects)
+
+
+def facet_counts(facets, filters):
+    """ Returns a dictionary of the indicator counts for each value of the given facets.
+
+    Unfiltered requests are served from the incrementally maintained facet counts table. Filtered
+    requests (or a counts table that has never been built) compute every facet in a single grouped query. """
+
+    rows = None
+    if not filters:
+        rows = db.session.execute(cached_facet_counts_select(facets)).fetchall()
+        if not any(row[0] == 'total' for row in rows):
+            rows = None
+
+    if rows is None:
+        rows = db.session.execute(facet_counts_select(facets, filters)).fetchall()
+
+    data = {'_meta': {'total_items': 0}, 'facets': dict((facet, {}) for facet in facets)}
+    for facet, value_id, value, count in rows:
+        if facet == 'total':
+            data['_meta']['total_items'] = int(count)
+        else:
+            data['facets'][facet][value] = int(count)
+    return data
+
+
+def rebuild_facet_counts():
+    """ Rebuilds the entire facet counts table from the indicator data. """
+
+    fc = IndicatorFacetCount.__table__
+    counts = facet_counts_select(FACETS, set()).alias()
+
+    db.session.execute(fc.delete())
+    db.session.execute(fc.insert().from_select(['facet', 'value_id', 'count'],
+                                               db.select([counts.c.facet, counts.c.value_id, counts.c['count']])
+                                               .where(counts.c.facet != 'total')))
+
+
+def reference_source_deltas(intel_reference_id, old_source_id, new_source_id):
+    """ Returns the source facet count changes of moving an intel reference from one intel source to another.
+
+    An indicator only loses the old source if none of its other references are from it, and only gains the new
+    source if none of its other references already were. """
+
+    m = indicator_reference_association
+    other = indicator_reference_association.alias()
+    r = IntelReference.__table__
+
+    def count_without_other(source_id):
+        other_reference = db.select([other.c.indicator_id]) \
+            .select_from(other.join(r, r.c.id == other.c.intel_reference_id)) \
+            .where(other.c.indicator_id == m.c.indicator_id) \
+            .where(other.c.intel_reference_id != intel_reference_id) \
+            .where(r.c.intel_source_id == source_id)
+        select = db.select([func.count()]).select_from(m) \
+            .where(m.c.intel_reference_id == intel_reference_id).where(~exists(other_reference))
+        return db.session.execute(select).scalar()
+
+    return {('source', old_source_id): -count_without_other(old_source_id),
+            ('source', new_source_id): count_without_other(new_source_id)}
+
+
+"""
+SAVED SEARCHES
+"""
+
+
+MULTI_VALUE_FILTERS = ('campaigns', 'campaigns_any', 'confidence', 'impact', 'not_sources', 'sources', 'sources_any',
+                       'status', 'tags', 'tags_any', 'type')
+
+
+def normalize_filters(filters):
+    """ Normalizes a dictionary of read_indicators filters so that equivalent searches are stored the same way. """
+
+    normalized = {}
+    for key, value in filters.items():
+        value = value.strip()
+        if key in MULTI_VALUE_FILTERS:
+            value = ','.join(sorted(set(split_arg(value))))
+        if value:
+            normalized[key] = value
+    return normalized
+
+
+def _saved_search_results_select(saved_search, *extra_filters):
+    """ Returns a SELECT of (saved_search_id, indicator_id) rows for the indicators that match a saved search. """
+
+    filters = indicator_filters(saved_search.filters_dict())
+    return db.session.query(literal(saved_search.id), Indicator.id).filter(*filters).filter(*extra_filters).statement
+
+
+def expire_saved_searches(*filter_keys):
+    """ Marks the saved searches that use any of the given filters as stale so that they are rebuilt when read.
+
+    This is for the writes that can change the results of many indicators at once (ex: moving an intel reference
+    to another source), which would be too slow to re-evaluate right away. """
+
+    for saved_search in SavedSearch.query.all():
+        if any(key in saved_search.filters_dict() for key in filter_keys):
+            saved_search.refreshed_time = None
+
+
+def refresh_saved_search(saved_search):
+    """ Rebuilds the materialized result set of a saved search with a single INSERT ... SELECT. """
+
+    m = saved_search_result_association
+
+    db.session.execute(m.delete().where(m.c.saved_search_id == saved_search.id))
+    db.session.execute(m.insert().from_select(['saved_search_id', 'indicator_id'],
+                                              _saved_search_results_select(saved_search)))
+    saved_search.refreshed_time = datetime.datetime.utcnow()
+
+
+# The filters that can rule out a saved search from an indicator's own values, without running the query. Each
+# maps to the indicator values it is checked against and whether every filter value must be present.
+SAVED_SEARCH_PREFILTERS = {
+    'confidence': ('confidence', False),
+    'impact': ('impact', False),
+    'sources': ('sources', True),
+    'sources_any': ('sources', False),
+    'status': ('status', False),
+    'tags': ('tags', True),
+    'tags_any': ('tags', False),
+    'type': ('type', False),
+}
+
+
+def _collation_key(value):
+    """ Returns what a value compares as under the database collation, or None if that cannot be worked out in Python.
+
+    For printable ASCII, utf8mb4_unicode_ci only ignores case and trailing spaces. Anything else can also be equal
+    to values with other accents or characters. """
+
+    if re.match(r'^[\x20-\x7e]*$', value):
+        return value.lower().rstrip(' ')
+    return None
+
+
+def _prefilter_values(indicator):
+    """ Returns the collation keys of the indicator values that the saved search prefilters are checked against. """
+
+    return {
+        'confidence': {_collation_key(indicator.confidence.value)},
+        'impact': {_collation_key(indicator.impact.value)},
+        'sources': set(_collation_key(r.source.value) for r in indicator.references),
+        'status': {_collation_key(indicator.status.value)},
+        'tags': set(_collation_key(t.value) for t in indicator.tags),
+        'type': {_collation_key(indicator.type.value)},
+    }
+
+
+def _could_match(saved_search, values):
+    """ Returns False if the prefilters show that none of the indicators can match the saved search.
+
+    The other filters are assumed to match, so this can only rule a saved search out. A prefilter is skipped when
+    any of the values it compares is not printable ASCII, since only the database knows what those are equal to. """
+
+    filters = saved_search.filters_dict()
+    for indicator_values in values:
+        for key, (field, match_all) in SAVED_SEARCH_PREFILTERS.items():
+            if key in filters:
+                wanted = set(_collation_key(v) for v in split_arg(filters[key]))
+                if None in wanted or None in indicator_values[field]:
+                    continue
+                if (match_all and not wanted <= indicator_values[field]) or \
+                        (not match_all and not wanted & indicator_values[field]):
+                    break
+        else:
+            return True
+    return False
+
+
+def refresh_saved_searches(indicators):
+    """ Incrementally refreshes the saved searches that the given indicators are in or could now match.
+
+    Only the rows for these indicators are deleted and re-evaluated, so the cost of an indicator write does not
+    grow with the size of the saved search result sets. The saved searches that the indicators are not in and that
+    the prefilters rule out are skipped. Anything the prefilters miss is still picked up by the rebuild of the
+    result sets that are older than SAVED_SEARCH_REFRESH_INTERVAL. """
+
+    indicators = list(indicators)
+    if not indicators:
+        return
+
+    m = saved_search_result_association
+    indicator_ids = set(i.id for i in indicators)
+
+    current = set(row[0] for row in db.session.execute(db.select([m.c.saved_search_id]).distinct()
+                                                       .where(m.c.indicator_id.in_(indicator_ids))))
+    values = [_prefilter_values(i) for i in indicators]
+
+    for saved_search in SavedSearch.query.all():
+        if saved_search.id not in current and not _could_match(saved_search, values):
+            continue
+
+        db.session.execute(m.delete().where(m.c.saved_search_id == saved_search.id)
+                           .where(m.c.indicator_id.in_(indicator_ids)))
+        db.session.execute(m.insert().from_select(['saved_search_id', 'indicator_id'],
+                                                  _saved_search_results_select(saved_search,
+                                                                               Indicator.id.in_(indicator_ids))))
@@ -236,7 +236,28 @@ def test_read_all_values(client):
     request = client.get('/api/campaigns')
     response = json.loads(request.data.decode())
     assert request.status_code == 200
-    assert len(response) == 3
+    assert len(response['items']) == 3
+
+
+def test_read_all_filters(client):
+    """ Ensure campaigns can be filtered by a name prefix and their created time """
+
+    create_campaign(client, 'asdf')
+    create_campaign(client, 'asdf2')
+    create_campaign(client, 'qwer')
+
+    request = client.get('/api/campaigns?name=asdf')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert sorted(c['name'] for c in response['items']) == ['asdf', 'asdf2']
+
+    request = client.get('/api/campaigns?created_after=2000-01-01')
+    response = json.loads(request.data.decode())
+    assert response['_meta']['total_items'] == 3
+
+    request = client.get('/api/campaigns?created_after=3000-01-01')
+    response = json.loads(request.data.decode())
+    assert response['_meta']['total_items'] == 0
 
 
 def test_read_by_id(client):
@@ -255,6 +276,88 @@ def test_read_by_id(client):
     assert response['name'] == 'asdf'
 
 
+def test_read_indicators(client):
+    """ Ensure a campaign's indicators can be read by its ID, name or alias """
+
+    create_indicator(client, 'IP', '127.0.0.1', 'analyst', campaigns=['LOLcats'])
+    create_indicator(client, 'IP', '127.0.0.2', 'analyst', campaigns=['LOLcats', 'Derpsters'])
+    create_indicator(client, 'IP', '127.0.0.3', 'analyst', campaigns=['Derpsters'])
+    request, response = create_campaign_alias(client, 'icanhaz', 'LOLcats')
+    assert request.status_code == 201
+
+    _id = json.loads(client.get('/api/campaigns?name=LOLcats').data.decode())['items'][0]['id']
+
+    for campaign in [_id, 'LOLcats', 'icanhaz']:
+        request = client.get('/api/campaigns/{}/indicators'.format(campaign))
+        response = json.loads(request.data.decode())
+        assert request.status_code == 200
+        assert [i['value'] for i in response['items']] == ['127.0.0.1', '127.0.0.2']
+        assert response['_links']['self'].startswith('/api/campaigns/{}/indicators'.format(_id))
+
+    request = client.get('/api/campaigns/icanhaz/indicators?bulk=true&fields=value')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert response == [{'value': '127.0.0.1'}, {'value': '127.0.0.2'}]
+
+    request = client.get('/api/campaigns/LOLcats/indicators?stream=true')
+    assert request.status_code == 200
+    assert request.mimetype == 'application/x-ndjson'
+    assert [json.loads(line)['value'] for line in request.data.decode().splitlines()] == ['127.0.0.1', '127.0.0.2']
+
+    request = client.get('/api/campaigns/icanhaz/indicators/count')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert response == {'count': 2, 'id': _id}
+
+    request = client.get('/api/campaigns/asdf/indicators')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 404
+    assert response['msg'] == 'Campaign not found'
+
+
+def test_read_indicators_numeric_name(client):
+    """ Ensure a campaign whose name is all digits is found by its name before any campaign with that ID """
+
+    create_indicator(client, 'IP', '127.0.0.1', 'analyst', campaigns=['LOLcats'])
+    _id = json.loads(client.get('/api/campaigns?name=LOLcats').data.decode())['items'][0]['id']
+    create_indicator(client, 'IP', '127.0.0.2', 'analyst', campaigns=[str(_id)])
+
+    request = client.get('/api/campaigns/{}/indicators?bulk=true&fields=value'.format(_id))
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert response == [{'value': '127.0.0.2'}]
+
+    request = client.get('/api/campaigns/123456789/indicators/count')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 404
+    assert response['msg'] == 'Campaign not found'
+
+
+def test_read_query_budget(client, query_budget):
+    """ Ensure reading campaigns stays within its SQL statement budget """
+
+    for i in range(5):
+        create_campaign(client, 'asdf{}'.format(i), aliases=['qwer{}'.format(i)])
+
+    # Table versions, the count and page queries, then the aliases of the whole page.
+    with query_budget(1 + 2 + 1):
+        request = client.get('/api/campaigns')
+    assert request.status_code == 200
+
+
+def test_read_eager_loading(client):
+    """ Ensure reading campaigns does not lazy load the aliases of each campaign """
+
+    for i in range(5):
+        create_campaign(client, 'asdf{}'.format(i), aliases=['qwer{}'.format(i), 'zxcv{}'.format(i)])
+
+    for url in ['/api/campaigns', '/api/campaigns?legacy=true']:
+        with QueryCounter() as counter:
+            request = client.get(url)
+        assert request.status_code == 200
+        assert counter.repeated() == []
+
+
 """
 UPDATE TESTS
 """
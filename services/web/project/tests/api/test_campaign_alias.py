@@ -265,7 +265,7 @@ def test_read_all_values(client):
     request = client.get('/api/campaigns/alias')
     response = json.loads(request.data.decode())
     assert request.status_code == 200
-    assert len(response) == 3
+    assert len(response['items']) == 3
 
 
 def test_read_by_id(client):
@@ -288,6 +288,32 @@ def test_read_by_id(client):
     assert response['alias'] == 'asdf2'
 
 
+def test_read_query_budget(client, query_budget):
+    """ Ensure reading campaign aliases stays within its SQL statement budget """
+
+    for i in range(5):
+        create_campaign(client, 'asdf{}'.format(i))
+        create_campaign_alias(client, 'qwer{}'.format(i), 'asdf{}'.format(i))
+
+    # Table versions, then the count and page queries with the campaigns joined.
+    with query_budget(1 + 2):
+        request = client.get('/api/campaigns/alias')
+    assert request.status_code == 200
+
+
+def test_read_eager_loading(client):
+    """ Ensure reading campaign aliases does not lazy load the campaign of each alias """
+
+    for i in range(5):
+        create_campaign(client, 'asdf{}'.format(i))
+        create_campaign_alias(client, 'qwer{}'.format(i), 'asdf{}'.format(i))
+
+    with QueryCounter() as counter:
+        request = client.get('/api/campaigns/alias')
+    assert request.status_code == 200
+    assert counter.repeated() == []
+
+
 """
 UPDATE TESTS
 """
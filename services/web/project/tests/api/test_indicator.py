@@ -1,8 +1,12 @@
 import datetime
 import gzip
+import re
 import time
 
-from project.tests.conftest import TEST_ANALYST_APIKEY, TEST_INACTIVE_APIKEY, TEST_INVALID_APIKEY
+from project import db
+from project.api import ratelimit
+from project.models import Indicator
+from project.tests.conftest import TEST_ADMIN_APIKEY, TEST_ANALYST_APIKEY, TEST_INACTIVE_APIKEY, TEST_INVALID_APIKEY
 from project.tests.helpers import *
 
 
@@ -825,6 +829,71 @@ def test_read_invalid_role(app, client):
     assert response['msg'] == 'Insufficient privileges'
 
 
+def test_read_rate_limited(app, client):
+    """ Ensure callers over their rate or concurrency limits are throttled """
+
+    app.config['RATELIMIT_ENABLED'] = True
+    app.config['RATELIMIT_RATES'] = {'default': None, 'api.read_indicators:bulk': (1 / 60, 2)}
+    app.config['RATELIMIT_CONCURRENCY'] = {'default': None}
+
+    analyst_headers = create_auth_header(TEST_ANALYST_APIKEY)
+    admin_headers = create_auth_header(TEST_ADMIN_APIKEY)
+
+    # The burst is allowed and then the caller has to wait.
+    for i in range(2):
+        request = client.get('/api/indicators?bulk=true', headers=analyst_headers)
+        assert request.status_code == 200
+    request = client.get('/api/indicators?bulk=true', headers=analyst_headers)
+    response = json.loads(request.data.decode())
+    assert request.status_code == 429
+    assert response['msg'] == 'Rate limit exceeded'
+    assert 0 < int(request.headers['Retry-After']) <= 60
+
+    # Regular calls to the same endpoint and other API keys have their own limits.
+    request = client.get('/api/indicators', headers=analyst_headers)
+    assert request.status_code == 200
+    request = client.get('/api/indicators?bulk=true', headers=admin_headers)
+    assert request.status_code == 200
+
+    # A concurrency slot is released once the response is closed.
+    app.config['RATELIMIT_CONCURRENCY'] = {'default': 1}
+    for i in range(3):
+        request = client.get('/api/indicators', headers=analyst_headers)
+        assert request.status_code == 200
+        request.close()
+
+
+def test_read_rate_limited_forwarded_for(app, client):
+    """ Ensure callers without an API key are limited by their forwarded address instead of the proxy's """
+
+    app.config['RATELIMIT_ENABLED'] = True
+    app.config['RATELIMIT_RATES'] = {'default': None, 'api.read_indicators:bulk': (1 / 60, 1)}
+    app.config['RATELIMIT_CONCURRENCY'] = {'default': None}
+
+    request = client.get('/api/indicators?bulk=true', headers={'X-Forwarded-For': '10.0.0.1'})
+    assert request.status_code == 200
+    request = client.get('/api/indicators?bulk=true', headers={'X-Forwarded-For': '10.0.0.1'})
+    assert request.status_code == 429
+    request = client.get('/api/indicators?bulk=true', headers={'X-Forwarded-For': '10.0.0.2'})
+    assert request.status_code == 200
+
+
+def test_rate_limit_buckets_evicted(monkeypatch):
+    """ Ensure the in-process token buckets are evicted once they are full again """
+
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, 'monotonic', lambda: now[0])
+    backend = ratelimit.MemoryBackend()
+
+    assert backend.take('a', 1, 2) == 0
+    assert backend.take('b', 1 / 600, 2) == 0
+
+    # Bucket "a" is full again after a second, but "b" needs another 10 minutes.
+    now[0] += backend.SWEEP_INTERVAL
+    assert backend.take('c', 1, 2) == 0
+    assert sorted(backend._buckets) == ['b', 'c']
+
+
 def test_read_all_values(client):
     """ Ensure all values properly return """
 
@@ -859,7 +928,7 @@ def test_read_by_id(client):
     assert response['user'] == 'analyst'
 
 
-def test_read_with_filters(client):
+def test_read_with_filters(app, client, monkeypatch):
     """ Ensure indicators can be read using the various filters """
 
     indicator1_request, indicator1_response = create_indicator(client, 'IP', '1.1.1.1', 'analyst',
@@ -906,9 +975,18 @@ def test_read_with_filters(client):
 
     # Filter with bulk mode enabled.
     request = client.get('/api/indicators?bulk=true')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert 'Content-Encoding' not in request.headers
+    assert len(response) == 3
+
+    # Filter with bulk mode enabled and a gzip Accept-Encoding.
+    monkeypatch.setitem(app.config, 'COMPRESS_MIN_SIZE', 0)
+    request = client.get('/api/indicators?bulk=true', headers={'Accept-Encoding': 'gzip'})
     response = gzip.decompress(request.data)
     response = json.loads(response.decode('utf-8'))
     assert request.status_code == 200
+    assert request.headers['Content-Encoding'] == 'gzip'
     assert len(response) == 3
 
     # Filter by case_sensitive
@@ -1040,6 +1118,327 @@ def test_read_with_filters(client):
     assert len(response['items']) == 0
 
 
+def test_read_sorted(client):
+    """ Ensure indicators can be sorted and paginated with both pages and cursors """
+
+    for value in ['c', 'a', 'd', 'b', 'e']:
+        request, response = create_indicator(client, 'asdf', value, 'analyst')
+        assert request.status_code == 201
+
+    # Invalid sort
+    request = client.get('/api/indicators?sort=asdf')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 400
+    assert response['msg'] == 'Invalid sort: asdf'
+
+    # Values are not indexed, so they cannot be sorted on.
+    request = client.get('/api/indicators?sort=-value')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 400
+    assert response['msg'] == 'Invalid sort: -value'
+
+    # Invalid cursor
+    request = client.get('/api/indicators?cursor=asdf')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 400
+    assert response['msg'] == 'Invalid cursor'
+
+    # Default sort is by ID
+    request = client.get('/api/indicators')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert response['_meta']['sort'] == 'id'
+    assert [i['value'] for i in response['items']] == ['c', 'a', 'd', 'b', 'e']
+
+    # Offset pagination
+    request = client.get('/api/indicators?sort=id&page=2&per_page=2')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert [i['value'] for i in response['items']] == ['d', 'b']
+
+    request = client.get('/api/indicators?sort=-id&page=1&per_page=2')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert [i['value'] for i in response['items']] == ['e', 'b']
+
+    # Cursor pagination
+    values = []
+    request = client.get('/api/indicators?sort=-id&cursor=&per_page=2')
+    response = json.loads(request.data.decode())
+    while True:
+        assert request.status_code == 200
+        values += [i['value'] for i in response['items']]
+        if not response['_meta']['next_cursor']:
+            break
+        request = client.get(response['_links']['next'])
+        response = json.loads(request.data.decode())
+    assert values == ['e', 'b', 'd', 'a', 'c']
+
+    request = client.get('/api/indicators?sort=-created_time&cursor=&per_page=10')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert len(response['items']) == 5
+    assert response['_meta']['next_cursor'] is None
+    assert response['_links']['next'] is None
+
+
+def test_read_sorted_null_times(client):
+    """ Ensure cursor pagination does not skip indicators without a created or modified time """
+
+    for value in ['a', 'b', 'c', 'd']:
+        request, response = create_indicator(client, 'asdf', value, 'analyst')
+        assert request.status_code == 201
+        if value in ('b', 'c'):
+            indicator = Indicator.query.get(response['id'])
+            indicator.created_time = None
+            indicator.modified_time = None
+    db.session.commit()
+
+    for sort in ['created_time', '-created_time', 'modified_time', '-modified_time']:
+        values = []
+        request = client.get('/api/indicators?sort={}&cursor=&per_page=1'.format(sort))
+        response = json.loads(request.data.decode())
+        while True:
+            assert request.status_code == 200
+            values += [i['value'] for i in response['items']]
+            if not response['_meta']['next_cursor']:
+                break
+            request = client.get(response['_links']['next'])
+            response = json.loads(request.data.decode())
+        assert sorted(values) == ['a', 'b', 'c', 'd']
+
+
+def test_read_with_multiple_lookup_values(client):
+    """ Ensure the lookup table filters accept comma-separated lists of values """
+
+    request, response = create_indicator(client, 'IP', '1.1.1.1', 'analyst', confidence='HIGH', impact='HIGH',
+                                         status='Analyzed')
+    assert request.status_code == 201
+
+    request, response = create_indicator(client, 'Email', 'asdf@asdf.com', 'analyst', confidence='MEDIUM',
+                                         impact='MEDIUM', status='New')
+    assert request.status_code == 201
+
+    request, response = create_indicator(client, 'URI', 'http://asdf.com', 'analyst', status='Deprecated')
+    assert request.status_code == 201
+
+    request = client.get('/api/indicators?status=Analyzed,New')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert len(response['items']) == 2
+
+    request = client.get('/api/indicators?type=IP,URI&status=Analyzed,New')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert len(response['items']) == 1
+    assert response['items'][0]['value'] == '1.1.1.1'
+
+    request = client.get('/api/indicators?confidence=HIGH,MEDIUM&impact=MEDIUM,asdf')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert len(response['items']) == 1
+    assert response['items'][0]['value'] == 'asdf@asdf.com'
+
+    # Values that do not exist match nothing
+    request = client.get('/api/indicators?status=asdf')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert len(response['items']) == 0
+
+
+def test_read_with_tag_and_source_semantics(client):
+    """ Ensure the tag and source filters support both ALL and ANY semantics """
+
+    request, response = create_indicator(client, 'IP', '1.1.1.1', 'analyst', intel_reference='http://blahblah.com',
+                                         intel_source='OSINT', tags=['phish', 'nanocore'])
+    assert request.status_code == 201
+
+    request, response = create_indicator(client, 'IP', '2.2.2.2', 'analyst', intel_reference='http://blahblah2.com',
+                                         intel_source='VirusTotal', tags=['phish'])
+    assert request.status_code == 201
+
+    request, response = create_indicator(client, 'IP', '3.3.3.3', 'analyst', tags=['nanocore'])
+    assert request.status_code == 201
+
+    # Tags must ALL match
+    request = client.get('/api/indicators?tags=phish,nanocore')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert len(response['items']) == 1
+    assert response['items'][0]['value'] == '1.1.1.1'
+
+    # A tag that does not exist can never be matched
+    request = client.get('/api/indicators?tags=phish,asdf')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert len(response['items']) == 0
+
+    # Tags can match ANY
+    request = client.get('/api/indicators?tags_any=phish,nanocore,asdf')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert len(response['items']) == 3
+
+    # Sources must ALL match
+    request = client.get('/api/indicators?sources=OSINT,VirusTotal')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert len(response['items']) == 0
+
+    # Sources can match ANY
+    request = client.get('/api/indicators?sources_any=OSINT,VirusTotal')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert len(response['items']) == 2
+
+    # NOT sources excludes any indicator with one of the sources
+    request = client.get('/api/indicators?not_sources=OSINT,VirusTotal')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert len(response['items']) == 1
+    assert response['items'][0]['value'] == '3.3.3.3'
+
+    # Combined tags and NOT sources
+    request = client.get('/api/indicators?tags=phish&not_sources=OSINT')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert len(response['items']) == 1
+    assert response['items'][0]['value'] == '2.2.2.2'
+
+
+def test_read_with_campaign_semantics(client):
+    """ Ensure the campaigns filters accept names and aliases with ALL and ANY semantics """
+
+    create_indicator(client, 'IP', '127.0.0.1', 'analyst', campaigns=['LOLcats', 'Derpsters'])
+    create_indicator(client, 'IP', '127.0.0.2', 'analyst', campaigns=['LOLcats'])
+    create_indicator(client, 'IP', '127.0.0.3', 'analyst')
+    create_campaign_alias(client, 'icanhaz', 'LOLcats')
+
+    # Campaigns must ALL match
+    request = client.get('/api/indicators?campaigns=LOLcats,Derpsters')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert [i['value'] for i in response['items']] == ['127.0.0.1']
+
+    # Aliases resolve to their campaign
+    request = client.get('/api/indicators?campaigns=icanhaz')
+    response = json.loads(request.data.decode())
+    assert [i['value'] for i in response['items']] == ['127.0.0.1', '127.0.0.2']
+
+    # A name and an alias of the same campaign
+    request = client.get('/api/indicators?campaigns=LOLcats,icanhaz')
+    response = json.loads(request.data.decode())
+    assert len(response['items']) == 2
+
+    # Campaigns that do not exist
+    request = client.get('/api/indicators?campaigns=LOLcats,asdf')
+    response = json.loads(request.data.decode())
+    assert len(response['items']) == 0
+
+    # Campaigns can match ANY
+    request = client.get('/api/indicators?campaigns_any=Derpsters,asdf')
+    response = json.loads(request.data.decode())
+    assert [i['value'] for i in response['items']] == ['127.0.0.1']
+
+
+def test_read_facets(client):
+    """ Ensure the facet counts are maintained and can be filtered """
+
+    request, response = create_indicator(client, 'IP', '1.1.1.1', 'analyst', campaigns=['LOLcats'],
+                                         intel_reference='http://blahblah.com', intel_source='OSINT',
+                                         status='Analyzed', tags=['phish', 'nanocore'])
+    assert request.status_code == 201
+    _id = response['id']
+
+    request, response = create_indicator(client, 'IP', '2.2.2.2', 'analyst', tags=['phish'])
+    assert request.status_code == 201
+
+    request, response = create_indicator(client, 'Email', 'asdf@asdf.com', 'analyst')
+    assert request.status_code == 201
+
+    # Invalid facet
+    request = client.get('/api/indicators/facets?facets=asdf')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 400
+    assert response['msg'] == 'Invalid facet: asdf'
+
+    # Unfiltered counts are read from the facet counts table without touching the indicator table.
+    with QueryCounter() as counter:
+        request = client.get('/api/indicators/facets')
+    assert not [s for s in counter.statements if re.search(r'\bindicator\b', s)]
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert response['_meta']['total_items'] == 3
+    assert response['facets']['campaign'] == {'LOLcats': 1}
+    assert response['facets']['source'] == {'OSINT': 1}
+    assert response['facets']['status'] == {'Analyzed': 1, 'New': 2}
+    assert response['facets']['tag'] == {'nanocore': 1, 'phish': 2}
+    assert response['facets']['type'] == {'Email': 1, 'IP': 2}
+
+    # Filtered counts
+    request = client.get('/api/indicators/facets?facets=type,tag&tags=phish')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert response['_meta']['total_items'] == 2
+    assert sorted(response['facets'].keys()) == ['tag', 'type']
+    assert response['facets']['tag'] == {'nanocore': 1, 'phish': 2}
+    assert response['facets']['type'] == {'IP': 2}
+
+    # Counts follow updates
+    request = client.put('/api/indicators/{}'.format(_id), json={'status': 'New', 'tags': ['nanocore']})
+    assert request.status_code == 200
+    request = client.get('/api/indicators/facets?facets=status,tag')
+    response = json.loads(request.data.decode())
+    assert response['facets']['status'] == {'New': 3}
+    assert response['facets']['tag'] == {'nanocore': 1, 'phish': 1}
+
+    # Counts follow deletes
+    request = client.delete('/api/indicators/{}'.format(_id))
+    assert request.status_code == 204
+    request = client.get('/api/indicators/facets?facets=campaign,tag')
+    response = json.loads(request.data.decode())
+    assert response['_meta']['total_items'] == 2
+    assert response['facets']['campaign'] == {}
+    assert response['facets']['tag'] == {'phish': 1}
+
+
+def test_read_query_budget(client, query_budget):
+    """ Ensure reading indicators stays within its SQL statement budget """
+
+    for i in range(5):
+        create_indicator(client, 'IP', '127.0.0.{}'.format(i), 'analyst')
+
+    # Page (with the lookups joined) and count queries, then the campaigns, references and tags of the whole page.
+    with query_budget(2 + 3):
+        request = client.get('/api/indicators')
+    assert request.status_code == 200
+
+    # Indicator query, its campaigns/references/tags and its confidence/impact/status/type/user lookups.
+    _id = json.loads(request.data.decode())['items'][0]['id']
+    with query_budget(1 + 3 + 5):
+        request = client.get('/api/indicators/{}'.format(_id))
+    assert request.status_code == 200
+
+
+def test_read_eager_loading(client):
+    """ Ensure reading indicators does not lazy load the relationships of each indicator """
+
+    for i in range(5):
+        create_indicator(client, 'IP', '127.0.0.{}'.format(i), 'analyst', campaigns=['asdf{}'.format(i)],
+                         intel_reference='http://blahblah{}.com'.format(i), intel_source='OSINT{}'.format(i),
+                         tags=['qwer{}'.format(i)])
+        create_campaign_alias(client, 'zxcv{}'.format(i), 'asdf{}'.format(i))
+
+    with QueryCounter() as counter:
+        request = client.get('/api/indicators')
+    assert request.status_code == 200
+    assert counter.repeated() == []
+
+    response = json.loads(request.data.decode())
+    assert [i['campaigns'][0]['aliases'] for i in response['items']] == [['zxcv{}'.format(i)] for i in range(5)]
+    assert [i['references'][0]['source'] for i in response['items']] == ['OSINT{}'.format(i) for i in range(5)]
+
+
 """
 UPDATE TESTS
 """
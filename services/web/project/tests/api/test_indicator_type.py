@@ -201,7 +201,7 @@ def test_read_all_values(client):
     request = client.get('/api/indicators/type')
     response = json.loads(request.data.decode())
     assert request.status_code == 200
-    assert len(response) == 3
+    assert len(response['items']) == 3
 
 
 def test_read_by_id(client):
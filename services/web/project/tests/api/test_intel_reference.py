@@ -340,6 +340,35 @@ def test_read_all_values(client):
     assert len(response) == 3
 
 
+def test_read_with_filters(client):
+    """ Ensure intel references can be filtered by source, user, reference and created time """
+
+    create_intel_reference(client, 'analyst', 'OSINT', 'http://blahblah.com/report')
+    create_intel_reference(client, 'analyst', 'OSINT', 'http://yourwiki.com/page_1')
+    create_intel_reference(client, 'admin', 'VirusTotal', 'http://virustotal.com/report')
+    create_intel_reference(client, 'admin', 'VirusTotal', 'http://yourwiki.com/page%1')
+
+    def references(query):
+        request = client.get('/api/intel/reference?{}'.format(query))
+        assert request.status_code == 200
+        return sorted(r['reference'] for r in json.loads(request.data.decode())['items'])
+
+    assert references('source=OSINT') == ['http://blahblah.com/report', 'http://yourwiki.com/page_1']
+    assert references('source=OSINT,VirusTotal&user=admin') == ['http://virustotal.com/report',
+                                                                'http://yourwiki.com/page%1']
+    assert references('source=asdf') == []
+    assert references('user=asdf') == []
+    assert references('reference=http://yourwiki.com') == ['http://yourwiki.com/page%1',
+                                                           'http://yourwiki.com/page_1']
+    assert references('reference_contains=report') == ['http://blahblah.com/report', 'http://virustotal.com/report']
+
+    # LIKE wildcards are matched literally.
+    assert references('reference_contains=page_') == ['http://yourwiki.com/page_1']
+
+    assert len(references('created_after=2000-01-01')) == 4
+    assert references('created_after=3000-01-01') == []
+
+
 def test_read_by_id(client):
     """ Ensure names can be read by their ID """
 
@@ -383,6 +412,97 @@ def test_read_indicators(client):
     assert response['items'][0]['value'] == '127.0.0.1'
 
 
+def test_read_indicators_bulk(client):
+    """ Ensure the indicators associated with this reference can be read in bulk with only the requested fields """
+
+    for i in range(3):
+        create_indicator(client, 'IP', '127.0.0.{}'.format(i), 'analyst', intel_reference='http://blahblah.com',
+                         intel_source='OSINT')
+    create_indicator(client, 'IP', '127.0.0.9', 'analyst', intel_reference='http://virustotal.com',
+                     intel_source='VirusTotal')
+
+    _id = json.loads(client.get('/api/intel/reference?per_page=1').data.decode())['items'][0]['id']
+
+    request = client.get('/api/intel/reference/{}/indicators?bulk=true'.format(_id))
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert [sorted(i.keys()) for i in response] == [['id', 'type', 'value']] * 3
+    assert [i['value'] for i in response] == ['127.0.0.0', '127.0.0.1', '127.0.0.2']
+
+    request = client.get('/api/intel/reference/{}/indicators?bulk=true&fields=value,status,user'.format(_id))
+    response = json.loads(request.data.decode())
+    assert response[0] == {'status': 'New', 'user': 'analyst', 'value': '127.0.0.0'}
+
+    request = client.get('/api/intel/reference/{}/indicators?bulk=true&fields=value,asdf'.format(_id))
+    response = json.loads(request.data.decode())
+    assert request.status_code == 400
+    assert response['msg'] == 'Invalid field: asdf'
+
+
+def test_read_indicators_stream(client):
+    """ Ensure the indicators associated with this reference can be streamed as NDJSON """
+
+    for i in range(3):
+        create_indicator(client, 'IP', '127.0.0.{}'.format(i), 'analyst', intel_reference='http://blahblah.com',
+                         intel_source='OSINT')
+
+    _id = json.loads(client.get('/api/intel/reference').data.decode())['items'][0]['id']
+
+    request = client.get('/api/intel/reference/{}/indicators?stream=true&fields=id,value'.format(_id))
+    assert request.status_code == 200
+    assert request.mimetype == 'application/x-ndjson'
+    lines = request.data.decode().splitlines()
+    assert [json.loads(line)['value'] for line in lines] == ['127.0.0.0', '127.0.0.1', '127.0.0.2']
+
+
+def test_read_indicators_bulk_stream_types(client):
+    """ Ensure bulk and stream rows give the same booleans and timestamps as the indicator itself """
+
+    create_indicator(client, 'IP', '127.0.0.1', 'analyst', case_sensitive=True, intel_reference='http://blahblah.com',
+                     intel_source='OSINT')
+
+    _id = json.loads(client.get('/api/intel/reference').data.decode())['items'][0]['id']
+    indicator = json.loads(client.get('/api/indicators?value=127.0.0.1').data.decode())['items'][0]
+    expected = dict((field, indicator[field]) for field in ('case_sensitive', 'created_time', 'id', 'modified_time',
+                                                            'substring'))
+    assert expected['case_sensitive'] is True
+    assert expected['substring'] is False
+
+    fields = 'id,created_time,modified_time,case_sensitive,substring'
+    request = client.get('/api/intel/reference/{}/indicators?bulk=true&fields={}'.format(_id, fields))
+    assert request.status_code == 200
+    assert json.loads(request.data.decode()) == [expected]
+
+    request = client.get('/api/intel/reference/{}/indicators?stream=true&fields={}'.format(_id, fields))
+    assert request.status_code == 200
+    assert [json.loads(line) for line in request.data.decode().splitlines()] == [expected]
+
+
+def test_read_query_budget(client, query_budget):
+    """ Ensure reading intel references stays within its SQL statement budget """
+
+    for i in range(5):
+        create_intel_reference(client, 'analyst', 'OSINT{}'.format(i), 'http://blahblah{}.com'.format(i))
+
+    # Page and count queries with the sources and users joined.
+    with query_budget(2):
+        request = client.get('/api/intel/reference')
+    assert request.status_code == 200
+
+
+def test_read_eager_loading(client):
+    """ Ensure reading intel references does not lazy load the source and user of each reference """
+
+    for i in range(5):
+        username = 'admin' if i % 2 else 'analyst'
+        create_intel_reference(client, username, 'OSINT{}'.format(i), 'http://blahblah{}.com'.format(i))
+
+    with QueryCounter() as counter:
+        request = client.get('/api/intel/reference')
+    assert request.status_code == 200
+    assert counter.repeated() == []
+
+
 """
 UPDATE TESTS
 """
@@ -590,6 +710,67 @@ def test_update(client):
     assert response['reference'] == 'asdf2'
 
 
+def test_update_source_counts(client):
+    """ Ensure moving a reference to another source updates the source facet counts and saved searches """
+
+    create_indicator(client, 'IP', '127.0.0.1', 'analyst', intel_reference='http://blahblah.com',
+                     intel_source='OSINT')
+    create_indicator(client, 'IP', '127.0.0.2', 'analyst', intel_reference='http://virustotal.com',
+                     intel_source='VirusTotal')
+    data = {'type': 'IP', 'username': 'analyst', 'value': '127.0.0.3',
+            'references': [{'source': 'OSINT', 'reference': 'http://blahblah.com'},
+                           {'source': 'VirusTotal', 'reference': 'http://virustotal.com'}]}
+    request = client.post('/api/indicators', json=data)
+    assert request.status_code == 201
+
+    request, response = create_saved_search(client, 'osint', {'sources': 'OSINT'})
+    assert request.status_code == 201
+    request = client.get('/api/searches/osint/results')
+    response = json.loads(request.data.decode())
+    assert [item['value'] for item in response['items']] == ['127.0.0.1', '127.0.0.3']
+
+    request = client.get('/api/indicators/facets?facets=source')
+    response = json.loads(request.data.decode())
+    assert response['facets']['source'] == {'OSINT': 2, 'VirusTotal': 2}
+
+    _id = json.loads(client.get('/api/intel/reference?reference=http://blahblah.com').data.decode())['items'][0]['id']
+    request = client.put('/api/intel/reference/{}'.format(_id), json={'source': 'VirusTotal'})
+    assert request.status_code == 200
+
+    # 127.0.0.3 already had a VirusTotal reference, so only 127.0.0.1 is added to its count.
+    request = client.get('/api/indicators/facets?facets=source')
+    response = json.loads(request.data.decode())
+    assert response['_meta']['total_items'] == 3
+    assert response['facets']['source'] == {'VirusTotal': 3}
+
+    request = client.get('/api/searches/osint/results')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert response['items'] == []
+
+
+def test_update_user_saved_searches(client):
+    """ Ensure changing the user of a reference expires the saved searches that filter on the user """
+
+    create_indicator(client, 'IP', '127.0.0.1', 'analyst', intel_reference='http://blahblah.com',
+                     intel_source='OSINT')
+
+    request, response = create_saved_search(client, 'admin', {'user': 'admin'})
+    assert request.status_code == 201
+    request = client.get('/api/searches/admin/results')
+    response = json.loads(request.data.decode())
+    assert response['items'] == []
+
+    _id = json.loads(client.get('/api/intel/reference?reference=http://blahblah.com').data.decode())['items'][0]['id']
+    request = client.put('/api/intel/reference/{}'.format(_id), json={'username': 'admin'})
+    assert request.status_code == 200
+
+    request = client.get('/api/searches/admin/results')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert [item['value'] for item in response['items']] == ['127.0.0.1']
+
+
 """
 DELETE TESTS
 """
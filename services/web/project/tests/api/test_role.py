@@ -215,7 +215,7 @@ def test_read_all_values(client):
     request = client.get('/api/roles')
     response = json.loads(request.data.decode())
     assert request.status_code == 200
-    assert len(response) == 2
+    assert len(response['items']) == 2
 
 
 def test_read_by_id(client):
@@ -0,0 +1,363 @@
+from project.tests.conftest import TEST_ANALYST_APIKEY, TEST_INACTIVE_APIKEY, TEST_INVALID_APIKEY
+from project.tests.helpers import *
+
+
+"""
+CREATE TESTS
+"""
+
+
+def test_create_schema(client):
+    """ Ensure POST requests conform to the required JSON schema """
+
+    # Invalid JSON
+    data = {}
+    request = client.post('/api/searches', json=data)
+    response = json.loads(request.data.decode())
+    assert request.status_code == 400
+    assert response['msg'] == 'Request must include valid JSON'
+
+    # Missing required name parameter
+    data = {'filters': {}}
+    request = client.post('/api/searches', json=data)
+    response = json.loads(request.data.decode())
+    assert request.status_code == 400
+    assert response['msg'] == "Request JSON does not match schema: 'name' is a required property"
+
+    # Missing required filters parameter
+    data = {'name': 'asdf'}
+    request = client.post('/api/searches', json=data)
+    response = json.loads(request.data.decode())
+    assert request.status_code == 400
+    assert response['msg'] == "Request JSON does not match schema: 'filters' is a required property"
+
+    # Additional parameter
+    data = {'name': 'asdf', 'filters': {}, 'asdf': 'asdf'}
+    request = client.post('/api/searches', json=data)
+    response = json.loads(request.data.decode())
+    assert request.status_code == 400
+    assert 'Additional properties are not allowed' in response['msg']
+
+    # Unknown filter
+    data = {'name': 'asdf', 'filters': {'asdf': 'asdf'}}
+    request = client.post('/api/searches', json=data)
+    response = json.loads(request.data.decode())
+    assert request.status_code == 400
+    assert 'Additional properties are not allowed' in response['msg']
+
+    # name parameter too long
+    data = {'name': 'a' * 256, 'filters': {}}
+    request = client.post('/api/searches', json=data)
+    response = json.loads(request.data.decode())
+    assert request.status_code == 400
+    assert 'too long' in response['msg']
+
+
+def test_create_duplicate(client):
+    """ Ensure a duplicate record cannot be created """
+
+    request, response = create_saved_search(client, 'asdf', {'tags': 'phish'})
+    assert request.status_code == 201
+
+    request, response = create_saved_search(client, 'asdf', {'tags': 'phish'})
+    assert request.status_code == 409
+    assert response['msg'] == 'Saved search already exists'
+
+
+def test_create_missing_api_key(app, client):
+    """ Ensure an API key is given if the config requires it """
+
+    app.config['POST'] = 'analyst'
+
+    request = client.post('/api/searches')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 401
+    assert response['msg'] == 'Bad or missing API key'
+
+
+def test_create_invalid_api_key(app, client):
+    """ Ensure an API key not found in the database does not work """
+
+    app.config['POST'] = 'analyst'
+
+    headers = {'Authorization': 'Apikey ' + TEST_INVALID_APIKEY}
+    request = client.post('/api/searches', headers=headers)
+    response = json.loads(request.data.decode())
+    assert request.status_code == 401
+    assert response['msg'] == 'API user does not exist'
+
+
+def test_create_inactive_api_key(app, client):
+    """ Ensure an inactive API key does not work """
+
+    app.config['POST'] = 'analyst'
+
+    headers = {'Authorization': 'Apikey ' + TEST_INACTIVE_APIKEY}
+    request = client.post('/api/searches', headers=headers)
+    response = json.loads(request.data.decode())
+    assert request.status_code == 401
+    assert response['msg'] == 'API user is not active'
+
+
+def test_create(client):
+    """ Ensure a proper request actually works and the filters are normalized """
+
+    request, response = create_saved_search(client, 'asdf', {'tags': 'phish,evil,phish,', 'type': ' URI - URL '})
+    assert request.status_code == 201
+    assert response['name'] == 'asdf'
+    assert response['filters'] == {'tags': 'evil,phish', 'type': 'URI - URL'}
+    assert response['refreshed_time']
+
+
+"""
+READ TESTS
+"""
+
+
+def test_read_nonexistent_name(client):
+    """ Ensure a nonexistent name does not work """
+
+    request = client.get('/api/searches/asdf')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 404
+    assert response['msg'] == 'Saved search not found'
+
+    request = client.get('/api/searches/asdf/results')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 404
+    assert response['msg'] == 'Saved search not found'
+
+
+def test_read_all_values(client):
+    """ Ensure all the saved searches can be queried """
+
+    create_saved_search(client, 'asdf', {'tags': 'phish'})
+    create_saved_search(client, 'qwerty', {'type': 'IP'})
+
+    request = client.get('/api/searches')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert len(response) == 2
+    assert sorted([item['name'] for item in response]) == ['asdf', 'qwerty']
+
+
+def test_read_by_name(client):
+    """ Ensure saved searches can be queried by name """
+
+    create_saved_search(client, 'asdf', {'tags': 'phish'})
+
+    request = client.get('/api/searches/asdf')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert response['name'] == 'asdf'
+    assert response['filters'] == {'tags': 'phish'}
+
+
+def test_read_results(client):
+    """ Ensure the results match the same filters as read_indicators """
+
+    create_indicator(client, 'IP', '127.0.0.1', 'analyst', tags=['phish'])
+    create_indicator(client, 'IP', '127.0.0.2', 'analyst', tags=['phish', 'evil'])
+    create_indicator(client, 'URI - URL', 'http://127.0.0.1', 'analyst', tags=['phish'])
+
+    create_saved_search(client, 'asdf', {'tags': 'phish', 'type': 'IP'})
+
+    request = client.get('/api/searches/asdf/results')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert response['_meta']['total_items'] == 2
+    assert [item['value'] for item in response['items']] == ['127.0.0.1', '127.0.0.2']
+
+    indicators = client.get('/api/indicators?tags=phish&type=IP')
+    indicators = json.loads(indicators.data.decode())
+    assert [item['id'] for item in response['items']] == [item['id'] for item in indicators['items']]
+
+    # Sorted and paginated like read_indicators
+    request = client.get('/api/searches/asdf/results?sort=-id&per_page=1')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert response['_meta']['total_pages'] == 2
+    assert response['items'][0]['value'] == '127.0.0.2'
+
+    request = client.get('/api/searches/asdf/results?sort=asdf')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 400
+    assert response['msg'] == 'Invalid sort: asdf'
+
+
+def test_read_results_incremental(client):
+    """ Ensure indicator writes keep the result set up to date """
+
+    create_saved_search(client, 'asdf', {'status': 'Analyzed'})
+
+    request = client.get('/api/searches/asdf/results')
+    response = json.loads(request.data.decode())
+    assert response['_meta']['total_items'] == 0
+
+    # New indicators that match are added.
+    create_indicator(client, 'IP', '127.0.0.1', 'analyst', status='Analyzed')
+    indicator_request, indicator_response = create_indicator(client, 'IP', '127.0.0.2', 'analyst')
+    request = client.get('/api/searches/asdf/results')
+    response = json.loads(request.data.decode())
+    assert response['_meta']['total_items'] == 1
+    assert response['items'][0]['value'] == '127.0.0.1'
+
+    # Updated indicators that now match are added.
+    client.put('/api/indicators/{}'.format(indicator_response['id']), json={'status': 'Analyzed'})
+    request = client.get('/api/searches/asdf/results')
+    response = json.loads(request.data.decode())
+    assert response['_meta']['total_items'] == 2
+
+    # Updated indicators that no longer match are removed.
+    create_indicator_status(client, 'Deprecated')
+    client.put('/api/indicators/{}'.format(indicator_response['id']), json={'status': 'Deprecated'})
+    request = client.get('/api/searches/asdf/results')
+    response = json.loads(request.data.decode())
+    assert response['_meta']['total_items'] == 1
+    assert response['items'][0]['value'] == '127.0.0.1'
+
+
+def test_read_results_prefilter(client):
+    """ Ensure indicator writes skip the saved searches they cannot match """
+
+    create_saved_search(client, 'asdf', {'status': 'Analyzed'})
+    create_indicator_status(client, 'Analyzed')
+
+    # An indicator with another status does not re-evaluate the saved search.
+    with QueryCounter() as counter:
+        indicator_request, indicator_response = create_indicator(client, 'IP', '127.0.0.1', 'analyst')
+    assert not [s for s in counter.statements if s.startswith('INSERT INTO saved_search_result_mapping')]
+
+    # It is still added once it is updated to match.
+    client.put('/api/indicators/{}'.format(indicator_response['id']), json={'status': 'Analyzed'})
+    request = client.get('/api/searches/asdf/results')
+    response = json.loads(request.data.decode())
+    assert response['_meta']['total_items'] == 1
+    assert response['items'][0]['value'] == '127.0.0.1'
+
+
+def test_read_results_prefilter_collation(client):
+    """ Ensure the prefilters do not rule out indicators that only match under the collation """
+
+    create_saved_search(client, 'asdf', {'tags': 'café'})
+
+    create_indicator(client, 'IP', '127.0.0.1', 'analyst', tags=['cafe'])
+    request = client.get('/api/searches/asdf/results')
+    response = json.loads(request.data.decode())
+    assert response['_meta']['total_items'] == 1
+    assert response['items'][0]['value'] == '127.0.0.1'
+
+
+def test_read_results_stale(app, client, monkeypatch):
+    """ Ensure a stale result set is rebuilt when it is read """
+
+    create_indicator(client, 'IP', '127.0.0.1', 'analyst', intel_reference='http://blahblah.com', intel_source='asdf')
+    create_saved_search(client, 'asdf', {'sources': 'OSINT'})
+
+    # Renaming the intel source is not an indicator write, so it is only picked up by a rebuild.
+    request = client.get('/api/intel/source')
+    source_id = json.loads(request.data.decode())['items'][0]['id']
+    client.put('/api/intel/source/{}'.format(source_id), json={'value': 'OSINT'})
+
+    request = client.get('/api/searches/asdf/results')
+    response = json.loads(request.data.decode())
+    assert response['_meta']['total_items'] == 0
+
+    monkeypatch.setitem(app.config, 'SAVED_SEARCH_REFRESH_INTERVAL', 0)
+    request = client.get('/api/searches/asdf/results')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert response['_meta']['total_items'] == 1
+
+
+"""
+UPDATE TESTS
+"""
+
+
+def test_update_nonexistent_name(client):
+    """ Ensure a nonexistent name does not work """
+
+    data = {'name': 'qwerty'}
+    request = client.put('/api/searches/asdf', json=data)
+    response = json.loads(request.data.decode())
+    assert request.status_code == 404
+    assert response['msg'] == 'Saved search not found'
+
+
+def test_update_schema(client):
+    """ Ensure PUT requests conform to the required JSON schema """
+
+    create_saved_search(client, 'asdf', {'tags': 'phish'})
+
+    # Additional parameter
+    data = {'asdf': 'asdf'}
+    request = client.put('/api/searches/asdf', json=data)
+    response = json.loads(request.data.decode())
+    assert request.status_code == 400
+    assert 'Additional properties are not allowed' in response['msg']
+
+
+def test_update_duplicate(client):
+    """ Ensure a saved search cannot be renamed to an existing name """
+
+    create_saved_search(client, 'asdf', {'tags': 'phish'})
+    create_saved_search(client, 'qwerty', {'tags': 'phish'})
+
+    data = {'name': 'qwerty'}
+    request = client.put('/api/searches/asdf', json=data)
+    response = json.loads(request.data.decode())
+    assert request.status_code == 409
+    assert response['msg'] == 'Saved search already exists'
+
+
+def test_update(client):
+    """ Ensure a proper request actually works and rebuilds the result set """
+
+    create_indicator(client, 'IP', '127.0.0.1', 'analyst', tags=['phish'])
+    create_indicator(client, 'IP', '127.0.0.2', 'analyst', tags=['evil'])
+    create_saved_search(client, 'asdf', {'tags': 'phish'})
+
+    data = {'name': 'qwerty', 'filters': {'tags': 'evil'}}
+    request = client.put('/api/searches/asdf', json=data)
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert response['name'] == 'qwerty'
+    assert response['filters'] == {'tags': 'evil'}
+
+    request = client.get('/api/searches/qwerty/results')
+    response = json.loads(request.data.decode())
+    assert response['_meta']['total_items'] == 1
+    assert response['items'][0]['value'] == '127.0.0.2'
+
+
+"""
+DELETE TESTS
+"""
+
+
+def test_delete_nonexistent_name(client):
+    """ Ensure a nonexistent name does not work """
+
+    request = client.delete('/api/searches/asdf')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 404
+    assert response['msg'] == 'Saved search not found'
+
+
+def test_delete(client):
+    """ Ensure a proper request actually works """
+
+    create_indicator(client, 'IP', '127.0.0.1', 'analyst', tags=['phish'])
+    create_saved_search(client, 'asdf', {'tags': 'phish'})
+
+    request = client.delete('/api/searches/asdf')
+    assert request.status_code == 204
+
+    request = client.get('/api/searches/asdf')
+    assert request.status_code == 404
+
+    # Indicators are not deleted along with the saved search.
+    request = client.get('/api/indicators')
+    response = json.loads(request.data.decode())
+    assert response['_meta']['total_items'] == 1
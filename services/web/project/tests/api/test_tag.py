@@ -1,3 +1,4 @@
+from project.models import TableVersion
 from project.tests.conftest import TEST_ANALYST_APIKEY, TEST_INACTIVE_APIKEY, TEST_INVALID_APIKEY
 from project.tests.helpers import *
 
@@ -201,7 +202,51 @@ def test_read_all_values(client):
     request = client.get('/api/tags')
     response = json.loads(request.data.decode())
     assert request.status_code == 200
-    assert len(response) == 3
+    assert len(response['items']) == 3
+
+
+def test_read_all_filters(client):
+    """ Ensure tags can be filtered by a value prefix and paginated with a cursor """
+
+    for value in ['mal', 'malware', 'mal_doc', 'phish', 'mal%']:
+        create_tag(client, value)
+
+    request = client.get('/api/tags?value=mal')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert response['_meta']['total_items'] == 4
+
+    # LIKE wildcards are matched literally.
+    request = client.get('/api/tags?value=mal%25')
+    response = json.loads(request.data.decode())
+    assert [t['value'] for t in response['items']] == ['mal%']
+
+    request = client.get('/api/tags?value=mal&sort=-value&per_page=3&cursor=')
+    response = json.loads(request.data.decode())
+    assert [t['value'] for t in response['items']] == ['malware', 'mal_doc', 'mal%']
+
+    request = client.get(response['_links']['next'])
+    response = json.loads(request.data.decode())
+    assert [t['value'] for t in response['items']] == ['mal']
+    assert response['_meta']['next_cursor'] is None
+
+    request = client.get('/api/tags?sort=asdf')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 400
+    assert response['msg'] == 'Invalid sort: asdf'
+
+
+def test_read_all_legacy(client):
+    """ Ensure the legacy flag returns the unpaginated list """
+
+    create_tag(client, 'asdf')
+    create_tag(client, 'asdf2')
+    create_tag(client, 'qwer')
+
+    request = client.get('/api/tags?legacy=true&value=asdf')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert sorted(t['value'] for t in response) == ['asdf', 'asdf2']
 
 
 def test_read_by_id(client):
@@ -220,6 +265,96 @@ def test_read_by_id(client):
     assert response['value'] == 'asdf'
 
 
+def test_read_indicators(client):
+    """ Ensure a tag's indicators and their count can be read """
+
+    create_indicator(client, 'IP', '127.0.0.1', 'analyst', tags=['phish'])
+    create_indicator(client, 'IP', '127.0.0.2', 'analyst', tags=['phish', 'nanocore'])
+    create_indicator(client, 'IP', '127.0.0.3', 'analyst', tags=['nanocore'])
+
+    _id = json.loads(client.get('/api/tags?value=phish').data.decode())['items'][0]['id']
+
+    request = client.get('/api/tags/{}/indicators?sort=-id&per_page=1'.format(_id))
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert [i['value'] for i in response['items']] == ['127.0.0.2']
+    assert response['_meta']['total_items'] == 2
+
+    request = client.get('/api/tags/{}/indicators?bulk=true'.format(_id))
+    response = json.loads(request.data.decode())
+    assert [i['value'] for i in response] == ['127.0.0.1', '127.0.0.2']
+
+    request = client.get('/api/tags/{}/indicators/count'.format(_id))
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert response['count'] == 2
+
+    request = client.get('/api/tags/100000/indicators/count')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 404
+    assert response['msg'] == 'Tag ID not found'
+
+
+def test_read_query_budget(app, client, query_budget):
+    """ Ensure reading tags stays within its SQL statement budget """
+
+    for i in range(5):
+        create_tag(client, 'asdf{}'.format(i))
+
+    # The first request caches the API key and the response, so the next one only checks the table version.
+    app.config['GET'] = 'analyst'
+    headers = create_auth_header(TEST_ANALYST_APIKEY)
+    request = client.get('/api/tags', headers=headers)
+    assert request.status_code == 200
+
+    with query_budget(1):
+        request = client.get('/api/tags', headers=headers)
+    assert request.status_code == 200
+
+
+def test_read_all_etag(client):
+    """ Ensure the tag listing is revalidated with its ETag until a tag is written """
+
+    create_tag(client, 'asdf')
+
+    request = client.get('/api/tags')
+    assert request.status_code == 200
+    etag = request.headers['ETag']
+    assert etag.startswith('W/')
+    assert 'must-revalidate' in request.headers['Cache-Control']
+
+    request = client.get('/api/tags', headers={'If-None-Match': etag})
+    assert request.status_code == 304
+    assert request.data == b''
+
+    # Different query strings are cached separately.
+    request = client.get('/api/tags?value=asdf', headers={'If-None-Match': etag})
+    assert request.status_code == 200
+
+    create_tag(client, 'asdf2')
+
+    request = client.get('/api/tags', headers={'If-None-Match': etag})
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert request.headers['ETag'] != etag
+    assert len(response) == 2
+
+
+def test_read_all_etag_indicator_writes(client):
+    """ Ensure writing an indicator with existing tags leaves the tag listing's ETag alone """
+
+    create_indicator(client, 'IP', '127.0.0.1', 'analyst', tags=['asdf'])
+
+    request = client.get('/api/tags')
+    etag = request.headers['ETag']
+
+    # Only the tables that cached routes depend on are versioned.
+    create_indicator(client, 'IP', '127.0.0.2', 'analyst', tags=['asdf'])
+    request = client.get('/api/tags', headers={'If-None-Match': etag})
+    assert request.status_code == 304
+    assert TableVersion.versions(['indicator'])['indicator'] == 0
+
+
 """
 UPDATE TESTS
 """
@@ -1,3 +1,4 @@
+from project import apikeys
 from project.tests.conftest import TEST_ADMIN_APIKEY, TEST_ANALYST_APIKEY, TEST_INACTIVE_APIKEY, TEST_INVALID_APIKEY
 from project.tests.helpers import *
 
@@ -401,7 +402,21 @@ def test_read_all_values(client):
     request = client.get('/api/users')
     response = json.loads(request.data.decode())
     assert request.status_code == 200
-    assert len(response) == 3
+    assert len(response['items']) == 3
+
+
+def test_read_query_budget(client, query_budget):
+    """ Ensure reading users stays within its SQL statement budget """
+
+    # Count and page queries, then the roles of the whole page.
+    with query_budget(2 + 1):
+        request = client.get('/api/users')
+    assert request.status_code == 200
+
+    with QueryCounter() as counter:
+        request = client.get('/api/users?legacy=true')
+    assert request.status_code == 200
+    assert counter.repeated() == []
 
 
 def test_read_by_id(client):
@@ -772,6 +787,46 @@ def test_update(app, client):
     assert response['roles'] == ['admin', 'analyst']
 
 
+def test_update_apikey_cache(app, client):
+    """ Ensure an update takes effect even though the API key is cached """
+
+    admin_headers = create_auth_header(TEST_ADMIN_APIKEY)
+    analyst_headers = create_auth_header(TEST_ANALYST_APIKEY)
+
+    request = client.get('/api/users', headers=admin_headers)
+    response = json.loads(request.data.decode())
+    _id = [user['id'] for user in response['items'] if user['username'] == 'analyst'][0]
+
+    # The first request caches the analyst's API key.
+    app.config['GET'] = 'analyst'
+    request = client.get('/api/tags', headers=analyst_headers)
+    assert request.status_code == 200
+
+    data = {'active': False}
+    request = client.put('/api/users/{}'.format(_id), json=data, headers=admin_headers)
+    assert request.status_code == 200
+
+    request = client.get('/api/tags', headers=analyst_headers)
+    response = json.loads(request.data.decode())
+    assert request.status_code == 401
+    assert response['msg'] == 'API user is not active'
+
+
+def test_apikey_cache_bounded(app, client, monkeypatch):
+    """ Ensure the API key cache keeps only the most recently used keys and never caches unknown keys """
+
+    app.config['GET'] = 'analyst'
+    monkeypatch.setitem(app.config, 'APIKEY_CACHE_SIZE', 1)
+
+    request = client.get('/api/tags', headers=create_auth_header(TEST_INVALID_APIKEY))
+    assert request.status_code == 401
+    assert apikeys._apikey_cache == {}
+
+    for apikey in (TEST_ANALYST_APIKEY, TEST_ADMIN_APIKEY):
+        client.get('/api/tags', headers=create_auth_header(apikey))
+    assert list(apikeys._apikey_cache) == [TEST_ADMIN_APIKEY]
+
+
 """
 DELETE TESTS
 """
@@ -1,3 +1,4 @@
+import os
 import pytest
 
 from flask_security import SQLAlchemyUserDatastore
@@ -5,7 +6,11 @@ from flask_security.utils import hash_password
 
 from project import create_app
 from project import db as _db
+from project.api.caching import clear_table_cache
+from project.apikeys import invalidate_apikey_cache
+from project.helpers import parse_boolean
 from project.models import Role, User
+from project.tests.helpers import QueryCounter
 
 
 TEST_INACTIVE_APIKEY = '11111111-1111-1111-1111-111111111111'
@@ -90,6 +95,14 @@ def session(app, db):
     app.config['PUT'] = None
     app.config['DELETE'] = None
 
+    # Each test rolls back its users and roles, so nothing cached from a previous test can be trusted.
+    invalidate_apikey_cache()
+    clear_table_cache()
+
+    # Rate limits are only enabled by the tests that check them, and every test starts with empty buckets.
+    app.config['RATELIMIT_ENABLED'] = False
+    app.extensions.pop('ratelimit', None)
+
     connection = db.engine.connect()
     transaction = connection.begin()
 
@@ -103,3 +116,17 @@ def session(app, db):
     transaction.rollback()
     connection.close()
     _session.remove()
+
+
+@pytest.fixture(scope='function')
+def query_budget():
+    """ Returns a function that creates a QueryCounter with the given budget.
+
+    Budgets only issue warnings by default. Set ENFORCE_QUERY_BUDGETS=true to fail the tests that exceed them. """
+
+    enforce = parse_boolean(os.environ.get('ENFORCE_QUERY_BUDGETS'))
+
+    def _query_budget(budget):
+        return QueryCounter(budget=budget, enforce=enforce)
+
+    return _query_budget
@@ -1,4 +1,51 @@
 import json
+import warnings
+from collections import Counter
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryCounter(object):
+    """ Context manager that records every SQL statement executed while it is active.
+
+    If a budget is given and more statements than that are executed, the test fails when enforce is
+    True or issues a warning otherwise. The message lists any statement that ran more than once,
+    since those are usually lazy loads inside a loop (N+1 queries). """
+
+    def __init__(self, budget=None, enforce=False):
+        self.budget = budget
+        self.enforce = enforce
+        self.statements = []
+
+    def __enter__(self):
+        event.listen(Engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        event.remove(Engine, 'before_cursor_execute', self._record)
+
+        if exc_type is None and self.budget is not None and self.count > self.budget:
+            msg = 'Executed {} SQL statements, budget is {}'.format(self.count, self.budget)
+            repeated = self.repeated()
+            if repeated:
+                msg += '. Possible N+1 queries:\n' + '\n'.join('{}x {}'.format(count, statement)
+                                                               for statement, count in repeated)
+            if self.enforce:
+                raise AssertionError(msg)
+            warnings.warn(msg)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def repeated(self):
+        """ Returns a list of (statement, count) for the statements that were executed more than once. """
+
+        return [(statement, count) for statement, count in Counter(self.statements).most_common() if count > 1]
 
 
 def create_auth_header(apikey):
@@ -109,6 +156,13 @@ def create_role(client, apikey, role):
     return request, response
 
 
+def create_saved_search(client, name, filters):
+    data = {'name': name, 'filters': filters}
+    request = client.post('/api/searches', json=data)
+    response = json.loads(request.data.decode())
+    return request, response
+
+
 def create_tag(client, tag):
     data = {'value': tag}
     request = client.post('/api/tags', json=data)
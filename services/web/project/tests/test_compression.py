@@ -0,0 +1,51 @@
+import gzip
+import zlib
+
+from project.compression import negotiate
+from project.tests.helpers import *
+
+
+def test_negotiate():
+    """ Ensure the preferred encoding allowed by the Accept-Encoding header is chosen """
+
+    assert negotiate('') is None
+    assert negotiate('identity') is None
+    assert negotiate('gzip') == 'gzip'
+    assert negotiate('deflate') == 'deflate'
+    assert negotiate('deflate, gzip') == 'gzip'
+    assert negotiate('gzip;q=0, deflate') == 'deflate'
+    assert negotiate('*;q=0') is None
+    assert negotiate('asdf, *') in ('zstd', 'br', 'gzip')
+
+
+def test_compression(app, client, monkeypatch):
+    """ Ensure responses are compressed when the client accepts it and they are above the size threshold """
+
+    for i in range(50):
+        create_tag(client, 'asdf{}'.format(i))
+
+    # No Accept-Encoding header
+    request = client.get('/api/tags')
+    assert request.status_code == 200
+    assert 'Content-Encoding' not in request.headers
+    assert 'Accept-Encoding' in request.headers['Vary']
+    uncompressed = request.data
+
+    # gzip
+    request = client.get('/api/tags', headers={'Accept-Encoding': 'gzip'})
+    assert request.status_code == 200
+    assert request.headers['Content-Encoding'] == 'gzip'
+    assert int(request.headers['Content-Length']) == len(request.data)
+    assert gzip.decompress(request.data) == uncompressed
+
+    # deflate
+    request = client.get('/api/tags', headers={'Accept-Encoding': 'deflate'})
+    assert request.status_code == 200
+    assert request.headers['Content-Encoding'] == 'deflate'
+    assert zlib.decompress(request.data) == uncompressed
+
+    # Below the size threshold
+    monkeypatch.setitem(app.config, 'COMPRESS_MIN_SIZE', len(uncompressed) + 1)
+    request = client.get('/api/tags', headers={'Accept-Encoding': 'gzip'})
+    assert request.status_code == 200
+    assert 'Content-Encoding' not in request.headers
@@ -0,0 +1,388 @@
+import io
+
+import pytest
+
+from project.importers import crits
+from project.importers.delimited import CsvParser, TsvParser
+from project.importers.jsonstream import iter_array
+from project.importers.plugins import PARSERS, import_file
+from project.importers.stix import StixParser, pattern_comparisons
+from project.models import Campaign, CampaignAlias, ImportCheckpoint, Indicator, IntelReference, User, \
+    indicator_value_hash
+from project.tests.helpers import *
+
+
+def crits_indicator(_type, value, analyst='analyst', campaigns=[], tags=[], references=[]):
+    return {'_id': {'$oid': value},
+            'bucket_list': tags,
+            'campaign': [{'name': c} for c in campaigns],
+            'confidence': {'rating': 'low'},
+            'created': {'$date': '2019-03-01T18:00:51.000Z'},
+            'impact': {'rating': 'low'},
+            'modified': {'$date': '2019-03-02T18:00:51.000Z'},
+            'source': [{'name': 'OSINT', 'instances': [{'analyst': analyst, 'reference': r} for r in references]}],
+            'status': 'New',
+            'type': _type,
+            'value': value}
+
+
+def crits_campaign(name, aliases=[]):
+    return {'_id': {'$oid': name},
+            'aliases': aliases,
+            'created': {'$date': '2019-03-01T18:00:51.000Z'},
+            'modified': {'$date': '2019-03-02T18:00:51.000Z'},
+            'name': name}
+
+
+def write_lines(tmp_path, name, items):
+    path = tmp_path / name
+    path.write_text('\n'.join(json.dumps(i) if isinstance(i, dict) else i for i in items) + '\n')
+    return str(path)
+
+
+def test_iter_array():
+    """ Ensure JSON arrays are decoded one item at a time no matter where the reads split them """
+
+    items = [{'name': 'asdf' * i, 'aliases': ['a', 'b']} for i in range(50)] + [12345, 'asdf', [], {}, None]
+    for text in (json.dumps(items), json.dumps(items, indent=4)):
+        for read_size in (1, 7, 65536):
+            assert list(iter_array(io.StringIO(text), read_size=read_size)) == items
+
+    assert list(iter_array(io.StringIO(' [ ] '))) == []
+
+    for text in ('', '{}', '[1, 2', '[1 2]', '[{"name": '):
+        with pytest.raises(ValueError):
+            list(iter_array(io.StringIO(text), read_size=3))
+
+
+def test_parse_crits_indicator():
+    """ Ensure a CRITS indicator is normalized into an indicator record """
+
+    line = json.dumps(crits_indicator('IP', '127.0.0.1', campaigns=['LOLcats'], tags=['b', 'a', 'b'],
+                                      references=['http://one', 'http://one', 'http://two']))
+    record = crits.parse_indicator(line)
+    assert record['type'] == 'IP'
+    assert record['value'] == '127.0.0.1'
+    assert record['username'] == 'analyst'
+    assert record['confidence'] == 'low'
+    assert record['campaigns'] == ['LOLcats']
+    assert record['tags'] == ['a', 'b']
+    assert record['references'] == [('OSINT', 'http://one'), ('OSINT', 'http://two')]
+    assert record['created_time'].isoformat() == '2019-03-01T18:00:51'
+    assert record['created_time'].tzinfo is None
+
+
+def test_import_crits_indicators(app, client, tmp_path):
+    """ Ensure the CRITS indicators are imported in batches with their lookup values """
+
+    create_campaign(client, 'LOLcats', aliases=['Cats'])
+
+    path = write_lines(tmp_path, 'indicators.json', [
+        crits_indicator('IP', '127.0.0.1', campaigns=['Cats'], tags=['phish'], references=['http://one']),
+        crits_indicator('IP', '127.0.0.2', analyst='newanalyst', tags=['phish', 'malware'], references=['http://one']),
+        crits_indicator('URI - Domain Name', 'Example.com', campaigns=['Derpsters']),
+        crits_indicator('URI - Domain Name', 'example.com'),
+        '{"not": "an indicator"}',
+        'asdf',
+        crits_indicator('IP', '127.0.0.3'),
+    ])
+
+    stats = crits.import_indicators(path, batch_size=2)
+    assert stats.read == 7
+    assert stats.imported == 4
+    assert stats.merged == 0
+    assert stats.duplicates == 1
+    assert stats.failed == 2
+
+    assert Indicator.query.count() == 4
+
+    indicator = Indicator.query.filter_by(value='127.0.0.1').first()
+    assert indicator.type.value == 'IP'
+    assert indicator.confidence.value == 'low'
+    assert indicator.user.username == 'analyst'
+    assert indicator.created_time.isoformat() == '2019-03-01T18:00:51'
+    assert [c.name for c in indicator.campaigns] == ['LOLcats']
+    assert [t.value for t in indicator.tags] == ['phish']
+    assert [r.reference for r in indicator.references] == ['http://one']
+
+    # The new user is inactive, and both indicators share the same reference.
+    user = User.query.filter_by(username='newanalyst').first()
+    assert user.active is False
+    assert IntelReference.query.filter_by(reference='http://one').count() == 1
+
+    # Unknown campaigns are created.
+    assert Campaign.query.filter_by(name='Derpsters').count() == 1
+
+    # The facet counts are rebuilt.
+    request = client.get('/api/indicators/facets?facets=tag')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 200
+    assert response['facets']['tag'] == {'malware': 1, 'phish': 2}
+
+
+def test_import_crits_indicators_workers(app, client, tmp_path, monkeypatch):
+    """ Ensure parsing in worker processes gives the same result as a serial import """
+
+    monkeypatch.setattr(crits, 'PARSE_CHUNK_SIZE', 3)
+
+    items = [crits_indicator('IP', '127.0.0.{}'.format(i), tags=['tag{}'.format(i % 3)]) for i in range(20)]
+    items[5] = 'asdf'
+    items[12] = crits_indicator('IP', '127.0.0.1', tags=['duplicate'])
+    path = write_lines(tmp_path, 'indicators.json', items)
+
+    stats = crits.import_indicators(path, batch_size=4, workers=2)
+    assert stats.read == 20
+    assert stats.imported == 18
+    assert stats.duplicates == 1
+    assert stats.failed == 1
+
+    # The first occurrence of a duplicate wins, like in a serial import.
+    indicator = Indicator.query.filter_by(value='127.0.0.1').first()
+    assert [t.value for t in indicator.tags] == ['tag1']
+
+
+def test_import_crits_indicators_merge(app, client, tmp_path):
+    """ Ensure indicators that already exist are merged instead of imported again """
+
+    create_indicator(client, 'IP', '127.0.0.1', 'analyst', tags=['existing'])
+
+    path = write_lines(tmp_path, 'indicators.json', [
+        crits_indicator('IP', '127.0.0.1', tags=['phish']),
+        crits_indicator('IP', '127.0.0.2', tags=['phish']),
+    ])
+
+    stats = crits.import_indicators(path)
+    assert stats.imported == 1
+    assert stats.merged == 1
+
+    indicator = Indicator.query.filter_by(value='127.0.0.1').first()
+    assert sorted(t.value for t in indicator.tags) == ['existing', 'phish']
+
+    # Importing the same file again only merges.
+    stats = crits.import_indicators(path)
+    assert stats.imported == 0
+    assert stats.merged == 2
+    assert Indicator.query.count() == 2
+
+
+def test_import_crits_indicators_value_hash(app, client, tmp_path):
+    """ Ensure existing indicators are found with the value hash instead of comparing the values """
+
+    create_indicator(client, 'URI - Domain Name', 'Example.com', 'analyst')
+
+    path = write_lines(tmp_path, 'indicators.json', [
+        crits_indicator('URI - Domain Name', 'example.com'),
+        crits_indicator('URI - Domain Name', 'new.com'),
+    ])
+
+    with QueryCounter() as counter:
+        stats = crits.import_indicators(path)
+    assert stats.imported == 1
+    assert stats.merged == 1
+    assert not [s for s in counter.statements if 'indicator.value IN' in s]
+
+    indicator = Indicator.query.filter_by(value='new.com').first()
+    assert indicator.value_hash == indicator_value_hash('new.com')
+
+
+def test_import_crits_indicators_collation(app, client, tmp_path):
+    """ Ensure lookup values that are only equal to existing ones under the collation resolve to them """
+
+    create_tag(client, 'cafe')
+    create_tag(client, 'phish')
+    create_campaign(client, 'LOLcats')
+
+    path = write_lines(tmp_path, 'indicators.json', [
+        crits_indicator('IP', '127.0.0.1', campaigns=['lolcäts'], tags=['café', 'phish ']),
+    ])
+
+    stats = crits.import_indicators(path)
+    assert stats.imported == 1
+    assert stats.failed == 0
+
+    indicator = Indicator.query.filter_by(value='127.0.0.1').first()
+    assert sorted(t.value for t in indicator.tags) == ['cafe', 'phish']
+    assert [c.name for c in indicator.campaigns] == ['LOLcats']
+    assert Campaign.query.count() == 1
+
+
+def test_import_crits_indicators_checkpoints(app, client, tmp_path):
+    """ Ensure every committed batch records a checkpoint and a resumed import continues after the latest one """
+
+    items = [crits_indicator('IP', '127.0.0.{}'.format(i)) for i in range(1, 6)]
+    items[1] = 'asdf'
+    path = write_lines(tmp_path, 'indicators.json', items)
+
+    stats = crits.import_indicators(path, batch_size=2)
+    assert stats.imported == 4
+
+    checkpoints = ImportCheckpoint.query.filter_by(name=crits.INDICATORS_CHECKPOINT) \
+        .order_by(ImportCheckpoint.position).all()
+    assert [c.position for c in checkpoints] == [3, 5]
+    assert [(c.read, c.imported, c.failed) for c in checkpoints] == [(3, 2, 1), (2, 2, 0)]
+
+    # Pretend the import died after the first batch.
+    ImportCheckpoint.clear(crits.INDICATORS_CHECKPOINT)
+    ImportCheckpoint.record(crits.INDICATORS_CHECKPOINT, 3)
+
+    stats = crits.import_indicators(path, batch_size=2, resume=True)
+    assert stats.read == 2
+    assert stats.merged == 2
+    assert ImportCheckpoint.latest_position(crits.INDICATORS_CHECKPOINT) == 5
+
+    # Without resume the import starts over.
+    stats = crits.import_indicators(path, batch_size=2)
+    assert stats.read == 5
+    assert stats.merged == 4
+    assert Indicator.query.count() == 4
+
+
+def test_import_crits_campaigns(app, client, tmp_path):
+    """ Ensure the CRITS campaigns are streamed in batches without duplicates """
+
+    create_campaign(client, 'Existing', aliases=['Taken'])
+
+    path = tmp_path / 'campaigns.json'
+    path.write_text(json.dumps([
+        crits_campaign('LOLcats', aliases=['Cats', 'Kitties']),
+        crits_campaign('Existing', aliases=['Other']),
+        {'name': 'Invalid'},
+        crits_campaign('lolcats'),
+        crits_campaign('Derpsters', aliases=['Cats', 'Taken', 'Derps']),
+    ]))
+
+    stats = crits.import_campaigns(str(path), batch_size=2)
+    assert stats.read == 5
+    assert stats.imported == 2
+    assert stats.duplicates == 2
+    assert stats.failed == 1
+
+    campaign = Campaign.query.filter_by(name='LOLcats').first()
+    assert campaign.created_time.isoformat() == '2019-03-01T18:00:51'
+    assert sorted(a.alias for a in campaign.aliases) == ['Cats', 'Kitties']
+
+    # Aliases that are already taken are skipped.
+    campaign = Campaign.query.filter_by(name='Derpsters').first()
+    assert [a.alias for a in campaign.aliases] == ['Derps']
+    assert CampaignAlias.query.filter_by(alias='Other').count() == 0
+
+    assert [c.position for c in ImportCheckpoint.query.filter_by(name=crits.CAMPAIGNS_CHECKPOINT)
+            .order_by(ImportCheckpoint.position)] == [2, 5]
+
+    # Resuming after the last checkpoint has nothing left to import.
+    stats = crits.import_campaigns(str(path), resume=True)
+    assert stats.read == 0
+
+
+def test_import_plugins_registered(app):
+    """ Ensure the built-in parsers are registered as import commands """
+
+    assert set(PARSERS) >= {'csv', 'stix', 'tsv'}
+    assert set(app.cli.commands['import'].commands) >= {'csv', 'stix', 'tsv'}
+
+
+def test_import_csv(app, client, tmp_path):
+    """ Ensure CSV files are imported using the column map """
+
+    path = tmp_path / 'indicators.csv'
+    path.write_text('Type,Indicator,Tags,Source,Reference\n'
+                    'IP,127.0.0.1,"phish,malware",OSINT,http://one\n'
+                    '\n'
+                    'IP,127.0.0.2,,,\n'
+                    'IP\n'
+                    ',127.0.0.3,phish,,\n')
+
+    parser = CsvParser(columns='type=Type,value=Indicator,tags=Tags,source=Source,reference=Reference', header=True,
+                       constants=['status=Analyzed'])
+    stats = import_file(parser, str(path), username='analyst', tags=['csv'])
+    assert stats.read == 4
+    assert stats.imported == 2
+    assert stats.failed == 2
+
+    indicator = Indicator.query.filter_by(value='127.0.0.1').first()
+    assert indicator.type.value == 'IP'
+    assert indicator.status.value == 'Analyzed'
+    assert indicator.user.username == 'analyst'
+    assert sorted(t.value for t in indicator.tags) == ['csv', 'malware', 'phish']
+    assert [(r.source.value, r.reference) for r in indicator.references] == [('OSINT', 'http://one')]
+
+
+def test_import_tsv(app, client, tmp_path):
+    """ Ensure TSV files are imported using column indexes """
+
+    path = tmp_path / 'indicators.tsv'
+    path.write_text('http://example.com/a\tanalyst\n'
+                    'http://example.com/b\tadmin\n')
+
+    parser = TsvParser(columns='value=0,username=1', constants=['type=URI - URL'])
+    stats = import_file(parser, str(path))
+    assert stats.imported == 2
+    assert Indicator.query.filter_by(value='http://example.com/b').first().user.username == 'admin'
+
+    # Column names need a header row.
+    with pytest.raises(ValueError):
+        TsvParser(columns='value=Value')
+
+
+def test_stix_patterns():
+    """ Ensure STIX patterns of OR'd equality comparisons are split into their values """
+
+    assert pattern_comparisons("[ipv4-addr:value = '198.51.100.1']") == [('ipv4-addr:value', '198.51.100.1')]
+    assert pattern_comparisons("[file:hashes.'SHA-256' = 'abc' OR url:value = 'http://x/it\\'s']") == \
+        [('file:hashes.SHA-256', 'abc'), ('url:value', "http://x/it's")]
+
+    for pattern in ("[ipv4-addr:value = '1.1.1.1' AND domain-name:value = 'x.com']", "[file:size > 5]",
+                    "[ipv4-addr:value = '1.1.1.1'] FOLLOWEDBY [ipv4-addr:value = '2.2.2.2']"):
+        with pytest.raises(ValueError):
+            pattern_comparisons(pattern)
+
+
+def test_import_stix(app, client, tmp_path):
+    """ Ensure the indicators and observables of a STIX bundle are imported """
+
+    bundle = {'type': 'bundle', 'id': 'bundle--1', 'objects': [
+        {'type': 'campaign', 'id': 'campaign--1', 'name': 'LOLcats'},
+        {'type': 'indicator', 'id': 'indicator--1', 'created': '2019-03-01T18:00:51.000Z',
+         'modified': '2019-03-01T18:00:51.000Z', 'labels': ['malicious-activity'],
+         'pattern': "[ipv4-addr:value = '198.51.100.1' OR domain-name:value = 'example.com']",
+         'external_references': [{'source_name': 'OSINT', 'url': 'http://one'}]},
+        {'type': 'relationship', 'id': 'relationship--1', 'relationship_type': 'indicates',
+         'source_ref': 'indicator--1', 'target_ref': 'campaign--1'},
+        {'type': 'indicator', 'id': 'indicator--2', 'pattern': "[file:size > 5]"},
+        {'type': 'observed-data', 'id': 'observed-data--1',
+         'objects': {'0': {'type': 'file', 'hashes': {'MD5': 'd41d8cd98f00b204e9800998ecf8427e'}, 'name': 'a.exe'}}},
+        {'type': 'url', 'id': 'url--1', 'value': 'http://example.com/a'},
+    ]}
+    path = tmp_path / 'bundle.json'
+    path.write_text(json.dumps(bundle))
+
+    stats = import_file(StixParser(), str(path), username='analyst')
+    assert stats.imported == 4
+    assert stats.failed == 1
+
+    indicator = Indicator.query.filter_by(value='example.com').first()
+    assert indicator.type.value == 'URI - Domain Name'
+    assert indicator.created_time.isoformat() == '2019-03-01T18:00:51'
+    assert [c.name for c in indicator.campaigns] == ['LOLcats']
+    assert [t.value for t in indicator.tags] == ['malicious-activity']
+    assert [r.reference for r in indicator.references] == ['http://one']
+
+    assert Indicator.query.filter_by(value='d41d8cd98f00b204e9800998ecf8427e').first().type.value == 'Hash - MD5'
+    assert Indicator.query.filter_by(value='http://example.com/a').first().type.value == 'URI - URL'
+
+
+def test_import_command(app, client, tmp_path):
+    """ Ensure the import commands run the parsers with their options """
+
+    path = tmp_path / 'indicators.csv'
+    path.write_text('IP,127.0.0.1\n')
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['import', 'csv', str(path), '--columns', 'type=0,value=1', '--username', 'analyst'])
+    assert result.exit_code == 0
+    assert '1 imported' in result.output
+    assert Indicator.query.filter_by(value='127.0.0.1').count() == 1
+
+    result = runner.invoke(args=['import', 'csv', str(path), '--columns', 'asdf=0'])
+    assert result.exit_code == 2
+    assert 'Invalid column field: asdf' in result.output
@@ -0,0 +1,60 @@
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import exc
+
+from project import db
+from project.tests.helpers import *
+
+
+def test_metrics(client):
+    """ Ensure requests are recorded and exposed in the Prometheus text format """
+
+    create_tag(client, 'asdf')
+    request = client.get('/api/tags')
+    assert request.status_code == 200
+
+    request = client.get('/metrics')
+    response = request.data.decode()
+    assert request.status_code == 200
+    assert request.headers['Content-Type'].startswith('text/plain')
+    assert 'sip_request_duration_seconds_count{endpoint="/api/tags",method="GET",status="200"}' in response
+    assert 'sip_response_size_bytes_count{endpoint="/api/tags",method="GET",status="200"}' in response
+    assert 'sip_request_db_queries_count{endpoint="/api/tags",method="GET"}' in response
+    assert 'sip_request_db_duration_seconds_count{endpoint="/api/tags",method="GET"}' in response
+
+
+def test_metrics_allowed_networks(app, client, monkeypatch):
+    """ Ensure only the allowed networks can read the metrics """
+
+    monkeypatch.setitem(app.config, 'METRICS_ALLOWED_NETWORKS', ['10.0.0.0/8'])
+
+    request = client.get('/metrics')
+    response = json.loads(request.data.decode())
+    assert request.status_code == 403
+    assert response['msg'] == 'Address not allowed to read the metrics'
+
+    request = client.get('/metrics', headers={'X-Forwarded-For': '10.1.2.3'})
+    assert request.status_code == 200
+
+
+def test_metrics_compressed_size(client):
+    """ Ensure the response size is the compressed size that was sent """
+
+    for i in range(50):
+        create_tag(client, 'asdf{}'.format(i))
+
+    labels = {'endpoint': '/api/tags', 'method': 'GET', 'status': '200'}
+    before = REGISTRY.get_sample_value('sip_response_size_bytes_sum', labels) or 0
+
+    request = client.get('/api/tags', headers={'Accept-Encoding': 'gzip'})
+    assert request.headers['Content-Encoding'] == 'gzip'
+    assert REGISTRY.get_sample_value('sip_response_size_bytes_sum', labels) - before == len(request.data)
+
+
+def test_metrics_failed_query(client):
+    """ Ensure a failed SQL statement does not leave its start time behind on the connection """
+
+    connection = db.session.connection()
+    with pytest.raises(exc.DBAPIError):
+        connection.execute('SELECT * FROM asdf')
+    assert not connection.info.get('metrics_query_start')